@@ -14,7 +14,7 @@ import os
 from pathlib import Path
 
 import dj_database_url
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     'crispy_forms',
     'crispy_bootstrap5',
     'pos',
@@ -83,10 +84,21 @@ WSGI_APPLICATION = "Mini_Store_POS.wsgi.application"
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Database connections: seconds a thread keeps its connection open (0 = a new one per request) and
+# whether a kept connection is checked before reuse. DB_POOL_SIZE > 0 instead shares a pool of at most
+# that many PostgreSQL connections between a worker's threads, waiting up to DB_POOL_TIMEOUT seconds
+# for a free one and pinging connections idle for longer than DB_POOL_CHECK_SECONDS before reuse.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=0, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10.0, cast=float)
+DB_POOL_CHECK_SECONDS = config('DB_POOL_CHECK_SECONDS', default=30.0, cast=float)
+
 if DATABASE_URL:
     DATABASES = {
         'default': dj_database_url.config(
-            default=DATABASE_URL, conn_max_age=600, ssl_require=True
+            default=DATABASE_URL, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS,
+            ssl_require=True
         )
     }
 else:
@@ -98,9 +110,15 @@ else:
             'PASSWORD': 'han130602',
             'HOST': 'localhost',
             'PORT': '5432',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
         }
     }
 
+if DB_POOL_SIZE and 'postgresql' in DATABASES['default']['ENGINE']:
+    # Connections go back to the pool when Django closes them at the end of each request
+    DATABASES['default'].update(ENGINE='pos.pooled_postgresql', CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+
 
 
 # Password validation
@@ -153,4 +171,58 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Login/Logout URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Checkout retries: how long a client-supplied Idempotency-Key is remembered
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+
+# Offline sales: how far back a till's own sale time is trusted when its queue syncs
+OFFLINE_SALE_MAX_AGE_HOURS = config('OFFLINE_SALE_MAX_AGE_HOURS', default=72, cast=int)
+
+# Invoice numbers: ordered numbers handed to each worker in blocks
+INVOICE_NUMBER_ALLOCATOR = config('INVOICE_NUMBER_ALLOCATOR', default='pos.invoicing.BlockInvoiceNumberAllocator')
+INVOICE_NUMBER_BLOCK_SIZE = config('INVOICE_NUMBER_BLOCK_SIZE', default=100, cast=int)
+
+# Cart-time stock holds are released if the cart is idle this long
+STOCK_RESERVATION_TTL_MINUTES = config('STOCK_RESERVATION_TTL_MINUTES', default=15, cast=int)
+
+# Per-worker product caches: entries kept, and how often the shared catalog version is re-read
+BARCODE_CACHE_SIZE = config('BARCODE_CACHE_SIZE', default=5000, cast=int)
+DATA_VERSION_POLL_SECONDS = config('DATA_VERSION_POLL_SECONDS', default=2.0, cast=float)
+
+# Product search: most results returned for one query
+PRODUCT_SEARCH_LIMIT = config('PRODUCT_SEARCH_LIMIT', default=500, cast=int)
+
+# Autocomplete: suggestions per prefix, sales window used to rank them, full rebuild interval and trie size cap
+AUTOCOMPLETE_TOP_K = config('AUTOCOMPLETE_TOP_K', default=10, cast=int)
+AUTOCOMPLETE_VELOCITY_DAYS = config('AUTOCOMPLETE_VELOCITY_DAYS', default=30, cast=int)
+AUTOCOMPLETE_REBUILD_SECONDS = config('AUTOCOMPLETE_REBUILD_SECONDS', default=900, cast=int)
+AUTOCOMPLETE_MEMORY_MB = config('AUTOCOMPLETE_MEMORY_MB', default=128, cast=int)
+
+# Background report jobs: worker threads per process and where finished files are kept
+REPORT_WORKERS = config('REPORT_WORKERS', default=2, cast=int)
+REPORTS_DIR = config('REPORTS_DIR', default=str(MEDIA_ROOT / 'reports'))
+
+# Product performance report: how long a report covering today is reused before new sales are read
+PRODUCT_REPORT_TTL_SECONDS = config('PRODUCT_REPORT_TTL_SECONDS', default=300, cast=int)
+
+# Demand forecast: days of sales history, smoothing factor, worker processes for the forecast job
+FORECAST_HISTORY_DAYS = config('FORECAST_HISTORY_DAYS', default=90, cast=int)
+FORECAST_SMOOTHING = config('FORECAST_SMOOTHING', default=0.3, cast=float)
+FORECAST_WORKERS = config('FORECAST_WORKERS', default=1, cast=int)
+# Reorder suggestions: supplier lead time, days of demand an order covers, safety stock z-score (1.65 ~ 95%)
+REORDER_LEAD_TIME_DAYS = config('REORDER_LEAD_TIME_DAYS', default=3, cast=int)
+REORDER_COVER_DAYS = config('REORDER_COVER_DAYS', default=14, cast=int)
+REORDER_SERVICE_Z = config('REORDER_SERVICE_Z', default=1.65, cast=float)
+
+# Sales history storage: month partitions kept ready ahead of time (PostgreSQL), and when
+# months of sales, sale lines and stock movements move out to compressed files
+PARTITION_MONTHS_AHEAD = config('PARTITION_MONTHS_AHEAD', default=3, cast=int)
+ARCHIVE_AFTER_MONTHS = config('ARCHIVE_AFTER_MONTHS', default=24, cast=int)
+ARCHIVE_DIR = config('ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+
+# Admin dashboard: longest a worker waits for another worker to finish recomputing the metrics
+DASHBOARD_LOCK_SECONDS = config('DASHBOARD_LOCK_SECONDS', default=10, cast=int)
+
+# Low stock alerts: who the notify_low_stock command emails
+LOW_STOCK_ALERT_EMAILS = config('LOW_STOCK_ALERT_EMAILS', default='', cast=Csv())
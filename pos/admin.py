@@ -1,7 +1,11 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, Category, Product, Sale, SaleItem, StockMovement
+from . import rollups
+from .pagination import KeysetPaginator
+from .models import (UserProfile, Category, LowStockAlert, Product, ReorderSuggestion, Sale, SaleItem,
+                     SalesDailyRollup, StockMovement)
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -22,16 +26,72 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'price', 'stock_quantity', 'is_low_stock', 'is_active']
-    list_filter = ['category', 'is_active', 'created_at']
+    list_filter = ['category', 'is_active', 'is_low_stock', 'created_at']
     search_fields = ['name', 'barcode']
     readonly_fields = ['created_at', 'updated_at']
 
+class KeysetChangeList(ChangeList):
+    """Changelist paged by (created_at, id) instead of COUNT(*) and OFFSET"""
+
+    def get_results(self, request):
+        page = KeysetPaginator(self.queryset, self.list_per_page).page(getattr(request, 'keyset_cursor', None))
+        self.keyset_page = page
+        self.result_list = page.object_list
+        self.result_count = page.estimated_count if page.estimated_count is not None else len(page)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = page.has_other_pages()
+        self.paginator = None
+
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
     list_display = ['invoice_number', 'cashier', 'final_amount', 'payment_method', 'created_at']
     list_filter = ['payment_method', 'created_at']
     search_fields = ['invoice_number', 'customer_name']
     readonly_fields = ['invoice_number', 'created_at']
+    list_select_related = ['cashier']
+    sortable_by = []  # pages are always newest first
+    change_list_template = 'admin/pos/sale/change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # The cursor is not a field lookup, so keep it away from the changelist filters
+        if 'cursor' in request.GET:
+            request.keyset_cursor = request.GET['cursor']
+            request.GET = request.GET.copy()
+            del request.GET['cursor']
+        return super().changelist_view(request, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        # Keep the daily rollup in step with sales entered or corrected here
+        if change:
+            rollups.save_edited_sale(obj)
+        else:
+            super().save_model(request, obj, form, change)
+            rollups.record_sales([(obj, 0)])
+
+@admin.register(SalesDailyRollup)
+class SalesDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'cashier', 'payment_method', 'sale_count', 'items_sold', 'net_amount']
+    list_filter = ['payment_method', 'date']
+
+@admin.register(ReorderSuggestion)
+class ReorderSuggestionAdmin(admin.ModelAdmin):
+    list_display = ['product', 'daily_demand', 'demand_deviation', 'reorder_point', 'reorder_quantity', 'updated_at']
+    search_fields = ['product__name']
+    readonly_fields = ['updated_at']
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ['product', 'kind', 'stock_quantity', 'reorder_level', 'created_at', 'sent_at']
+    list_filter = ['kind', 'created_at']
+    list_select_related = ['product']
+    search_fields = ['product__name']
+    readonly_fields = ['created_at', 'sent_at']
 
 @admin.register(SaleItem)
 class SaleItemAdmin(admin.ModelAdmin):
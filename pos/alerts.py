@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import BooleanField, Case, F, IntegerField, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import LowStockAlert, Product, StockShard
+
+# Alerts handed to the notifier per transaction
+NOTIFY_BATCH_SIZE = 100
+
+
+def on_hand():
+    """Units in stock: the shard total for sharded products, stock_quantity for the rest"""
+    shard_total = (StockShard.objects.filter(product=OuterRef('pk')).order_by()
+                   .values('product').annotate(total=Sum('quantity')).values('total'))
+    return Case(When(stock_shards__gt=0, then=Coalesce(Subquery(shard_total), 0)), default=F('stock_quantity'),
+                output_field=IntegerField())
+
+
+def needs_reorder():
+    """Products at or under their fixed minimum or their forecast reorder point.
+
+    Applies to a queryset annotated with on_hand=on_hand().
+    """
+    return (Q(on_hand__lte=F('min_stock_level'))
+            | Q(reorder_suggestion__reorder_point__gte=F('on_hand')))
+
+
+def refresh_low_stock(product_ids=None):
+    """Bring Product.is_low_stock up to date for product_ids (every product by default).
+
+    Only products whose flag no longer matches their stock are read back,
+    so a write that crosses no threshold costs one indexed SELECT. Each
+    crossing flips the flag and queues one LowStockAlert, once even when
+    concurrent writers see the same crossing. Sharded products
+    are judged by their shard total. Returns the alerts queued.
+    """
+    products = Product.objects.all()
+    if product_ids is not None:
+        if not product_ids:
+            return []
+        products = products.filter(pk__in=product_ids)
+    crossed = list(
+        products.annotate(on_hand=on_hand())
+        .annotate(low=Case(When(needs_reorder(), then=True), default=False, output_field=BooleanField()))
+        .exclude(is_low_stock=F('low'))
+        .values_list('pk', 'low', 'on_hand', 'min_stock_level', 'reorder_suggestion__reorder_point')
+        .order_by()
+    )
+    if not crossed:
+        return []
+
+    # Each flip is conditional on the flag it read, so of two writers seeing the same crossing only the
+    # one whose UPDATE changes the row queues an alert. Crossings are rare, so one UPDATE each is cheap.
+    flipped = [
+        (product_id, low, stock, minimum, reorder_point)
+        for product_id, low, stock, minimum, reorder_point in crossed
+        if Product.objects.filter(pk=product_id, is_low_stock=not low).update(is_low_stock=low)
+    ]
+    return LowStockAlert.objects.bulk_create([
+        LowStockAlert(product_id=product_id, kind='low' if low else 'restocked', stock_quantity=stock,
+                      reorder_level=max(minimum, reorder_point or 0))
+        for product_id, low, stock, minimum, reorder_point in flipped
+    ])
+
+
+def alert_line(alert):
+    return (f'{alert.product.name}: {alert.get_kind_display().lower()}, '
+            f'{alert.stock_quantity} in stock (reorder at {alert.reorder_level})')
+
+
+def email_alerts(alerts):
+    """Send a batch of alerts as one email to LOW_STOCK_ALERT_EMAILS"""
+    body = '\n'.join(alert_line(alert) for alert in alerts)
+    send_mail(f'Stock alerts: {len(alerts)} products', body, None, settings.LOW_STOCK_ALERT_EMAILS)
+
+
+def drain_alerts(notify, batch_size=NOTIFY_BATCH_SIZE):
+    """Hand unsent alerts to notify, oldest first, batch_size at a time.
+
+    Each batch is locked, passed to notify and marked sent in one
+    transaction, so a failing notify leaves it queued and concurrent
+    notifiers skip each other's batches. Returns the number sent.
+    """
+    sent = 0
+    while True:
+        with transaction.atomic():
+            alerts = list(
+                LowStockAlert.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(sent_at__isnull=True).select_related('product').order_by('id')[:batch_size]
+            )
+            if not alerts:
+                return sent
+            notify(alerts)
+            LowStockAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(sent_at=timezone.now())
+        sent += len(alerts)
@@ -0,0 +1,123 @@
+import math
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+HOUR = 3600
+# Trailing window of the daily moving average
+MOVING_AVERAGE_DAYS = 7
+# Default range when no dates are given, and the longest range served in one request
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 3 * 366
+
+
+def series_range(params):
+    """The (start, end) dates of a series request, defaulting to the last DEFAULT_RANGE_DAYS.
+
+    Missing dates are filled into params so the sales query covers the same range.
+    """
+    end = date.fromisoformat(params['end_date']) if 'end_date' in params else timezone.localdate()
+    start = (date.fromisoformat(params['start_date']) if 'start_date' in params
+             else end - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+    params['start_date'], params['end_date'] = start.isoformat(), end.isoformat()
+    return start, end
+
+
+def hourly_totals(sales):
+    """Sale count and amount per local hour, grouped by the database.
+
+    Returns (epoch seconds of each hour, counts, amounts) arrays holding only
+    the hours that had sales.
+    """
+    rows = list(
+        sales.order_by().annotate(hour=TruncHour('created_at')).values('hour')
+        .annotate(count=Count('id'), amount=Sum('final_amount')).values_list('hour', 'count', 'amount')
+    )
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    hours, counts, amounts = zip(*rows)
+    return (
+        np.array([hour.timestamp() for hour in hours], dtype=np.int64),
+        np.array(counts, dtype=np.int64),
+        np.array(amounts, dtype=np.float64),
+    )
+
+
+def moving_average(values, window):
+    """Trailing mean over window values; the first few average what is there so far"""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, len(values) + 1)
+    begin = np.maximum(end - window, 0)
+    return (sums[end] - sums[begin]) / (end - begin)
+
+
+def percent_change(values):
+    """Change from the previous value in percent, NaN where there is nothing to compare with"""
+    change = np.full(len(values), np.nan)
+    previous = values[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change[1:] = np.where(previous > 0, (values[1:] - previous) / previous * 100, np.nan)
+    return change
+
+
+def as_list(values):
+    return [None if math.isnan(value) else value for value in np.round(values, 2).tolist()]
+
+
+def sales_series(sales, start, end, window=MOVING_AVERAGE_DAYS):
+    """Hourly, daily and weekly sales totals of sales for the local dates start..end.
+
+    The database groups sales by hour; the gaps are filled and the hours
+    rolled up into days and Monday-based weeks with array operations, so the
+    cost beyond the query hardly depends on the length of the range.
+    """
+    days = (end - start).days + 1
+    # Local midnights bounding each day, as epoch seconds (days are not always 24 hours long)
+    midnights = [timezone.make_aware(datetime.combine(start + timedelta(days=offset), time.min))
+                 for offset in range(days + 1)]
+    day_starts = np.array([midnight.timestamp() for midnight in midnights], dtype=np.int64)
+    first_hour = day_starts[0]
+    hour_count = int(day_starts[-1] - first_hour) // HOUR
+
+    epochs, counts, amounts = hourly_totals(sales)
+    slots = (epochs - first_hour) // HOUR
+    inside = (slots >= 0) & (slots < hour_count)
+    hourly_count = np.bincount(slots[inside], weights=counts[inside], minlength=hour_count)
+    hourly_amount = np.bincount(slots[inside], weights=amounts[inside], minlength=hour_count)
+
+    hour_days = np.searchsorted(day_starts, first_hour + HOUR * np.arange(hour_count), side='right') - 1
+    daily_count = np.bincount(hour_days, weights=hourly_count, minlength=days)
+    daily_amount = np.bincount(hour_days, weights=hourly_amount, minlength=days)
+
+    first_monday = start - timedelta(days=start.weekday())
+    day_weeks = (np.arange(days) + start.weekday()) // 7
+    weeks = int(day_weeks[-1]) + 1
+    weekly_count = np.bincount(day_weeks, weights=daily_count, minlength=weeks)
+    weekly_amount = np.bincount(day_weeks, weights=daily_amount, minlength=weeks)
+
+    return {
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'hourly': {
+            # One value per hour from the start of start_date, labels left to the client
+            'start': midnights[0].isoformat(),
+            'interval_seconds': HOUR,
+            'count': hourly_count.astype(np.int64).tolist(),
+            'amount': as_list(hourly_amount),
+        },
+        'daily': {
+            'labels': [(start + timedelta(days=offset)).isoformat() for offset in range(days)],
+            'count': daily_count.astype(np.int64).tolist(),
+            'amount': as_list(daily_amount),
+            'moving_average': as_list(moving_average(daily_amount, window)),
+        },
+        'weekly': {
+            'labels': [(first_monday + timedelta(weeks=offset)).isoformat() for offset in range(weeks)],
+            'count': weekly_count.astype(np.int64).tolist(),
+            'amount': as_list(weekly_amount),
+            'change_percent': as_list(percent_change(weekly_amount)),
+        },
+    }
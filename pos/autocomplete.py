@@ -0,0 +1,277 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import versions
+from .catalog import CATALOG_FIELDS, catalog_changes
+from .models import SaleItem
+
+# Measured with tracemalloc: a trie node (object, edge dict, product set,
+# top list) and a product (record dict, key set)
+NODE_BYTES = 600
+RECORD_BYTES = 1000
+
+
+def product_keys(name, barcode):
+    """Strings a product can be found under: its full name, each word of it and its barcode"""
+    name = ' '.join(name.lower().split())
+    keys = {name, *name.split()}
+    if barcode:
+        keys.add(barcode.lower())
+    keys.discard('')
+    return keys
+
+
+def sales_velocity():
+    """Units sold per product over the last AUTOCOMPLETE_VELOCITY_DAYS"""
+    since = timezone.now() - timedelta(days=settings.AUTOCOMPLETE_VELOCITY_DAYS)
+    return dict(
+        SaleItem.objects.filter(created_at__gte=since)
+        .values('product_id').annotate(sold=Sum('quantity')).values_list('product_id', 'sold')
+    )
+
+
+class Node:
+    __slots__ = ('edges', 'products', 'top')
+
+    def __init__(self):
+        self.edges = {}  # first character -> (label, child)
+        self.products = set()  # products with a key ending here
+        self.top = []  # best products in this subtree, best first
+
+
+class ProductTrie:
+    """Compressed trie over product keys for prefix suggestions.
+
+    Every node keeps the top AUTOCOMPLETE_TOP_K products of its subtree by
+    sales velocity, so a lookup is a walk down the prefix. The tops are
+    recomputed bottom-up from the children's tops along the path an
+    insert or removal touched, which keeps catalog edits incremental.
+    """
+
+    def __init__(self, top_k, memory_budget):
+        self.top_k = top_k
+        self.memory_budget = memory_budget
+        self.root = Node()
+        self.records = {}
+        self.keys = {}
+        self.velocity = {}
+        self.nodes = 1
+        self.label_bytes = 0
+
+    @property
+    def size(self):
+        return self.nodes * NODE_BYTES + len(self.records) * RECORD_BYTES + self.label_bytes
+
+    def rank(self, product_id):
+        return -self.velocity.get(product_id, 0), self.records[product_id]['name'].lower(), product_id
+
+    def add(self, record, retop=True):
+        """Index a product record; returns False if the memory budget is used up.
+
+        Bulk loads pass retop=False and call retop_all() once at the end.
+        """
+        product_id = record['id']
+        keys = product_keys(record['name'], record['barcode'])
+        if self.keys.get(product_id) == keys:
+            self.records[product_id] = record
+            return True
+        # Only new products are turned away: an edited one already holds its share of the budget
+        if product_id not in self.records and self.size >= self.memory_budget:
+            return False
+        self.remove(product_id)
+        self.records[product_id] = record
+        self.keys[product_id] = keys
+        for key in keys:
+            path = self._insert(key)
+            path[-1].products.add(product_id)
+            if retop:
+                self._retop(path)
+        return True
+
+    def remove(self, product_id):
+        for key in self.keys.pop(product_id, ()):
+            path = self._find(key)
+            if path:
+                path[-1].products.discard(product_id)
+                self._retop(self._prune(path))
+        self.records.pop(product_id, None)
+
+    def suggest(self, prefix, limit):
+        """Best products with a key starting with prefix"""
+        node = self.root
+        prefix = ' '.join(prefix.lower().split())
+        while prefix:
+            edge = node.edges.get(prefix[0])
+            if edge is None:
+                return []
+            label, child = edge
+            if prefix.startswith(label):
+                prefix = prefix[len(label):]
+            elif label.startswith(prefix):
+                prefix = ''
+            else:
+                return []
+            node = child
+        return [self.records[product_id] for product_id in node.top[:limit]]
+
+    def _insert(self, key):
+        node = self.root
+        path = [node]
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None:
+                child = Node()
+                node.edges[key[0]] = (key, child)
+                self.nodes += 1
+                self.label_bytes += len(key)
+                path.append(child)
+                return path
+            label, child = edge
+            common = 0
+            while common < min(len(label), len(key)) and label[common] == key[common]:
+                common += 1
+            if common < len(label):
+                # Split the edge where key leaves it
+                middle = Node()
+                middle.edges[label[common]] = (label[common:], child)
+                middle.top = list(child.top)
+                node.edges[key[0]] = (label[:common], middle)
+                self.nodes += 1
+                child = middle
+            key = key[common:]
+            node = child
+            path.append(node)
+        return path
+
+    def _find(self, key):
+        node = self.root
+        path = [node]
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None or not key.startswith(edge[0]):
+                return None
+            key = key[len(edge[0]):]
+            node = edge[1]
+            path.append(node)
+        return path
+
+    def _prune(self, path):
+        """Drop the nodes a removal left empty and merge a chain it left behind.
+
+        Returns the part of path still in the trie.
+        """
+        for depth in range(len(path) - 1, 0, -1):
+            node, parent = path[depth], path[depth - 1]
+            if node.products or len(node.edges) > 1:
+                return path[:depth + 1]
+            first = next(first for first, (_, child) in parent.edges.items() if child is node)
+            label = parent.edges[first][0]
+            self.nodes -= 1
+            if node.edges:
+                # One child left: fold this node into the edge above it
+                (child_label, child), = node.edges.values()
+                parent.edges[first] = (label + child_label, child)
+                return path[:depth]
+            del parent.edges[first]
+            self.label_bytes -= len(label)
+        return path[:1]
+
+    def retop_all(self):
+        """Recompute every node's top list, children before parents"""
+        order = [self.root]
+        for node in order:
+            order.extend(child for _, child in node.edges.values())
+        self._retop(order)
+
+    def _retop(self, path):
+        for node in reversed(path):
+            candidates = set(node.products)
+            for _, child in node.edges.values():
+                candidates.update(child.top)
+            node.top = sorted(candidates, key=self.rank)[:self.top_k]
+
+
+class Autocomplete:
+    """Per-worker autocomplete over the active catalog.
+
+    Catalog edits are applied as deltas when the catalog version moves;
+    the trie is rebuilt from scratch every AUTOCOMPLETE_REBUILD_SECONDS to
+    pick up new sales velocity.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._building = threading.Lock()
+        self._trie = None
+        self._built_at = 0
+        self._cursor = None
+        self._version = None
+
+    def suggest(self, prefix, limit=None):
+        limit = min(limit or settings.AUTOCOMPLETE_TOP_K, settings.AUTOCOMPLETE_TOP_K)
+        self._refresh()
+        with self._lock:
+            return self._trie.suggest(prefix, limit)
+
+    def _refresh(self):
+        version = versions.current(versions.CATALOG)
+        with self._lock:
+            trie, cursor, built_at = self._trie, self._cursor, self._built_at
+            current = self._version == version
+        if trie is None or time.monotonic() - built_at > settings.AUTOCOMPLETE_REBUILD_SECONDS:
+            self._rebuild(version, built_at, wait=trie is None)
+            return
+        if current:
+            return
+
+        changes = catalog_changes(cursor)
+        if changes['full']:
+            self._rebuild(version, built_at, changes)
+            return
+        records = [dict(zip(CATALOG_FIELDS, row)) for row in changes['products']]
+        with self._lock:
+            if self._cursor != cursor:
+                return  # another thread got here first, or swapped in a new trie
+            for record in records:
+                self._trie.add(record)
+            for product_id in changes['removed']:
+                self._trie.remove(product_id)
+            self._cursor = changes['cursor']
+            self._version = version
+
+    def _rebuild(self, version, built_at, changes=None, wait=False):
+        """Build a new trie without holding the lock, then swap it in.
+
+        One thread builds at a time; the others keep answering from the
+        current trie, or wait for the first one to exist.
+        """
+        if not self._building.acquire(blocking=wait):
+            return
+        try:
+            if self._built_at != built_at:
+                return  # rebuilt while we waited
+            changes = changes or catalog_changes()
+            trie = ProductTrie(settings.AUTOCOMPLETE_TOP_K, settings.AUTOCOMPLETE_MEMORY_MB * 1024 * 1024)
+            trie.velocity = sales_velocity()
+            records = [dict(zip(CATALOG_FIELDS, row)) for row in changes['products']]
+            # Best sellers go in first, so a full budget leaves out the slow movers
+            records.sort(key=lambda record: -trie.velocity.get(record['id'], 0))
+            for record in records:
+                if not trie.add(record, retop=False):
+                    break
+            trie.retop_all()
+            with self._lock:
+                self._trie = trie
+                self._cursor = changes['cursor']
+                self._version = version
+                self._built_at = time.monotonic()
+        finally:
+            self._building.release()
+
+
+autocomplete = Autocomplete()
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import versions
+from .models import Product, StockShard
+from .stock_shards import available_stock
+
+# Column order of each product row in a catalog response
+CATALOG_FIELDS = ['id', 'name', 'barcode', 'price', 'category_id', 'stock']
+
+# A delta re-sends this much history, so rows whose transaction committed
+# after the previous sync started are not missed
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def catalog_etag():
+    """Fingerprint of the catalog: moves whenever a sync could return something new.
+
+    Built from the version counters alone, so a poll is normally answered
+    without touching the database.
+    """
+    return '-'.join(str(versions.current(name)) for name in (versions.CATALOG, versions.STOCK, versions.CATALOG_PURGES))
+
+
+def make_cursor(moment, purges):
+    return f'{moment.timestamp():.6f}:{purges}'
+
+
+def parse_cursor(cursor):
+    """Return (moment, purges) for a cursor string, or None if it is unusable"""
+    try:
+        moment, purges = cursor.split(':')
+        return datetime.fromtimestamp(float(moment), tz=dt_timezone.utc), int(purges)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def catalog_changes(cursor=None):
+    """Return the catalog as tills sync it.
+
+    Without a usable cursor this is a full snapshot of active products.
+    Otherwise only products updated since the cursor (or, for sharded
+    products, sold since then) are returned, and products deactivated since
+    then are listed in 'removed'. A product
+    deleted outright leaves no row behind, so any delete since the cursor
+    answers with a full snapshot instead.
+    """
+    purges = versions.current(versions.CATALOG_PURGES)
+    started = timezone.now()
+    since = parse_cursor(cursor) if cursor else None
+    if since and since[1] != purges:
+        since = None
+
+    products = Product.objects.only(
+        'id', 'name', 'barcode', 'price', 'category_id', 'stock_quantity', 'stock_shards', 'is_active'
+    ).order_by()
+    if since:
+        sold = StockShard.objects.filter(updated_at__gte=since[0]).values_list('product_id', flat=True).distinct()
+        products = products.filter(Q(updated_at__gte=since[0]) | Q(pk__in=list(sold)))
+    else:
+        products = products.filter(is_active=True)
+    products = list(products)
+    stock = available_stock(products)
+
+    return {
+        'full': since is None,
+        'version': versions.current(versions.CATALOG),
+        'cursor': make_cursor(started - SYNC_OVERLAP, purges),
+        'fields': CATALOG_FIELDS,
+        'products': [
+            [product.id, product.name, product.barcode, str(product.price), product.category_id, stock[product.id]]
+            for product in products if product.is_active
+        ],
+        'removed': [product.id for product in products if not product.is_active],
+    }
@@ -0,0 +1,356 @@
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import versions
+from .alerts import refresh_low_stock
+from .idempotency import run_once
+from .invoicing import allocator
+from .models import IdempotencyKey, Product, Sale, SaleItem, StockMovement, StockReservation
+from .reservations import available_to_sell, release_cart
+from .rollups import record_sales
+from .stock_shards import available_stock, take_from_shards
+
+TAX_RATE = Decimal('0.10')  # 10% tax
+CENTS = Decimal('0.01')
+BATCH_CHUNK_SIZE = 50
+MAX_BATCH_SALES = 500
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into a sale"""
+
+
+def merge_cart_lines(lines):
+    """Collapse (product_id, quantity) pairs into one quantity per product"""
+    quantities = {}
+    for product_id, quantity in lines:
+        try:
+            product_id = int(product_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise CheckoutError('Malformed cart line')
+        if quantity < 1:
+            raise CheckoutError('Quantity must be at least 1')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def decrement_stock(quantities):
+    """Take stock off every product in one conditional UPDATE.
+
+    Returns True only if every row still had enough stock.
+    """
+    wanted = Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = Product.objects.filter(id__in=list(quantities), stock_quantity__gte=wanted).update(
+        stock_quantity=F('stock_quantity') - wanted,
+        updated_at=timezone.now(),
+    )
+    if updated != len(quantities):
+        return False
+    refresh_low_stock(list(quantities))
+    return True
+
+
+def take_stock(products, quantities):
+    """Decrement stock for a cart, returning False if any line cannot be covered.
+
+    Ordinary products share one UPDATE; sharded products are taken from their
+    StockShard rows so their Product row stays uncontended.
+    """
+    single_row = {product_id: quantity for product_id, quantity in quantities.items()
+                  if not products[product_id].stock_shards}
+    if single_row and not decrement_stock(single_row):
+        return False
+    sharded = [product_id for product_id in quantities if product_id not in single_row]
+    if not all(take_from_shards(products[product_id], quantities[product_id]) for product_id in sharded):
+        return False
+    refresh_low_stock(sharded)
+    versions.bump_on_commit(versions.STOCK)
+    return True
+
+
+def lock_products(product_ids):
+    """Load active products by id.
+
+    Ordinary products are row-locked until the transaction ends. Sharded
+    products are read without a lock: their stock lives in StockShard rows.
+    """
+    product_ids = set(product_ids)
+    products = Product.objects.select_for_update().filter(is_active=True, stock_shards=0).in_bulk(list(product_ids))
+    if len(products) < len(product_ids):
+        products.update(
+            Product.objects.filter(is_active=True, stock_shards__gt=0).in_bulk(list(product_ids - set(products)))
+        )
+    return products
+
+
+def check_cart(products, quantities, stock=None):
+    """Raise CheckoutError unless every cart line can be sold.
+
+    stock maps product id to units still available; it defaults to the
+    current stock of the products.
+    """
+    missing = set(quantities) - set(products)
+    if missing:
+        raise CheckoutError(f'Product not found: {", ".join(str(pk) for pk in sorted(missing))}')
+
+    if stock is None:
+        stock = available_stock(products[product_id] for product_id in quantities)
+    for product_id, quantity in quantities.items():
+        if stock[product_id] < quantity:
+            raise CheckoutError(f'Insufficient stock for {products[product_id].name}')
+
+
+def build_sale(cashier, products, quantities, payment_method='cash', discount_amount=Decimal('0'),
+               customer_name='', customer_phone='', notes='', created_at=None):
+    """Return an unsaved Sale with its totals calculated, dated created_at (default now)"""
+    total_amount = sum(
+        (products[product_id].price * quantity for product_id, quantity in quantities.items()),
+        Decimal('0'),
+    )
+    tax_amount = ((total_amount - discount_amount) * TAX_RATE).quantize(CENTS)
+
+    return Sale(
+        cashier=cashier,
+        total_amount=total_amount,
+        discount_amount=discount_amount,
+        tax_amount=tax_amount,
+        final_amount=total_amount - discount_amount + tax_amount,
+        payment_method=payment_method,
+        customer_name=customer_name,
+        customer_phone=customer_phone,
+        notes=notes,
+        created_at=created_at or timezone.now(),
+    )
+
+
+def build_sale_lines(sale, products, quantities):
+    """Return the unsaved SaleItem and StockMovement rows for a saved sale"""
+    items = []
+    movements = []
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        items.append(SaleItem(
+            sale=sale,
+            product=product,
+            quantity=quantity,
+            unit_price=product.price,
+            total_price=product.price * quantity,
+            created_at=sale.created_at,
+        ))
+        movements.append(StockMovement(
+            product=product,
+            movement_type='out',
+            quantity=quantity,
+            reference_type='sale',
+            reference_id=sale.id,
+            notes=f'Sale - Invoice #{sale.invoice_number}',
+            created_by=sale.cashier,
+        ))
+    return items, movements
+
+
+def sale_summary(sale):
+    """The JSON body returned to the till for a recorded sale"""
+    return {
+        'success': True,
+        'invoice_number': sale.invoice_number,
+        'tax_amount': str(sale.tax_amount),
+        'final_amount': str(sale.final_amount),
+        'sale_id': sale.id,
+    }
+
+
+def queued_time(payload):
+    """When a queued offline sale was rung up, from its queued_at, or None to date it now.
+
+    The till's clock is only trusted back to OFFLINE_SALE_MAX_AGE_HOURS,
+    and never for a time in the future.
+    """
+    try:
+        moment = parse_datetime(str(payload.get('queued_at') or ''))
+    except ValueError:
+        return None
+    if moment is None or timezone.is_naive(moment):
+        return None
+    now = timezone.now()
+    if moment > now or moment < now - timedelta(hours=settings.OFFLINE_SALE_MAX_AGE_HOURS):
+        return None
+    return moment
+
+
+def parse_order(data):
+    """Split a process_sale request body into cart lines and Sale fields"""
+    try:
+        lines = [(item['id'], item['qty']) for item in data.get('cart', [])]
+        fields = {
+            'payment_method': data.get('payment_method', 'cash'),
+            'discount_amount': Decimal(str(data.get('discount_amount', 0))),
+            'customer_name': data.get('customer_name', ''),
+            'customer_phone': data.get('customer_phone', ''),
+            'notes': data.get('notes', ''),
+            'cart_id': str(data.get('cart_id', '')),
+        }
+    except (AttributeError, KeyError, TypeError, InvalidOperation):
+        raise CheckoutError('Malformed sale data')
+    return lines, fields
+
+
+def checkout(cashier, lines, cart_id='', respect_holds=True, **sale_fields):
+    """Record a sale for a cart in a fixed number of queries.
+
+    Products are read once under row locks, stock is decremented with a single
+    conditional UPDATE and items/movements are written with bulk_create, all in
+    one transaction with the daily rollup so a failure leaves stock untouched. Stock held by other
+    carts is not sold unless respect_holds is False; the cart's own holds are released with the sale.
+    """
+    quantities = merge_cart_lines(lines)
+    if not quantities:
+        raise CheckoutError('No items in cart')
+
+    with transaction.atomic():
+        products = lock_products(quantities)
+        check_cart(products, quantities,
+                   available_to_sell(products.values(), exclude_cart=cart_id) if respect_holds else None)
+
+        sale = build_sale(cashier, products, quantities, **sale_fields)
+
+        if not take_stock(products, quantities):
+            raise CheckoutError('Insufficient stock for one or more items')
+
+        sale.save()
+        items, movements = build_sale_lines(sale, products, quantities)
+        SaleItem.objects.bulk_create(items)
+        StockMovement.objects.bulk_create(movements)
+        record_sales([(sale, sum(quantities.values()))])
+        release_cart(cart_id)
+
+    return sale
+
+
+def checkout_batch(cashier, payloads, chunk_size=BATCH_CHUNK_SIZE):
+    """Record many queued sales, committing them chunk by chunk.
+
+    Each payload is a process_sale request body plus an optional
+    'request_key'. Returns one result dict per payload, in order. Keys that
+    were already recorded get the stored response back, and a sale that
+    cannot be made fails on its own without affecting the rest. Stock is
+    enforced as for any sale, so a queued sale the shelf can no longer
+    cover is rejected; the till keeps it for someone to resolve. Sales are
+    dated by their queued_at where queued_time trusts it.
+    """
+    results = []
+    for start in range(0, len(payloads), chunk_size):
+        chunk = payloads[start:start + chunk_size]
+        try:
+            chunk_results = _checkout_chunk(cashier, chunk)
+        except (IntegrityError, CheckoutError):
+            # A concurrent writer got in between; settle this chunk one sale at a time
+            chunk_results = [_checkout_one(cashier, payload) for payload in chunk]
+        results.extend(
+            {'request_key': payload.get('request_key', ''), **result}
+            for payload, result in zip(chunk, chunk_results)
+        )
+    return results
+
+
+def _checkout_one(cashier, payload):
+    """Fallback path for checkout_batch: one transaction per sale"""
+    try:
+        lines, fields = parse_order(payload)
+        fields['created_at'] = queued_time(payload)
+        return run_once(cashier, payload.get('request_key', ''),
+                        lambda: sale_summary(checkout(cashier, lines, respect_holds=False, **fields)))
+    except CheckoutError as e:
+        return {'success': False, 'error': str(e)}
+
+
+def _checkout_chunk(cashier, payloads):
+    results = [None] * len(payloads)
+    keys = [payload.get('request_key', '') for payload in payloads]
+    recorded = dict(IdempotencyKey.objects.filter(user=cashier, key__in=[key for key in keys if key])
+                    .values_list('key', 'response'))
+
+    with transaction.atomic():
+        orders = {}
+        cart_ids = {}
+        first_with_key = {}
+        for index, payload in enumerate(payloads):
+            key = keys[index]
+            if key in recorded:
+                results[index] = recorded[key]
+                continue
+            if key and key in first_with_key:
+                continue  # the same sale queued twice; copied from the first below
+            first_with_key[key] = index
+            try:
+                lines, fields = parse_order(payload)
+                cart_ids[index] = fields.pop('cart_id')
+                fields['created_at'] = queued_time(payload)
+                quantities = merge_cart_lines(lines)
+                if not quantities:
+                    raise CheckoutError('No items in cart')
+                orders[index] = (quantities, fields)
+            except CheckoutError as e:
+                results[index] = {'success': False, 'error': str(e)}
+
+        products = lock_products({product_id for quantities, _ in orders.values() for product_id in quantities})
+        stock = available_stock(products.values())
+
+        # Sell in queue order against the locked stock levels
+        accepted = []
+        sold = {}
+        for index, (quantities, fields) in orders.items():
+            try:
+                check_cart(products, quantities, stock)
+            except CheckoutError as e:
+                results[index] = {'success': False, 'error': str(e)}
+                continue
+            for product_id, quantity in quantities.items():
+                stock[product_id] -= quantity
+                sold[product_id] = sold.get(product_id, 0) + quantity
+            accepted.append((index, build_sale(cashier, products, quantities, **fields)))
+
+        if accepted:
+            if not take_stock(products, sold):
+                raise CheckoutError('Stock changed while the batch was being recorded')
+
+            invoice_numbers = allocator.allocate(len(accepted))
+            for (_, sale), invoice_number in zip(accepted, invoice_numbers):
+                sale.invoice_number = invoice_number
+            sales = Sale.objects.bulk_create([sale for _, sale in accepted])
+            items = []
+            movements = []
+            for (index, _), sale in zip(accepted, sales):
+                sale_items, sale_movements = build_sale_lines(sale, products, orders[index][0])
+                items.extend(sale_items)
+                movements.extend(sale_movements)
+                results[index] = sale_summary(sale)
+            SaleItem.objects.bulk_create(items)
+            StockMovement.objects.bulk_create(movements)
+            record_sales((sale, sum(orders[index][0].values())) for (index, _), sale in zip(accepted, sales))
+            versions.bump_on_commit(versions.DASHBOARD)  # bulk_create sends no post_save
+
+            IdempotencyKey.objects.bulk_create([
+                IdempotencyKey(user=cashier, key=keys[index], response=results[index])
+                for index, _ in accepted if keys[index]
+            ])
+            # Other carts' holds are not checked against queued sales (they were made at the till
+            # already); only stock is. Their own carts' holds are released here.
+            StockReservation.objects.filter(
+                cart_id__in=[cart_ids[index] for index, _ in accepted if cart_ids[index]]
+            ).delete()
+
+    for index, key in enumerate(keys):
+        if results[index] is None:
+            results[index] = results[first_with_key[key]]
+    return results
@@ -0,0 +1,115 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import rollups, versions
+from .alerts import on_hand
+from .models import Product, Sale, SalesDailyRollup
+
+# Rows shown in the recent sales and low stock panels
+PANEL_ROWS = 5
+# Published metrics outlive their store day, after which the key is never asked for again
+METRICS_TIMEOUT = 24 * 60 * 60
+# How often a worker with nothing to show checks for another worker's recompute
+WAIT_INTERVAL = 0.05
+
+
+def dashboard_metrics(today):
+    """The admin dashboard's figures for the local date today, as plain values that can be cached"""
+    low_stock = Product.objects.filter(is_low_stock=True, is_active=True)
+    # Sharded products are shown with their shard total
+    low_stock_panel = low_stock.select_related('category', 'reorder_suggestion').annotate(on_hand=on_hand())
+    return {
+        'total_products': Product.objects.filter(is_active=True).count(),
+        'low_stock_products': low_stock.count(),
+        'total_sales_today': rollups.summarize(SalesDailyRollup.objects.filter(date=today))['net_amount'],
+        'total_sales_week': rollups.summarize(
+            SalesDailyRollup.objects.filter(date__gte=today - timedelta(days=7))
+        )['net_amount'],
+        'recent_sales': [
+            {
+                'invoice_number': sale.invoice_number,
+                'cashier_name': sale.cashier.first_name,
+                'final_amount': sale.final_amount,
+                'created_at': sale.created_at,
+            }
+            for sale in Sale.objects.select_related('cashier')[:PANEL_ROWS]
+        ],
+        'low_stock_items': [
+            {
+                'name': product.name,
+                'category': product.category.name,
+                'stock_quantity': product.on_hand,
+                'reorder_quantity': getattr(product, 'reorder_suggestion', None)
+                                    and product.reorder_suggestion.reorder_quantity,
+            }
+            for product in low_stock_panel[:PANEL_ROWS]
+        ],
+    }
+
+
+class DashboardCache:
+    """Admin dashboard metrics per store day and dashboard data version.
+
+    Sale, product and stock movement writes bump the DASHBOARD version.
+    Until it moves, a worker answers from its own copy without querying.
+    After a bump, the worker that takes the recompute lock in the Django
+    cache rebuilds the figures and publishes them there; the others keep
+    showing their previous copy from the same day, or wait up to
+    DASHBOARD_LOCK_SECONDS for the new one. The lock and published figures
+    are shared between workers when CACHES points at a shared backend.
+    """
+
+    def __init__(self):
+        self._entry = None  # (key, day, metrics)
+
+    def get(self):
+        today = timezone.localdate()
+        key = f'pos:dashboard:{today.isoformat()}:{versions.current(versions.DASHBOARD)}'
+        entry = self._entry
+        if entry and entry[0] == key:
+            return entry[2]
+
+        metrics = cache.get(key)
+        if metrics is None:
+            metrics = self._recompute(key, today, stale=entry[2] if entry and entry[1] == today else None)
+            if metrics is None:
+                return entry[2]
+        self._entry = (key, today, metrics)
+        return metrics
+
+    def _recompute(self, key, today, stale):
+        """Build and publish the metrics under key, unless another worker is already doing so.
+
+        Returns None when the caller should show its stale copy instead.
+        """
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + settings.DASHBOARD_LOCK_SECONDS
+        locked = cache.add(lock_key, True, settings.DASHBOARD_LOCK_SECONDS)
+        while not locked:
+            if stale is not None:
+                return None
+            time.sleep(WAIT_INTERVAL)
+            metrics = cache.get(key)
+            if metrics is not None:
+                return metrics
+            if time.monotonic() >= deadline:
+                break  # the lock holder has stalled or died; go ahead without it
+            locked = cache.add(lock_key, True, settings.DASHBOARD_LOCK_SECONDS)
+
+        try:
+            metrics = dashboard_metrics(today)
+            cache.set(key, metrics, METRICS_TIMEOUT)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        return metrics
+
+    def clear(self):
+        self._entry = None
+
+
+dashboard_cache = DashboardCache()
@@ -0,0 +1,50 @@
+import csv
+from io import StringIO
+
+# Rows fetched per round trip from the database cursor
+EXPORT_FETCH_SIZE = 2000
+# Rows rendered into each chunk handed to the client
+EXPORT_CHUNK_ROWS = 500
+
+SALE_EXPORT_HEADER = ['Invoice #', 'Date', 'Cashier', 'Customer', 'Payment Method',
+                      'Total Amount', 'Discount', 'Tax', 'Final Amount']
+
+
+def sale_export_rows(sales):
+    """Yield one export row per sale without building model instances.
+
+    Only the exported columns are selected, the cashier's name comes from
+    the same query, and rows are read through a server-side cursor where
+    the database supports one.
+    """
+    rows = sales.values_list(
+        'invoice_number', 'created_at', 'cashier__first_name', 'cashier__last_name', 'cashier__username',
+        'customer_name', 'payment_method', 'total_amount', 'discount_amount', 'tax_amount', 'final_amount',
+    )
+    for (invoice_number, created_at, first_name, last_name, username, customer_name, payment_method,
+         total_amount, discount_amount, tax_amount, final_amount) in rows.iterator(chunk_size=EXPORT_FETCH_SIZE):
+        yield [
+            invoice_number,
+            created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            f'{first_name} {last_name}'.strip() or username,  # User.get_full_name()
+            customer_name,
+            payment_method,
+            total_amount,
+            discount_amount,
+            tax_amount,
+            final_amount,
+        ]
+
+
+def csv_chunks(header, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Render rows as CSV text, yielding it a chunk of rows at a time"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,135 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import versions
+from .alerts import refresh_low_stock
+from .models import Product, ReorderSuggestion, SaleItem, StockMovement
+from .sales_filters import created_on
+from .stock_shards import available_stock
+
+# Products per forecast chunk, and per bulk write of the suggestions
+FORECAST_CHUNK_SIZE = 5000
+WRITE_BATCH_SIZE = 2000
+
+
+def demand_matrix(product_ids, start, days):
+    """Units consumed per product (rows, in product_ids order) and local day (columns).
+
+    Demand is what was sold plus stock taken out by hand (wastage, own
+    use); stock leaving through a sale is counted once, from its SaleItem.
+    """
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    matrix = np.zeros((len(product_ids), days))
+    last = start + timedelta(days=days - 1)
+    sold = (
+        SaleItem.objects.filter(created_on(start, last))
+        .annotate(day=TruncDate('created_at')).values('product_id', 'day')
+        .annotate(units=Sum('quantity')).values_list('product_id', 'day', 'units').order_by()
+    )
+    taken = (
+        StockMovement.objects.filter(created_on(start, last), movement_type='out')
+        .exclude(reference_type='sale')
+        .annotate(day=TruncDate('created_at')).values('product_id', 'day')
+        .annotate(units=Sum('quantity')).values_list('product_id', 'day', 'units').order_by()
+    )
+    for rows in (sold, taken):
+        rows = list(rows)
+        if not rows:
+            continue
+        ids, dates, units = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        rows_at = np.searchsorted(product_ids, ids)
+        known = (rows_at < len(product_ids)) & (product_ids[np.minimum(rows_at, len(product_ids) - 1)] == ids)
+        columns = np.array([day.toordinal() for day in dates]) - start.toordinal()
+        np.add.at(matrix, (rows_at[known], columns[known]), np.array(units, dtype=np.float64)[known])
+    return matrix
+
+
+def smooth(demand, alpha):
+    """Simple exponential smoothing of every row of demand at once.
+
+    Steps through the days, updating all products' levels together.
+    Returns the final level (the forecast units per day) and the root mean
+    squared one-day-ahead error of each row.
+    """
+    days = demand.shape[1]
+    columns = np.ascontiguousarray(demand.T)
+    level = columns[:min(days, 7)].mean(axis=0)  # start from the first week's average
+    squared_error = np.zeros(demand.shape[0])
+    for day in columns:
+        error = day - level
+        squared_error += error * error
+        level += alpha * error
+    return level, np.sqrt(squared_error / max(days, 1))
+
+
+def reorder_levels(level, deviation, stock, lead_time, cover_days, z):
+    """Reorder point (lead-time demand plus safety stock) and the quantity that tops stock up
+    to the reorder point plus cover_days of demand"""
+    reorder_point = np.ceil(level * lead_time + z * deviation * np.sqrt(lead_time))
+    target = reorder_point + np.ceil(level * cover_days)
+    quantity = np.maximum(target - stock, 0)
+    return reorder_point.astype(np.int64), quantity.astype(np.int64)
+
+
+def forecast_chunk(demand, stock, alpha, lead_time, cover_days, z):
+    """Forecast one block of products; pure numpy, so it can run in a worker process"""
+    level, deviation = smooth(demand, alpha)
+    reorder_point, quantity = reorder_levels(level, deviation, stock, lead_time, cover_days, z)
+    return level, deviation, reorder_point, quantity
+
+
+def forecast(demand, stock, workers=1, chunk_size=FORECAST_CHUNK_SIZE):
+    """Run forecast_chunk over blocks of rows, in a process pool when workers > 1"""
+    run = partial(forecast_chunk, alpha=settings.FORECAST_SMOOTHING, lead_time=settings.REORDER_LEAD_TIME_DAYS,
+                  cover_days=settings.REORDER_COVER_DAYS, z=settings.REORDER_SERVICE_Z)
+    blocks = [demand[i:i + chunk_size] for i in range(0, len(demand), chunk_size)]
+    stocks = [stock[i:i + chunk_size] for i in range(0, len(stock), chunk_size)]
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, blocks, stocks))
+    else:
+        results = list(map(run, blocks, stocks))
+    if not results:
+        return tuple(np.empty(0) for _ in range(4))
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def update_reorder_suggestions(workers=None, chunk_size=FORECAST_CHUNK_SIZE):
+    """Forecast demand for every active product and store its reorder suggestion.
+
+    Returns the number of products forecast.
+    """
+    workers = workers or settings.FORECAST_WORKERS
+    days = settings.FORECAST_HISTORY_DAYS
+    start = timezone.localdate() - timedelta(days=days)
+
+    products = list(Product.objects.filter(is_active=True).order_by('id').only('id', 'stock_quantity', 'stock_shards'))
+    product_ids = [product.id for product in products]
+    stock_by_id = available_stock(products)
+    stock = np.array([stock_by_id[product_id] for product_id in product_ids], dtype=np.float64)
+
+    demand = demand_matrix(product_ids, start, days)
+    level, deviation, reorder_point, quantity = forecast(demand, stock, workers, chunk_size)
+
+    suggestions = [
+        ReorderSuggestion(product_id=product_id, daily_demand=round(float(level[i]), 3),
+                          demand_deviation=round(float(deviation[i]), 3),
+                          reorder_point=int(reorder_point[i]), reorder_quantity=int(quantity[i]))
+        for i, product_id in enumerate(product_ids)
+    ]
+    ReorderSuggestion.objects.bulk_create(
+        suggestions, batch_size=WRITE_BATCH_SIZE, update_conflicts=True, unique_fields=['product'],
+        update_fields=['daily_demand', 'demand_deviation', 'reorder_point', 'reorder_quantity', 'updated_at'],
+    )
+    ReorderSuggestion.objects.exclude(product__is_active=True).delete()
+    refresh_low_stock()
+    versions.bump(versions.DASHBOARD)  # the low stock list follows the new reorder points
+    return len(suggestions)
@@ -98,3 +98,19 @@ class SaleEditForm(forms.ModelForm):
 
 
 
+class ProductPerformanceForm(forms.Form):
+    SORT_CHOICES = [
+        ('revenue', 'Revenue'),
+        ('units', 'Units sold'),
+        ('velocity', 'Units per day'),
+        ('share', 'Revenue share'),
+        ('name', 'Name'),
+    ]
+
+    start_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    abc = forms.ChoiceField(label='Class', choices=[('', 'All'), ('A', 'A'), ('B', 'B'), ('C', 'C')], required=False,widget=forms.Select(attrs={'class': 'form-select'}))
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), to_field_name='name', required=False,widget=forms.Select(attrs={'class': 'form-select'}))
+    search = forms.CharField(required=False)
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False,widget=forms.Select(attrs={'class': 'form-select'}))
+    order = forms.ChoiceField(choices=[('desc', 'Highest first'), ('asc', 'Lowest first')], required=False,widget=forms.Select(attrs={'class': 'form-select'}))
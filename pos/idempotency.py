@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 64
+
+
+def run_once(user, key, handler):
+    """Run handler() at most once per (user, key) and replay its result on retries.
+
+    handler must return a JSON-serialisable dict. It runs in the same
+    transaction that records the key, so a concurrent retry either sees the
+    stored response or rolls back when the key insert conflicts. Exceptions
+    are not recorded, which lets the client retry a failed request.
+    """
+    if not key:
+        return handler()
+
+    stored = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if stored:
+        return stored.response
+
+    try:
+        with transaction.atomic():
+            response = handler()
+            IdempotencyKey.objects.create(user=user, key=key, response=response)
+    except IntegrityError:
+        # Only a concurrent request recording the same key is a replay; any other clash is the handler's
+        stored = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if stored is None:
+            raise
+        return stored.response
+
+    return response
+
+
+def purge_expired_keys(ttl=None):
+    """Delete keys older than the TTL and return how many were removed"""
+    if ttl is None:
+        ttl = timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - ttl).delete()
+    return deleted
@@ -0,0 +1,100 @@
+import threading
+import uuid
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+INVOICE_PREFIX = 'INV-'
+INVOICE_DIGITS = 10
+SEQUENCE_NAME = 'pos_invoice_number_seq'
+
+
+def format_invoice_number(value):
+    # Zero padding keeps string order equal to numeric order in the unique index
+    return f"{INVOICE_PREFIX}{value:0{INVOICE_DIGITS}d}"
+
+
+class InvoiceNumberAllocator(ABC):
+    """Base class for INVOICE_NUMBER_ALLOCATOR implementations"""
+
+    @abstractmethod
+    def allocate(self, count=1):
+        """Return a list of count unused invoice numbers"""
+
+
+class RandomInvoiceNumberAllocator(InvoiceNumberAllocator):
+    """The original scheme: 8 random hex characters, may collide"""
+
+    def allocate(self, count=1):
+        return [f"{INVOICE_PREFIX}{uuid.uuid4().hex[:8].upper()}" for _ in range(count)]
+
+
+class BlockInvoiceNumberAllocator(InvoiceNumberAllocator):
+    """Hands out ordered numbers from blocks reserved per worker process.
+
+    On PostgreSQL a block is block_size values drawn from a database
+    sequence in one round trip. nextval() is not transactional, so no lock is
+    held while the sale commits and a rolled back sale only leaves a gap.
+
+    Other backends have no such sequence, so numbers come from the
+    InvoiceSequence row inside the caller's transaction and are not cached:
+    a rollback then returns the numbers along with the sale.
+    """
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.INVOICE_NUMBER_BLOCK_SIZE
+        self._block = []
+        self._lock = threading.Lock()
+
+    def allocate(self, count=1):
+        if connection.vendor != 'postgresql':
+            return [format_invoice_number(value) for value in self._reserve_from_table(count)]
+
+        with self._lock:
+            while len(self._block) < count:
+                self._block.extend(self._reserve_from_sequence(max(self.block_size, count - len(self._block))))
+            numbers, self._block = self._block[:count], self._block[count:]
+        return [format_invoice_number(value) for value in numbers]
+
+    def _reserve_from_sequence(self, size):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SEQUENCE_NAME, size])
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def _reserve_from_table(self, count):
+        from .models import InvoiceSequence
+
+        sequence = InvoiceSequence.objects.filter(name=SEQUENCE_NAME)
+        if not sequence.update(last_value=F('last_value') + count):
+            InvoiceSequence.objects.create(name=SEQUENCE_NAME, last_value=count)
+        last_value = sequence.values_list('last_value', flat=True).get()
+        return list(range(last_value - count + 1, last_value + 1))
+
+
+def sequence_started():
+    """True once the ordered sequence has handed out a number, even one whose sale rolled back"""
+    from .models import InvoiceSequence
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT is_called FROM {SEQUENCE_NAME}')
+            if cursor.fetchone()[0]:
+                return True
+    return InvoiceSequence.objects.filter(name=SEQUENCE_NAME, last_value__gt=0).exists()
+
+
+def continue_sequence_after(value):
+    """Make the next ordered invoice number value + 1"""
+    from .models import InvoiceSequence
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT setval(%s, %s)', [SEQUENCE_NAME, value])
+    InvoiceSequence.objects.update_or_create(name=SEQUENCE_NAME, defaults={'last_value': value})
+
+
+allocator = SimpleLazyObject(lambda: import_string(settings.INVOICE_NUMBER_ALLOCATOR)())
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from datetime import date
+from pos.partitions import PARTITIONED_MODELS, add_months, archive_month, month_start
+
+
+class Command(BaseCommand):
+    help = 'Move whole months of sales, sale lines and stock movements out to gzipped CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive months before this one (YYYY-MM); '
+                                             'default is ARCHIVE_AFTER_MONTHS before the current month')
+        parser.add_argument('--dir', default=settings.ARCHIVE_DIR, help='Where the archive files go')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per fetch or delete')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the months that would be archived')
+
+    def handle(self, *args, **options):
+        this_month = month_start(timezone.localdate())
+        if options['before']:
+            try:
+                year, month = options['before'].split('-')
+                before = date(int(year), int(month), 1)
+            except ValueError:
+                raise CommandError(f'Invalid --before month: {options["before"]}')
+        else:
+            before = add_months(this_month, -settings.ARCHIVE_AFTER_MONTHS)
+        if before > add_months(this_month, -1):
+            raise CommandError('Refusing to archive the current or previous month')
+
+        oldest = [model.objects.aggregate(first=Min('created_at'))['first'] for model in PARTITIONED_MODELS]
+        oldest = [value for value in oldest if value]
+        if not oldest:
+            self.stdout.write('Nothing to archive')
+            return
+
+        month = month_start(timezone.localtime(min(oldest)).date())
+        while month < before:
+            if options['dry_run']:
+                self.stdout.write(f'Would archive {month:%Y-%m}')
+            else:
+                archived = archive_month(month, options['dir'], options['batch_size'])
+                rows = ', '.join(f'{count} {table}' for table, count in archived.items())
+                self.stdout.write(self.style.SUCCESS(f'Archived {month:%Y-%m}: {rows}'))
+            month = add_months(month, 1)
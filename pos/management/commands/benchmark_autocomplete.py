@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from decimal import Decimal
+import random
+import statistics
+import time
+from pos.autocomplete import Autocomplete
+from pos.management.commands.benchmark_product_search import WORDS
+from pos.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Measure autocomplete build time and prefix lookup latency against a generated catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--lookups', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark autocomplete')
+            Product.objects.bulk_create([
+                Product(name=' '.join(rng.sample(WORDS, 3)) + f' {i}', category=category,
+                        barcode=f'AUTO{i:08d}', price=Decimal('1.00'), stock_quantity=10)
+                for i in range(options['products'])
+            ], batch_size=2000)
+
+            service = Autocomplete()
+            start = time.perf_counter()
+            service.suggest('')
+            trie = service._trie
+            self.stdout.write(
+                f'built in {time.perf_counter() - start:.2f} s: {len(trie.records)} products, '
+                f'{trie.nodes} nodes, ~{trie.size / 1024 / 1024:.1f} MB'
+            )
+
+            prefixes = [rng.choice(WORDS)[:rng.randint(1, 4)] for _ in range(options['lookups'])]
+            timings = []
+            for prefix in prefixes:
+                start = time.perf_counter()
+                service.suggest(prefix)
+                timings.append((time.perf_counter() - start) * 1e6)
+            timings.sort()
+            self.stdout.write(
+                f'suggest: median {statistics.median(timings):.2f} us, '
+                f'p99 {timings[int(len(timings) * 0.99)]:.2f} us'
+            )
+
+            transaction.set_rollback(True)
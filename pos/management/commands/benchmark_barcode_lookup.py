@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from decimal import Decimal
+import statistics
+import time
+from pos.models import Category, Product
+from pos.product_cache import BarcodeCache
+
+
+class Command(BaseCommand):
+    help = 'Measure barcode lookup latency for cache hits and misses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--lookups', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark barcodes')
+            Product.objects.bulk_create([
+                Product(name=f'Scan item {i}', category=category, barcode=f'BENCH{i:08d}',
+                        price=Decimal('1.00'), stock_quantity=10)
+                for i in range(options['products'])
+            ])
+            codes = [f'BENCH{i % options["products"]:08d}' for i in range(options['lookups'])]
+            cache = BarcodeCache(maxsize=options['products'])
+
+            misses = self.time_lookups(cache, codes, clear=True)
+            self.time_lookups(cache, codes, clear=False)  # warm up
+            hits = self.time_lookups(cache, codes, clear=False)
+
+            for label, timings in (('miss', misses), ('hit', hits)):
+                timings.sort()
+                self.stdout.write(
+                    f'{label:>5}: median {statistics.median(timings):8.2f} us, '
+                    f'p99 {timings[int(len(timings) * 0.99)]:8.2f} us'
+                )
+
+            transaction.set_rollback(True)
+
+    def time_lookups(self, cache, codes, clear):
+        timings = []
+        for code in codes:
+            if clear:
+                cache.clear()
+            start = time.perf_counter()
+            cache.lookup(code)
+            timings.append((time.perf_counter() - start) * 1e6)
+        return timings
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from decimal import Decimal
+import statistics
+import time
+from pos.checkout import checkout
+from pos.models import Category, Product, Sale, SaleItem, StockMovement
+
+
+class Command(BaseCommand):
+    help = 'Benchmark checkout latency and query count for growing basket sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,30,60', help='Comma separated basket sizes')
+        parser.add_argument('--repeat', type=int, default=20, help='Checkouts per basket size')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+
+        # Everything runs in one transaction that is rolled back at the end
+        with transaction.atomic():
+            cashier = User.objects.create_user(username='benchmark-cashier')
+            category = Category.objects.create(name='Benchmark')
+            products = Product.objects.bulk_create([
+                Product(name=f'Benchmark item {i}', category=category, price=Decimal('10.00'),
+                        stock_quantity=max(sizes) * repeat * 10)
+                for i in range(max(sizes))
+            ])
+
+            self.stdout.write(f'{"engine":>9} {"lines":>6} {"median ms":>10} {"p95 ms":>8} {"queries":>8}')
+            for name, engine in [('per-line', self.per_line_checkout), ('batched', checkout)]:
+                for size in sizes:
+                    lines = [(product.id, 2) for product in products[:size]]
+                    timings = []
+                    for _ in range(repeat):
+                        with CaptureQueriesContext(connection) as queries:
+                            start = time.perf_counter()
+                            engine(cashier, lines)
+                            timings.append((time.perf_counter() - start) * 1000)
+
+                    timings.sort()
+                    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                    self.stdout.write(
+                        f'{name:>9} {size:>6} {statistics.median(timings):>10.2f} {p95:>8.2f} {len(queries):>8}'
+                    )
+
+            transaction.set_rollback(True)
+
+    def per_line_checkout(self, cashier, lines):
+        """The previous process_sale loop, kept as a baseline"""
+        total_amount = Decimal('0')
+        sale_items = []
+        for product_id, quantity in lines:
+            product = Product.objects.get(id=product_id, is_active=True)
+            total_amount += product.price * quantity
+            sale_items.append((product, quantity))
+
+        sale = Sale.objects.create(cashier=cashier, total_amount=total_amount, final_amount=total_amount)
+        for product, quantity in sale_items:
+            SaleItem.objects.create(sale=sale, product=product, quantity=quantity,
+                                    unit_price=product.price, total_price=product.price * quantity)
+            product.stock_quantity -= quantity
+            product.save()
+            StockMovement.objects.create(product=product, movement_type='out', quantity=quantity,
+                                         reference_type='sale', reference_id=sale.id, created_by=cashier)
+        return sale
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.utils import load_backend
+from django.test.utils import override_settings
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import threading
+import time
+from pos.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Compare per-request latency of a POS lookup with a new connection per request, '
+            'persistent connections and the connection pool')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per thread and mode')
+        parser.add_argument('--threads', type=int, default=4, help='Threads making requests at once')
+        parser.add_argument('--pool-size', type=int, help='Pool size; default DB_POOL_SIZE, or --threads if unset')
+
+    def handle(self, *args, **options):
+        settings_dict = dict(connections['default'].settings_dict)
+        base_engine = settings_dict['ENGINE']
+        if base_engine == 'pos.pooled_postgresql':
+            base_engine = 'django.db.backends.postgresql'
+        modes = [
+            ('per-request', {'ENGINE': base_engine, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+            ('persistent', {'ENGINE': base_engine, 'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}),
+        ]
+        if connections['default'].vendor == 'postgresql':
+            modes.append(
+                ('pooled', {'ENGINE': 'pos.pooled_postgresql', 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False})
+            )
+        else:
+            self.stdout.write(self.style.WARNING('The pool needs PostgreSQL; only comparing the built-in modes'))
+
+        pool_size = options['pool_size'] or settings.DB_POOL_SIZE or options['threads']
+        barcode = Product.objects.exclude(barcode=None).values_list('barcode', flat=True).first() or ''
+        connections['default'].close()
+
+        self.stdout.write(f'{"mode":>12} {"requests":>9} {"median ms":>10} {"p95 ms":>8} {"opened":>7}')
+        with override_settings(DB_POOL_SIZE=pool_size):
+            for name, overrides in modes:
+                timings, opened = self.run_mode({**settings_dict, **overrides}, barcode, options)
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f'{name:>12} {len(timings):>9} {statistics.median(timings):>10.2f} {p95:>8.2f} {opened:>7}'
+                )
+
+    def run_mode(self, settings_dict, barcode, options):
+        """Time requests from every thread against a fresh connection built from settings_dict"""
+        opened = []  # driver connections handed to Django; pooled ones repeat
+        lock = threading.Lock()
+
+        def count_connect(sender, connection, **kwargs):
+            with lock:
+                opened.append(connection.connection)
+
+        def worker():
+            backend = load_backend(settings_dict['ENGINE'])
+            connections['default'] = backend.DatabaseWrapper(dict(settings_dict), 'default')
+            timings = []
+            try:
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    self.request(barcode)
+                    timings.append((time.perf_counter() - start) * 1000)
+            finally:
+                connections['default'].close()
+            return timings
+
+        connection_created.connect(count_connect)
+        try:
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                results = [pool.submit(worker) for _ in range(options['threads'])]
+                timings = [timing for result in results for timing in result.result()]
+        finally:
+            connection_created.disconnect(count_connect)
+        return timings, len({id(driver_connection) for driver_connection in opened})
+
+    def request(self, barcode):
+        """One till lookup, wrapped in the signals Django's handler sends around a request"""
+        request_started.send(sender=self.__class__)
+        try:
+            Product.objects.filter(barcode=barcode, is_active=True).values_list('id', 'price').first()
+        finally:
+            request_finished.send(sender=self.__class__)
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+import time
+import numpy as np
+from pos.forecasting import forecast, update_reorder_suggestions
+from pos.models import Category, Product, ReorderSuggestion, Sale, SaleItem
+
+
+class Command(BaseCommand):
+    help = 'Time the demand forecast over generated demand, in one process and in a pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--workers', default='1,4', help='Comma separated worker counts to compare')
+        parser.add_argument('--database', action='store_true',
+                            help='Also run the whole job against generated sales, rolled back afterwards')
+        parser.add_argument('--sale-lines', type=int, default=200000, help='Sale lines generated for --database')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        # Each product sells at its own Poisson rate, from slow movers to daily staples
+        rates = rng.gamma(0.5, 4.0, size=options['products'])
+        demand = rng.poisson(rates[:, None], size=(options['products'], options['days'])).astype(np.float64)
+        stock = rng.integers(0, 200, size=options['products']).astype(np.float64)
+        self.stdout.write(f'{options["products"]} products x {options["days"]} days')
+
+        for workers in [int(workers) for workers in options['workers'].split(',')]:
+            start = time.perf_counter()
+            level, deviation, reorder_point, quantity = forecast(demand, stock, workers)
+            elapsed = time.perf_counter() - start
+            error = np.abs(level - rates).mean()
+            self.stdout.write(
+                f'{workers:>2} worker(s): {elapsed:.2f} s, mean |forecast - true rate| {error:.2f} units/day, '
+                f'{int((quantity > 0).sum())} products to reorder'
+            )
+
+        if options['database']:
+            self.run_job(rng, options)
+
+    def run_job(self, rng, options):
+        with transaction.atomic():
+            cashier = User.objects.create_user(username='benchmark-forecast')
+            category = Category.objects.create(name='Benchmark forecast')
+            products = Product.objects.bulk_create([
+                Product(name=f'Forecast item {i}', category=category, price=Decimal('1.00'),
+                        stock_quantity=int(stock))
+                for i, stock in enumerate(rng.integers(0, 200, size=options['products']))
+            ], batch_size=2000)
+            today = timezone.now()
+            sales = Sale.objects.bulk_create([
+                Sale(invoice_number=f'FCST-{day:04d}', cashier=cashier, payment_method='cash',
+                     total_amount=0, final_amount=0)
+                for day in range(options['days'])
+            ])
+            for day, sale in enumerate(sales, start=1):
+                sale.created_at = today - timedelta(days=day)
+            Sale.objects.bulk_update(sales, ['created_at'])
+
+            picks = rng.integers(0, len(products), size=options['sale_lines'])
+            days = rng.integers(0, len(sales), size=options['sale_lines'])
+            SaleItem.objects.bulk_create([
+                SaleItem(sale=sales[day], product=products[pick], quantity=1, unit_price=Decimal('1.00'),
+                         total_price=Decimal('1.00'), created_at=sales[day].created_at)
+                for pick, day in zip(picks, days)
+            ], batch_size=5000)
+
+            start = time.perf_counter()
+            count = update_reorder_suggestions(workers=1)
+            self.stdout.write(self.style.SUCCESS(
+                f'Full job over {options["sale_lines"]} sale lines: {count} products in '
+                f'{time.perf_counter() - start:.1f} s, {ReorderSuggestion.objects.count()} suggestions stored'
+            ))
+            transaction.set_rollback(True)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from decimal import Decimal
+import random
+import statistics
+import time
+from pos.models import Category, Product
+from pos.search import product_index, search_products
+
+WORDS = ['apple', 'banana', 'coffee', 'milk', 'bread', 'rice', 'noodle', 'soap', 'shampoo', 'water',
+         'green', 'tea', 'chili', 'sauce', 'fresh', 'dried', 'large', 'small', 'family', 'pack']
+
+
+class Command(BaseCommand):
+    help = 'Measure product search latency against a generated catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--budget-ms', type=float, default=20.0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark search')
+            Product.objects.bulk_create([
+                Product(name=' '.join(rng.sample(WORDS, 3)) + f' {i}', category=category,
+                        barcode=f'SRCH{i:08d}', price=Decimal('1.00'), stock_quantity=10)
+                for i in range(options['products'])
+            ], batch_size=2000)
+
+            start = time.perf_counter()
+            product_index.refresh()
+            self.stdout.write(f'index ready in {time.perf_counter() - start:.2f} s')
+
+            queries = [
+                rng.choice([
+                    rng.choice(WORDS),                   # whole word
+                    rng.choice(WORDS)[1:5],              # middle of a word
+                    rng.choice(WORDS).replace('a', 'e'),  # typo
+                    f'SRCH{rng.randrange(options["products"]):08d}'[:9],  # barcode prefix
+                ])
+                for _ in range(options['queries'])
+            ]
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                search_products(query, limit=50)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95)]
+            self.stdout.write(
+                f'search: median {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms, '
+                f'max {timings[-1]:.2f} ms'
+            )
+            if p95 > options['budget_ms']:
+                self.stdout.write(self.style.ERROR(f'p95 is over the {options["budget_ms"]:.0f} ms budget'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'p95 is within the {options["budget_ms"]:.0f} ms budget'))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, time as day_start, timedelta
+from decimal import Decimal
+import random
+import statistics
+import time
+from pos.analytics import hourly_totals, sales_series
+from pos.models import Sale
+
+
+class Command(BaseCommand):
+    help = 'Measure the sales time-series analytics over a generated history of hourly sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--sales-per-hour', type=int, default=1)
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--budget-ms', type=float, default=500.0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        end = timezone.localdate()
+        start = end - timedelta(days=options['days'] - 1)
+        first_hour = timezone.make_aware(datetime.combine(start, day_start.min))
+
+        # Everything runs in one transaction that is rolled back at the end
+        with transaction.atomic():
+            cashier = User.objects.create_user(username='benchmark-analytics')
+            sales = []
+            for hour in range(options['days'] * 24):
+                for n in range(options['sales_per_hour']):
+                    amount = Decimal(rng.randrange(100, 10000)) / 100
+                    sales.append(Sale(
+                        invoice_number=f'BENCH-{hour:06d}-{n}', cashier=cashier, payment_method='cash',
+                        total_amount=amount, final_amount=amount,
+                        created_at=first_hour + timedelta(hours=hour, minutes=rng.randrange(60)),
+                    ))
+            sales = Sale.objects.bulk_create(sales, batch_size=2000)
+            # bulk_create stamps created_at with now(); put the history back
+            Sale.objects.bulk_update(sales, ['created_at'], batch_size=2000)
+            self.stdout.write(f'{len(sales)} sales over {options["days"]} days')
+
+            queryset = Sale.objects.filter(cashier=cashier)
+            query_timings, timings = [], []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                hourly_totals(queryset)
+                query_timings.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                series = sales_series(queryset, start, end)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(
+                f'{len(series["hourly"]["amount"])} hours, {len(series["daily"]["amount"])} days, '
+                f'{len(series["weekly"]["amount"])} weeks: median {statistics.median(timings):.1f} ms '
+                f'(grouped query {statistics.median(query_timings):.1f} ms), max {max(timings):.1f} ms'
+            )
+            if statistics.median(timings) > options['budget_ms']:
+                self.stdout.write(self.style.ERROR(f'median is over the {options["budget_ms"]:.0f} ms budget'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'median is within the {options["budget_ms"]:.0f} ms budget'))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection, connections
+from decimal import Decimal
+from threading import Thread
+import time
+from pos.checkout import checkout, CheckoutError
+from pos.models import Category, Product, Sale, StockMovement
+from pos.stock_shards import available_stock, set_shards
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent checkouts of one hot product with and without stock shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--sales', type=int, default=50, help='Checkouts per thread')
+        parser.add_argument('--shards', type=int, default=16)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite serialises all writers; run this against PostgreSQL'))
+
+        threads, sales = options['threads'], options['sales']
+        # Workers use their own connections, so the fixtures are committed and removed afterwards.
+        # Each worker is its own till, so sales land on different daily rollup rows as they would in a shop.
+        cashiers = [User.objects.create_user(username=f'benchmark-shards-{i}') for i in range(threads)]
+        category = Category.objects.create(name='Benchmark shards')
+        try:
+            for shards in (0, options['shards']):
+                # One unit short of demand, so the oversell guard is exercised too
+                product = Product.objects.create(name=f'Hot item ({shards} shards)', category=category,
+                                                 price=Decimal('1.00'), stock_quantity=threads * sales - 1)
+                if shards:
+                    set_shards(product.id, shards)
+
+                elapsed, sold, refused, failed = self.run_workers(cashiers, product.id, sales)
+                product.refresh_from_db()
+                left = available_stock([product])[product.id]
+                self.stdout.write(
+                    f'{"sharded" if shards else "single-row":>10}: {sold / elapsed:8.1f} sales/s '
+                    f'({sold} sold, {refused} refused, {failed} failed, {left} left)'
+                )
+                if left < 0 or sold + left != threads * sales - 1:
+                    self.stdout.write(self.style.ERROR('Stock does not add up'))
+        finally:
+            Sale.objects.filter(cashier__in=cashiers).delete()
+            StockMovement.objects.filter(created_by__in=cashiers).delete()
+            category.delete()
+            User.objects.filter(pk__in=[cashier.pk for cashier in cashiers]).delete()
+
+    def run_workers(self, cashiers, product_id, sales):
+        results = []
+        methods = [method for method, _ in Sale.PAYMENT_CHOICES]
+
+        def worker(cashier):
+            sold = refused = failed = 0
+            try:
+                for i in range(sales):
+                    try:
+                        checkout(cashier, [(product_id, 1)], payment_method=methods[i % len(methods)])
+                        sold += 1
+                    except CheckoutError:
+                        refused += 1
+                    except DatabaseError:
+                        failed += 1
+            finally:
+                connections.close_all()
+            results.append((sold, refused, failed))
+
+        workers = [Thread(target=worker, args=(cashier,)) for cashier in cashiers]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return elapsed, *(sum(column) for column in zip(*results))
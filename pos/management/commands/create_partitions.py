@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from pos.partitions import create_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create the month partitions of the sales tables ahead of time (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=settings.PARTITION_MONTHS_AHEAD,
+                            help='Months after the current one to cover')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f'{connection.vendor} tables are not partitioned; nothing to do')
+            return
+        created = create_partitions(options['months'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} partitions'))
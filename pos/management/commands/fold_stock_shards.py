@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from pos.stock_shards import fold_all
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded stock counters back into Product.stock_quantity and rebalance them'
+
+    def handle(self, *args, **options):
+        folded = fold_all()
+        self.stdout.write(self.style.SUCCESS(f'Folded stock shards for {folded} products'))
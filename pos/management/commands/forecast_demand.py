@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+import time
+from pos.forecasting import FORECAST_CHUNK_SIZE, update_reorder_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Forecast daily demand per product and update the reorder suggestions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Worker processes; default FORECAST_WORKERS')
+        parser.add_argument('--chunk-size', type=int, default=FORECAST_CHUNK_SIZE, help='Products per forecast block')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = update_reorder_suggestions(options['workers'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated reorder suggestions for {count} products in {time.perf_counter() - start:.1f} s'
+        ))
@@ -0,0 +1,27 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pos.alerts import NOTIFY_BATCH_SIZE, alert_line, drain_alerts, email_alerts
+
+
+class Command(BaseCommand):
+    help = 'Send queued low stock alerts, a batch per email (printed when LOW_STOCK_ALERT_EMAILS is empty)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=NOTIFY_BATCH_SIZE, help='Alerts per notification')
+        parser.add_argument('--poll', type=float,
+                            help='Keep running, checking the queue every POLL seconds; default is to drain once')
+
+    def handle(self, *args, **options):
+        notify = email_alerts if settings.LOW_STOCK_ALERT_EMAILS else self.print_alerts
+        while True:
+            sent = drain_alerts(notify, options['batch_size'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} low stock alerts'))
+            if not options['poll']:
+                break
+            time.sleep(options['poll'])
+
+    def print_alerts(self, alerts):
+        for alert in alerts:
+            self.stdout.write(alert_line(alert))
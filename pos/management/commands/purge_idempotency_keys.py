@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from datetime import timedelta
+from pos.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete checkout idempotency keys older than the configured TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='Override IDEMPOTENCY_KEY_TTL_HOURS')
+
+    def handle(self, *args, **options):
+        ttl = timedelta(hours=options['hours']) if options['hours'] is not None else None
+        deleted = purge_expired_keys(ttl)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
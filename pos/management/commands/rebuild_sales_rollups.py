@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from pos.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup from the sales, for backfill or repair'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD); default is the first sale')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD); default is the last sale')
+
+    def handle(self, *args, **options):
+        days = {}
+        for option in ('start', 'end'):
+            if options[option]:
+                days[option] = parse_date(options[option])
+                if days[option] is None:
+                    raise CommandError(f'Invalid --{option} date: {options[option]}')
+        written = rebuild(**days)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} daily rollup rows'))
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pathlib import Path
+import time
+from pos.reconcile import find_drift, fix_drift, write_report
+
+
+class Command(BaseCommand):
+    help = 'Replay the stock movement ledger and report (or fix) products whose stock has drifted from it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', help='Drift report CSV path; default is a dated file in REPORTS_DIR')
+        parser.add_argument('--fix', choices=['ledger', 'stock'],
+                            help="Correct drift: 'ledger' sets stock from the ledger, "
+                                 "'stock' records adjustments so the ledger matches stock")
+        parser.add_argument('--user', help="Username the adjustments are recorded under (--fix stock)")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['fix'] == 'stock':
+            if not options['user']:
+                raise CommandError('--fix stock needs --user')
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["user"]}')
+
+        start = time.perf_counter()
+        drift = find_drift()
+        elapsed = time.perf_counter() - start
+        report = options['report'] or Path(settings.REPORTS_DIR) / f'stock-drift-{timezone.localtime():%Y%m%d-%H%M%S}.csv'
+        write_report(drift, report)
+        self.stdout.write(
+            f'Checked {drift.checked} products in {elapsed:.1f} s: {len(drift)} drifted '
+            f'by {int(abs(drift.drift).sum())} units in total; report written to {report}'
+        )
+        if int(drift.sharded.sum()):
+            self.stdout.write(self.style.WARNING(
+                f'{int(drift.sharded.sum())} drifted products are sharded and are not corrected; '
+                'fold their shards first (fold_stock_shards)'
+            ))
+        unanchored = int((~drift.anchored).sum())
+        if unanchored:
+            self.stdout.write(self.style.WARNING(
+                f'{unanchored} drifted products have no opening balance in the ledger, so their ledger stock '
+                'is only a partial sum; --fix ledger skips them, --fix stock records their current stock'
+            ))
+
+        if options['fix'] and len(drift):
+            fixed = fix_drift(drift, options['fix'], user)
+            self.stdout.write(self.style.SUCCESS(f'Corrected {fixed} products'))
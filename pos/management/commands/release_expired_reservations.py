@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from pos.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release cart stock reservations whose TTL has passed'
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired stock reservations'))
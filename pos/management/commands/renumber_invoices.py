@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+import csv
+import re
+from pos.invoicing import (INVOICE_PREFIX, INVOICE_DIGITS, SEQUENCE_NAME, continue_sequence_after,
+                           format_invoice_number, sequence_started)
+from pos.models import InvoiceSequence, Sale, StockMovement
+
+
+class Command(BaseCommand):
+    help = ('Number legacy random invoices 1..N, oldest first, and start the ordered sequence after them. '
+            'Only possible before the sequence has issued any number; afterwards legacy numbers stay as they are.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--mapping-file', help='Write old,new invoice number pairs to this CSV file, '
+                                                   'so receipts printed with an old number can be looked up')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the invoices that would change')
+
+    def handle(self, *args, **options):
+        sequenced = rf'^{re.escape(INVOICE_PREFIX)}[0-9]{{{INVOICE_DIGITS}}}$'
+        legacy = Sale.objects.exclude(invoice_number__regex=sequenced).order_by('created_at', 'id')
+
+        total = legacy.count()
+        if options['dry_run'] or not total:
+            self.stdout.write(f'{total} invoices use the legacy numbering')
+            return
+        if not options['mapping_file']:
+            raise CommandError('--mapping-file is required: printed receipts keep their old numbers')
+
+        renumbered = 0
+        with transaction.atomic():
+            # Hold the sequence row so allocations on backends without a database sequence wait for us
+            InvoiceSequence.objects.select_for_update().filter(name=SEQUENCE_NAME).first()
+            if sequence_started() or Sale.objects.filter(invoice_number__regex=sequenced).exists():
+                raise CommandError(
+                    'Ordered invoice numbers have already been issued. Legacy invoices keep their numbers: '
+                    'renumbering them now would put old sales after newer ones.'
+                )
+
+            with open(options['mapping_file'], 'w', newline='') as mapping_file:
+                mapping = csv.writer(mapping_file)
+                # One pass, oldest first, so the legacy invoices come before every ordered one. Renumbered
+                # sales drop out of legacy, so each batch is its first rows.
+                while True:
+                    batch = list(legacy.only('id', 'invoice_number')[:options['batch_size']])
+                    if not batch:
+                        break
+                    renamed = {}
+                    for number, sale in enumerate(batch, start=renumbered + 1):
+                        renamed[sale.id] = (sale.invoice_number, format_invoice_number(number))
+                        sale.invoice_number = renamed[sale.id][1]
+                    Sale.objects.bulk_update(batch, ['invoice_number'])
+
+                    # Keep the sale references in the stock ledger readable
+                    movements = list(StockMovement.objects.filter(
+                        reference_type='sale', reference_id__in=list(renamed)
+                    ).only('id', 'reference_id', 'notes'))
+                    for movement in movements:
+                        old, new = renamed[movement.reference_id]
+                        movement.notes = movement.notes.replace(f'#{old}', f'#{new}')
+                    StockMovement.objects.bulk_update(movements, ['notes'])
+
+                    mapping.writerows(renamed.values())
+                    renumbered += len(batch)
+                    self.stdout.write(f'Renumbered {renumbered}/{total} invoices')
+
+            continue_sequence_after(renumbered)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Renumbered {renumbered} invoices; new invoices start at {format_invoice_number(renumbered + 1)}'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from pos.models import ReportJob
+from pos.reports import run_job
+
+
+class Command(BaseCommand):
+    help = 'Render queued report jobs, e.g. ones left pending by a restarted worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='Also retry jobs stuck in "running" (only when no worker is rendering)')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            ReportJob.objects.filter(status='running').update(status='pending')
+
+        rendered = 0
+        for job_id in ReportJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True):
+            if run_job(job_id):
+                rendered += 1
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} report jobs'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from pos.models import Product
+from pos.stock_shards import set_shards
+
+
+class Command(BaseCommand):
+    help = 'Split the stock of hot products over several counter rows (0 shards turns it off)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='+', type=int)
+        parser.add_argument('--shards', type=int, default=8, help='Number of counter rows per product')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError('--shards must be between 0 and 256')
+
+        for product_id in options['product_ids']:
+            try:
+                product = set_shards(product_id, options['shards'])
+            except Product.DoesNotExist:
+                raise CommandError(f'Product {product_id} does not exist')
+            self.stdout.write(f'{product.name}: {product.stock_quantity} units over {product.stock_shards} shards')
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:00
+
+from django.db import migrations, models
+
+SEQUENCE_NAME = "pos_invoice_number_seq"
+
+
+def create_invoice_sequence(apps, schema_editor):
+    InvoiceSequence = apps.get_model("pos", "InvoiceSequence")
+    InvoiceSequence.objects.get_or_create(name=SEQUENCE_NAME)
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME} START 1")
+
+
+def drop_invoice_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0003_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceSequence",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("last_value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_invoice_sequence, drop_invoice_sequence),
+    ]
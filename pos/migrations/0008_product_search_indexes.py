@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:10
+
+from django.db import migrations
+
+INDEXES = {
+    "pos_product_name_trgm": "name",
+    "pos_product_barcode_trgm": "barcode",
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return  # other backends search an in-memory index (pos.search.ProductIndex)
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for index, column in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index} ON pos_product USING gin ({column} gin_trgm_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for index in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0007_dataversion"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
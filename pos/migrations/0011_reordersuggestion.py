@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0010_reportjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReorderSuggestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("daily_demand", models.FloatField(help_text="Smoothed units per day")),
+                (
+                    "demand_deviation",
+                    models.FloatField(
+                        help_text="Typical daily forecast error in units"
+                    ),
+                ),
+                ("reorder_point", models.IntegerField()),
+                ("reorder_quantity", models.IntegerField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reorder_suggestion",
+                        to="pos.product",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:44
+
+from datetime import date, datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+TABLES = ["pos_saleitem", "pos_stockmovement", "pos_sale"]
+# Month partitions made beyond the current month (the create_partitions command keeps this up)
+MONTHS_AHEAD = 3
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(month):
+    return timezone.make_aware(datetime.combine(month, datetime.min.time())).isoformat()
+
+
+def rebuild_table(cursor, table, partitioned):
+    """Recreate table as a month-partitioned table (or back as a plain one) and move its rows over.
+
+    Primary keys and unique indexes on a partitioned table must include the
+    partition key, so they gain created_at; the id sequence, secondary
+    indexes and foreign keys are recreated as they were.
+    """
+    old = f"{table}_old"
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+        "AND indexname <> %s",
+        [table, f"{table}_pkey"],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        "SELECT attidentity <> '' FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [table]
+    )
+    identity = cursor.fetchone()[0]
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f"SELECT min(created_at) FROM {table}")
+    first = cursor.fetchone()[0]
+
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    cursor.execute(
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        + (" PARTITION BY RANGE (created_at)" if partitioned else "")
+    )
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id DROP DEFAULT")
+    if partitioned:
+        cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        this_month = timezone.localdate().replace(day=1)
+        month = min(timezone.localtime(first).date().replace(day=1), this_month) if first else this_month
+        while month <= add_months(this_month, MONTHS_AHEAD):
+            following = add_months(month, 1)
+            cursor.execute(
+                f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month_start(month)}') TO ('{month_start(following)}')"
+            )
+            month = following
+
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    if sequence and not identity:
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cursor.execute(f"DROP TABLE {old}")
+
+    sequence = sequence if sequence and not identity else f"{table}_id_seq"
+    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence}")
+    cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    cursor.execute(f"SELECT setval('{sequence}', COALESCE(MAX(id), 0) + 1, false) FROM {table}")
+
+    key = "id, created_at" if partitioned else "id"
+    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({key})")
+    for definition in indexes:
+        if definition.startswith("CREATE UNIQUE INDEX"):
+            columns = definition[definition.rindex("(") + 1:-1]
+            if partitioned:
+                columns += ", created_at"
+            else:
+                columns = columns.replace(", created_at", "")
+            definition = definition[:definition.rindex("(") + 1] + columns + ")"
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return  # declarative partitioning is PostgreSQL only; archive_partitions works either way
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            rebuild_table(cursor, table, partitioned=True)
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            rebuild_table(cursor, table, partitioned=False)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0011_reordersuggestion"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="saleitem",
+            name="sale",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="items",
+                to="pos.sale",
+            ),
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def flag_low_stock(apps, schema_editor):
+    """Set the flag on products already at or under their minimum or reorder point, without alerts"""
+    Product = apps.get_model("pos", "Product")
+    Product.objects.filter(
+        models.Q(stock_quantity__lte=models.F("min_stock_level"))
+        | models.Q(reorder_suggestion__reorder_point__gte=models.F("stock_quantity"))
+    ).update(is_low_stock=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0012_partition_sales_by_month"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LowStockAlert",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("low", "Low Stock"), ("restocked", "Restocked")],
+                        max_length=10,
+                    ),
+                ),
+                ("stock_quantity", models.IntegerField()),
+                (
+                    "reorder_level",
+                    models.IntegerField(
+                        help_text="The higher of the minimum stock level and the reorder point"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="is_low_stock",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_low_stock", True)),
+                fields=["name"],
+                name="pos_product_low_stock",
+            ),
+        ),
+        migrations.AddField(
+            model_name="lowstockalert",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="low_stock_alerts",
+                to="pos.product",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lowstockalert",
+            index=models.Index(
+                condition=models.Q(("sent_at__isnull", True)),
+                fields=["id"],
+                name="pos_alert_unsent",
+            ),
+        ),
+        migrations.RunPython(flag_low_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0013_low_stock_flag_and_alerts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(fields=["created_at", "id"], name="pos_sale_created"),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["cashier", "created_at"], name="pos_sale_cashier_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["payment_method", "created_at"], name="pos_sale_payment_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="saleitem",
+            index=models.Index(
+                fields=["product", "created_at"], name="pos_saleitem_product_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(fields=["created_at"], name="pos_movement_created"),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["product", "created_at"], name="pos_movement_product_created"
+            ),
+        ),
+    ]
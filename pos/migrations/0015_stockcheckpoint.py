@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0014_sales_access_path_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.IntegerField(
+                        help_text="Stock after every movement of the product up to movement_id"
+                    ),
+                ),
+                (
+                    "movement_id",
+                    models.BigIntegerField(
+                        default=0, help_text="Last stock movement counted in quantity"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_checkpoint",
+                        to="pos.product",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:40
+
+from django.db import migrations
+
+INDEX = "pos_product_name_upper_trgm"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    # name__icontains compiles to UPPER("name"::text) LIKE UPPER(%s), which only an index on that
+    # expression can serve; pos_product_name_trgm still serves the % similarity operator
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX} ON pos_product USING gin ((UPPER(name::text)) gin_trgm_ops)"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0015_stockcheckpoint"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:39
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import TruncMonth
+import django.utils.timezone
+
+BATCH_SIZE = 5000
+REGISTRY = "pos_invoice_registry"
+TRIGGER = "pos_sale_invoice_number_unique"
+
+
+def stamp_lines_with_sale_month(apps, schema_editor):
+    """Give lines saved in a later month than their sale (just before midnight) the sale's created_at"""
+    Sale = apps.get_model("pos", "Sale")
+    SaleItem = apps.get_model("pos", "SaleItem")
+    stray = list(
+        SaleItem.objects.annotate(line_month=TruncMonth("created_at"), sale_month=TruncMonth("sale__created_at"))
+        .exclude(line_month=F("sale_month")).values_list("pk", flat=True)
+    )
+    sale_created = Sale.objects.filter(pk=OuterRef("sale_id")).values("created_at")[:1]
+    for start in range(0, len(stray), BATCH_SIZE):
+        SaleItem.objects.filter(pk__in=stray[start:start + BATCH_SIZE]).update(created_at=Subquery(sale_created))
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table])
+    return cursor.fetchone() is not None
+
+
+def create_invoice_registry(apps, schema_editor):
+    """Keep invoice numbers unique across every month of the partitioned sale table.
+
+    The partitioned table's unique index has to include created_at, so it
+    only stops duplicates within the same instant. A trigger records each
+    number in a plain table with a unique key instead; numbers of archived
+    sales stay there, so they are never issued again.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return  # elsewhere pos_sale keeps its own unique index on invoice_number
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor, "pos_sale"):
+            return
+        cursor.execute(f"CREATE TABLE {REGISTRY} (invoice_number varchar(50) PRIMARY KEY)")
+        cursor.execute(
+            f"INSERT INTO {REGISTRY} SELECT DISTINCT invoice_number FROM pos_sale ON CONFLICT DO NOTHING"
+        )
+        cursor.execute(f"""
+            CREATE FUNCTION {REGISTRY}_add() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' THEN
+                    IF NEW.invoice_number = OLD.invoice_number THEN
+                        RETURN NULL;
+                    END IF;
+                    DELETE FROM {REGISTRY} WHERE invoice_number = OLD.invoice_number;
+                END IF;
+                INSERT INTO {REGISTRY} (invoice_number) VALUES (NEW.invoice_number);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute(
+            f"CREATE TRIGGER {TRIGGER} AFTER INSERT OR UPDATE OF invoice_number ON pos_sale "
+            f"FOR EACH ROW EXECUTE FUNCTION {REGISTRY}_add()"
+        )
+
+
+def drop_invoice_registry(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {TRIGGER} ON pos_sale")
+        cursor.execute(f"DROP FUNCTION IF EXISTS {REGISTRY}_add()")
+        cursor.execute(f"DROP TABLE IF EXISTS {REGISTRY}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0016_product_name_upper_trgm"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="saleitem",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.RunPython(stamp_lines_with_sale_month, migrations.RunPython.noop),
+        migrations.RunPython(create_invoice_registry, drop_invoice_registry),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0017_saleitem_sale_month_and_invoice_registry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["updated_at"], name="pos_product_updated"),
+        ),
+    ]
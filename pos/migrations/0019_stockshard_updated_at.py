@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:58
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0018_product_updated_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockshard",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="stockshard",
+            index=models.Index(fields=["updated_at"], name="pos_shard_updated"),
+        ),
+    ]
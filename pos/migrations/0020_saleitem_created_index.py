@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:00
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def stamp_lines_with_sale_time(apps, schema_editor):
+    """Give every line its sale's exact created_at, so date filters on the lines match their sales'.
+
+    0017 only moved the lines that sat in another month than their sale.
+    """
+    Sale = apps.get_model("pos", "Sale")
+    SaleItem = apps.get_model("pos", "SaleItem")
+    stray = list(SaleItem.objects.exclude(created_at=F("sale__created_at")).values_list("pk", flat=True))
+    sale_created = Sale.objects.filter(pk=OuterRef("sale_id")).values("created_at")[:1]
+    for start in range(0, len(stray), BATCH_SIZE):
+        SaleItem.objects.filter(pk__in=stray[start:start + BATCH_SIZE]).update(created_at=Subquery(sale_created))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pos", "0019_stockshard_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(stamp_lines_with_sale_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="saleitem",
+            index=models.Index(fields=["created_at"], name="pos_saleitem_created"),
+        ),
+    ]
@@ -1,8 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
 import uuid
+from .invoicing import allocator
+
+
+def new_invoice_number():
+    return allocator.allocate()[0]
 
 
 class UserProfile(models.Model):
@@ -41,22 +47,27 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     stock_quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     min_stock_level = models.IntegerField(default=5)
+    stock_shards = models.PositiveSmallIntegerField(
+        default=0, help_text='Split stock over this many counter rows for hot items (0 = off)'
+    )
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    # Kept by pos.alerts.refresh_low_stock whenever stock or the reorder levels change
+    is_low_stock = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], condition=models.Q(is_low_stock=True), name='pos_product_low_stock'),
+            models.Index(fields=['updated_at'], name='pos_product_updated'),  # catalog deltas
+        ]
 
     def __str__(self):
         return self.name
 
-    @property
-    def is_low_stock(self):
-        return self.stock_quantity <= self.min_stock_level
-
     @property
     def image_url(self):
         if self.image:
@@ -71,6 +82,7 @@ class Sale(models.Model):
         ('digital', 'Digital Payment'),
     ]
 
+    # Once sales are partitioned on PostgreSQL, the pos_invoice_registry trigger (0017) keeps this unique
     invoice_number = models.CharField(max_length=50, unique=True)
     cashier = models.ForeignKey(User, on_delete=models.CASCADE)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -80,34 +92,50 @@ class Sale(models.Model):
     payment_method = models.CharField(max_length=20, choices=PAYMENT_CHOICES)
     customer_name = models.CharField(max_length=100, blank=True)
     customer_phone = models.CharField(max_length=15, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # When the sale was rung up: sales synced from an offline till keep the till's time (checkout.queued_time)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     notes = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='pos_sale_created'),
+            models.Index(fields=['cashier', 'created_at'], name='pos_sale_cashier_created'),
+            models.Index(fields=['payment_method', 'created_at'], name='pos_sale_payment_created'),
+        ]
 
     def __str__(self):
         return f"Invoice #{self.invoice_number}"
 
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            self.invoice_number = f"INV-{uuid.uuid4().hex[:8].upper()}"
+            self.invoice_number = new_invoice_number()
         super().save(*args, **kwargs)
 
 
 class SaleItem(models.Model):
-    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='items')
+    # No database constraint: a foreign key cannot point at the month-partitioned sale table
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='items', db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # The sale's created_at, so a line always sits in its sale's month partition and is archived with it
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='pos_saleitem_product_created'),
+            models.Index(fields=['created_at'], name='pos_saleitem_created'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
     def save(self, *args, **kwargs):
         self.total_price = self.quantity * self.unit_price
+        if self._state.adding and self.sale.created_at:
+            self.created_at = self.sale.created_at
         super().save(*args, **kwargs)
 
 
@@ -129,6 +157,170 @@ class StockMovement(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='pos_movement_created'),
+            models.Index(fields=['product', 'created_at'], name='pos_movement_product_created'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.movement_type} - {self.quantity}"
+
+
+class SalesDailyRollup(models.Model):
+    date = models.DateField()
+    cashier = models.ForeignKey(User, on_delete=models.CASCADE)
+    payment_method = models.CharField(max_length=20, choices=Sale.PAYMENT_CHOICES)
+    sale_count = models.IntegerField(default=0)
+    gross_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    items_sold = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'cashier', 'payment_method'], name='unique_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.cashier.username} - {self.payment_method}"
+
+
+class StockShard(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Sales leave Product.updated_at alone for sharded products, so catalog deltas look here too
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_stock_shard'),
+        ]
+        indexes = [
+            models.Index(fields=['updated_at'], name='pos_shard_updated'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} #{self.shard} - {self.quantity}"
+
+
+class StockCheckpoint(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='stock_checkpoint')
+    quantity = models.IntegerField(help_text='Stock after every movement of the product up to movement_id')
+    movement_id = models.BigIntegerField(default=0, help_text='Last stock movement counted in quantity')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product.name} - {self.quantity} at movement {self.movement_id}"
+
+
+class StockReservation(models.Model):
+    cart_id = models.CharField(max_length=64)
+    cashier = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart_id', 'product'], name='unique_reservation_per_cart'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_expiry'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity} ({self.cart_id})"
+
+
+class InvoiceSequence(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.last_value}"
+
+
+class DataVersion(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.key}"
+
+
+class ReportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30)
+    params = models.JSONField(default=dict)
+    cache_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
+
+
+class ReorderSuggestion(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='reorder_suggestion')
+    daily_demand = models.FloatField(help_text='Smoothed units per day')
+    demand_deviation = models.FloatField(help_text='Typical daily forecast error in units')
+    reorder_point = models.IntegerField()
+    reorder_quantity = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product.name} - reorder at {self.reorder_point}"
+
+
+class LowStockAlert(models.Model):
+    KIND_CHOICES = [
+        ('low', 'Low Stock'),
+        ('restocked', 'Restocked'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='low_stock_alerts')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    stock_quantity = models.IntegerField()
+    reorder_level = models.IntegerField(help_text='The higher of the minimum stock level and the reorder point')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(sent_at__isnull=True), name='pos_alert_unsent'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} - {self.get_kind_display()} ({self.stock_quantity})"
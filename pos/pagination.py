@@ -0,0 +1,100 @@
+import base64
+import json
+
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_token(direction, sale):
+    payload = json.dumps({'d': direction, 'c': sale.created_at.isoformat(), 'i': sale.pk})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return (direction, created_at, id) for a page token, or None if it is not one of ours"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        created_at = parse_datetime(payload['c'])
+        if payload['d'] not in ('next', 'prev') or created_at is None:
+            return None
+        return payload['d'], created_at, int(payload['i'])
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+def estimated_count(queryset):
+    """Row count the query planner expects for queryset, or None where there is no planner estimate"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+    except (DatabaseError, ValueError):
+        return None
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_previous, has_next, estimated_count=None):
+        self.object_list = object_list
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self.estimated_count = estimated_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    @property
+    def previous_token(self):
+        return encode_token('prev', self.object_list[0]) if self.has_previous and self.object_list else None
+
+    @property
+    def next_token(self):
+        return encode_token('next', self.object_list[-1]) if self.has_next and self.object_list else None
+
+
+class KeysetPaginator:
+    """Newest-first pages over (created_at, id) without COUNT(*) or OFFSET.
+
+    A page is fetched by seeking past the edge row of the page before it,
+    so deep pages cost the same as the first one. Page tokens are opaque
+    strings; an unknown or stale token just returns the first page.
+    """
+
+    def __init__(self, queryset, per_page, estimate_count=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.estimate_count = estimate_count
+
+    def page(self, token=None):
+        cursor = decode_token(token) if token else None
+        newest_first = self.queryset.order_by('-created_at', '-id')
+        if cursor is None:
+            rows = list(newest_first[:self.per_page + 1])
+            has_previous, has_next = False, len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        elif cursor[0] == 'next':
+            _, created_at, pk = cursor
+            rows = list(newest_first.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )[:self.per_page + 1])
+            has_previous, has_next = True, len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        else:
+            # Walk back oldest-first from the edge, then flip the page into display order
+            _, created_at, pk = cursor
+            rows = list(self.queryset.order_by('created_at', 'id').filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            )[:self.per_page + 1])
+            has_previous, has_next = len(rows) > self.per_page, True
+            rows = rows[:self.per_page][::-1]
+
+        count = estimated_count(self.queryset) if self.estimate_count else None
+        return KeysetPage(rows, has_previous, has_next, count)
@@ -0,0 +1,163 @@
+import csv
+import gzip
+from datetime import date, datetime
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import versions
+from .models import Sale, SaleItem, StockMovement
+from .reconcile import checkpoint_month
+
+# Child tables before their parents. Sale lines carry their sale's created_at, so a month's lines are
+# exactly its sales' lines; stock movements only name sales by reference_id, and the ledger replay
+# is checkpointed before their month goes
+PARTITIONED_MODELS = [SaleItem, StockMovement, Sale]
+PARTITION_KEY = 'created_at'
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """[start, end) of a local calendar month as aware datetimes"""
+    return (timezone.make_aware(datetime.combine(month, datetime.min.time())),
+            timezone.make_aware(datetime.combine(add_months(month, 1), datetime.min.time())))
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def is_partitioned(table):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def monthly_partitions(table):
+    """The month partitions of table as {month: partition name}, leaving out the default partition"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)', [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        suffix = name[len(table) + 2:]  # after "<table>_p"
+        try:
+            partitions[date(int(suffix[:4]), int(suffix[5:7]), 1)] = name
+        except ValueError:
+            continue
+    return partitions
+
+
+def create_partition(cursor, table, month):
+    start, end = month_bounds(month)
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def create_partitions(months_ahead, first_month=None):
+    """Make sure each partitioned table has a partition for every month from first_month
+    (this month by default) to months_ahead months after this one.
+
+    Returns the number of partitions created. Backends without partitioning
+    return 0.
+    """
+    this_month = month_start(timezone.localdate())
+    first_month = first_month or this_month
+    created = 0
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            continue
+        existing = monthly_partitions(table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            month = first_month
+            while month <= add_months(this_month, months_ahead):
+                if month not in existing:
+                    create_partition(cursor, table, month)
+                    created += 1
+                month = add_months(month, 1)
+    return created
+
+
+def archive_path(directory, table, month):
+    return Path(directory) / f'{partition_name(table, month)}.csv.gz'
+
+
+def export_month(model, month, path, batch_size):
+    """Write a month of model's rows to a gzipped CSV, batch_size rows per fetch; returns the row count"""
+    start, end = month_bounds(month)
+    columns = [field.attname for field in model._meta.concrete_fields]
+    rows = (model.objects.filter(**{f'{PARTITION_KEY}__gte': start, f'{PARTITION_KEY}__lt': end})
+            .order_by('pk').values_list(*columns))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix('.part')
+    count = 0
+    with gzip.open(partial, 'wt', newline='') as archive:
+        writer = csv.writer(archive)
+        writer.writerow(columns)
+        for row in rows.iterator(chunk_size=batch_size):
+            writer.writerow(row)
+            count += 1
+    partial.replace(path)
+    return count
+
+
+def drop_month(model, month, batch_size):
+    """Remove a month of model's rows: the whole partition where there is one, else in batches.
+
+    Rows go straight out with SQL, without delete signals, so the daily
+    sales rollup keeps the archived sales.
+    """
+    table = model._meta.db_table
+    if is_partitioned(table):
+        partition = monthly_partitions(table).get(month)
+        if partition:
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {partition}')
+                cursor.execute(f'DROP TABLE {partition}')
+            return
+
+    start, end = month_bounds(month)
+    month_rows = model.objects.filter(**{f'{PARTITION_KEY}__gte': start, f'{PARTITION_KEY}__lt': end})
+    quoted = connection.ops.quote_name(table)
+    while True:
+        ids = list(month_rows.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {quoted} WHERE id IN ({", ".join(["%s"] * len(ids))})', ids)
+
+
+def archive_month(month, directory, batch_size):
+    """Export one month of every partitioned table to files, then drop it from the database.
+
+    Returns {table: rows archived}. A table's month is only dropped once
+    its file is complete.
+    """
+    archived = {}
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        archived[table] = export_month(model, month, archive_path(directory, table, month), batch_size)
+        if model is StockMovement:
+            checkpoint_month(*month_bounds(month))  # the ledger replay must not need the dropped movements
+        drop_month(model, month, batch_size)
+    versions.bump(versions.SALES)  # reports counting sales over the month must recount
+    return archived
@@ -0,0 +1,139 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import versions
+from .models import Product, SaleItem
+from .product_cache import LRUCache
+from .sales_filters import created_on
+
+# Cumulative revenue share (percent) that closes classes A and B; the rest is C
+ABC_LIMITS = (80.0, 95.0)
+SORT_FIELDS = ['revenue', 'units', 'velocity', 'share', 'name']
+# Date ranges whose report is kept per worker
+REPORT_CACHE_SIZE = 32
+
+
+class ProductPerformance:
+    """Units, revenue, revenue share and ABC class of every product over a date range.
+
+    The figures are kept as parallel arrays so the report can be re-sorted
+    and filtered without going back to the database.
+    """
+
+    def __init__(self, start, end, rows):
+        self.start, self.end = start, end
+        days = (end - start).days + 1
+        ids, names, categories, units, revenue = zip(*rows) if rows else ((),) * 5
+        self.ids = np.array(ids, dtype=np.int64)
+        self.names = np.array(names, dtype=object)
+        self.lower_names = np.char.lower(np.array(names, dtype=str))
+        self.categories = np.array(categories, dtype=object)
+        self.units = np.array([value or 0 for value in units], dtype=np.int64)
+        self.revenue = np.array([value or 0 for value in revenue], dtype=np.float64)
+        self.velocity = self.units / days
+
+        # Rank by revenue, best first, ties by id; classes follow the running share
+        order = np.lexsort((self.ids, -self.revenue))
+        self.rank = np.empty(len(order), dtype=np.int64)
+        self.rank[order] = np.arange(1, len(order) + 1)
+        self.total_revenue = float(self.revenue.sum())
+        if self.total_revenue:
+            self.share = self.revenue / self.total_revenue * 100
+        else:
+            self.share = np.zeros(len(order))
+        cumulative = np.empty(len(order))
+        cumulative[order] = np.cumsum(self.share[order])
+        self.cumulative_share = cumulative
+        # A product belongs to the class its share starts in
+        before = cumulative - self.share
+        self.abc = np.where(before < ABC_LIMITS[0], 'A', np.where(before < ABC_LIMITS[1], 'B', 'C'))
+        self.abc[self.revenue <= 0] = 'C'
+
+    def __len__(self):
+        return len(self.ids)
+
+    def class_counts(self):
+        return {abc: int((self.abc == abc).sum()) for abc in 'ABC'}
+
+    def rows(self, sort='revenue', descending=True, abc=None, category=None, search=None):
+        """The report rows, filtered and sorted in memory"""
+        keep = np.ones(len(self.ids), dtype=bool)
+        if abc:
+            keep &= self.abc == abc
+        if category:
+            keep &= self.categories == category
+        if search:
+            keep &= np.char.find(self.lower_names, search.lower()) >= 0
+
+        indexes = np.flatnonzero(keep)
+        if sort == 'name':
+            key = np.unique(self.lower_names[indexes], return_inverse=True)[1]
+        else:
+            key = getattr(self, sort)[indexes]
+        # Ties keep revenue rank order
+        indexes = indexes[np.lexsort((self.rank[indexes], -key if descending else key))]
+
+        return [
+            {
+                'id': int(self.ids[i]),
+                'rank': int(self.rank[i]),
+                'name': self.names[i],
+                'category': self.categories[i],
+                'units': int(self.units[i]),
+                'velocity': round(float(self.velocity[i]), 2),
+                'revenue': round(float(self.revenue[i]), 2),
+                'share': round(float(self.share[i]), 2),
+                'cumulative_share': round(float(self.cumulative_share[i]), 2),
+                'abc': str(self.abc[i]),
+            }
+            for i in indexes
+        ]
+
+
+def product_performance_rows(start, end):
+    """(id, name, category, units, revenue) of every product over the local dates start..end.
+
+    The figures come from one grouped query over the range's SaleItem rows
+    joined to Product; products that sold nothing are added with zeros.
+    """
+    items = SaleItem.objects.filter(created_on(start, end))
+    sold = list(
+        items.values_list('product_id', 'product__name', 'product__category__name')
+        .annotate(units=Sum('quantity'), revenue=Sum('total_price')).order_by()
+    )
+    unsold = Product.objects.exclude(pk__in=items.values('product_id')).values_list('id', 'name', 'category__name')
+    return sold + [row + (0, 0) for row in unsold]
+
+
+class PerformanceCache:
+    """Per-worker reports by date range and data version.
+
+    Catalog edits and sale corrections move the versions; new sales move
+    neither, so a report whose range reaches today is also rebuilt after
+    PRODUCT_REPORT_TTL_SECONDS.
+    """
+
+    def __init__(self, maxsize=REPORT_CACHE_SIZE):
+        self._reports = LRUCache(maxsize)
+
+    def get(self, start, end):
+        key = (start, end, versions.current(versions.CATALOG), versions.current(versions.SALES))
+        entry = self._reports.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            built_at, report = entry
+            if end < timezone.localdate() or now - built_at < settings.PRODUCT_REPORT_TTL_SECONDS:
+                return report
+        report = ProductPerformance(start, end, product_performance_rows(start, end))
+        self._reports.set(key, (now, report))
+        return report
+
+    def clear(self):
+        self._reports.clear()
+
+
+performance_cache = PerformanceCache()
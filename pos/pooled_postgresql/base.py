@@ -0,0 +1,133 @@
+"""PostgreSQL backend whose connections come from a per-worker pool.
+
+Django's persistent connections (CONN_MAX_AGE) keep one connection per
+thread for its whole life. With this backend a thread borrows a
+connection when it first queries in a request and hands it back when
+Django closes it at the end of the request, so a worker's threads share
+at most DB_POOL_SIZE connections and none pays for a new one per request.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Idle connections to one database, shared by the threads of a worker.
+
+    At most size connections are out at once; a thread that finds none
+    free waits up to timeout seconds. A connection that has been idle for
+    longer than check_after seconds answers a SELECT 1 before it is handed
+    out again, and dead ones are replaced.
+    """
+
+    def __init__(self, size, timeout, check_after):
+        self.size = size
+        self.timeout = timeout
+        self.check_after = check_after
+        self._idle = []  # (connection, idle since), most recently used last
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, connect):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OperationalError(f'No database connection free in the pool within {self.timeout} s')
+        try:
+            while True:
+                with self._lock:
+                    connection, idle_since = self._idle.pop() if self._idle else (None, None)
+                if connection is None:
+                    return connect()
+                if self.healthy(connection, idle_since):
+                    return connection
+                self.discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection):
+        """Take a connection back, rolling back anything it left open"""
+        try:
+            if connection.closed:
+                return
+            if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except Exception:
+                    self.discard(connection)
+                    return
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def healthy(self, connection, idle_since):
+        if connection.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+
+def pool_for(wrapper):
+    """The pool for a connection's alias and target; a renamed database (as in tests) gets its own"""
+    settings_dict = wrapper.settings_dict
+    key = (wrapper.alias, settings_dict['NAME'], settings_dict['USER'], settings_dict['HOST'], settings_dict['PORT'])
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT, settings.DB_POOL_CHECK_SECONDS
+            )
+        return _pools[key]
+
+
+def close_pools(name):
+    """Close the idle pooled connections to database name"""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[1] == name]
+    for pool in pools:
+        pool.close_all()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # PostgreSQL will not drop a database that pooled connections still hold open
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        # New connections are still made by Django, so they get its usual setup
+        connect = super().get_new_connection
+        return pool_for(self).acquire(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                pool_for(self).release(self.connection)
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import versions
+from .models import Product
+
+MISSING = object()
+
+
+class LRUCache:
+    """A bounded, thread-safe mapping that evicts the least recently used key"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def product_record(product):
+    """The catalog fields a till needs for a scanned product.
+
+    Stock is left out: it changes with every sale and is checked when the
+    item is reserved and paid for.
+    """
+    return {
+        'id': product.id,
+        'name': product.name,
+        'barcode': product.barcode,
+        'price': str(product.price),
+        'category_id': product.category_id,
+        'image_url': product.image_url,
+    }
+
+
+class BarcodeCache:
+    """Per-worker cache of active products by barcode, dropped whenever the catalog version moves"""
+
+    def __init__(self, maxsize=None):
+        self._entries = LRUCache(maxsize or settings.BARCODE_CACHE_SIZE)
+        self._version = None
+
+    def lookup(self, barcode):
+        """Return the product record for barcode, or None if no active product has it"""
+        version = versions.current(versions.CATALOG)
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+        record = self._entries.get(barcode, MISSING)
+        if record is MISSING:
+            product = Product.objects.filter(barcode=barcode, is_active=True).first()
+            # Unknown codes are cached too, so a bad label does not hit the database on every scan
+            record = product_record(product) if product else None
+            self._entries.set(barcode, record)
+        return record
+
+    def clear(self):
+        self._entries.clear()
+
+
+barcode_cache = BarcodeCache()
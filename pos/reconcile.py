@@ -0,0 +1,209 @@
+import csv
+from pathlib import Path
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Case, F, When
+
+from . import versions
+from .alerts import refresh_low_stock
+from .models import Product, StockCheckpoint, StockMovement, StockShard
+
+# Products locked and corrected per transaction
+FIX_BATCH_SIZE = 500
+REPORT_HEADER = ['product_id', 'name', 'stock', 'ledger_stock', 'drift', 'movements', 'sharded', 'anchored']
+
+
+def ledger_sql(product_ids=None, through=None):
+    """One statement reading each product's stock next to its ledger replay.
+
+    The replay starts from the later of the product's latest 'adjustment'
+    (which sets stock outright) and its StockCheckpoint (the balance left
+    by its opening stock and any archived movements), and adds the signed
+    'in' and 'out' movements after it. A product with neither has no
+    anchor: its replay starts from zero and is not a real balance. Both
+    sides come from the same statement, so they are read from one snapshot.
+
+    through=(start, end) stops each product's replay at its last movement
+    created in [start, end), leaves out products without one, and adds
+    that movement's id and the current checkpoint's as two more columns.
+    """
+    product = Product._meta.db_table
+    movement = StockMovement._meta.db_table
+    checkpoint = StockCheckpoint._meta.db_table
+    shard = StockShard._meta.db_table
+    params = []
+    bound = ''
+    bounded = ''
+    if through:
+        bound = f"""
+            bound AS (
+                SELECT product_id, MAX(id) AS last FROM {movement}
+                WHERE created_at >= %s AND created_at < %s GROUP BY product_id
+            ),"""
+        bounded = 'JOIN bound b ON b.product_id = m.product_id AND m.id <= b.last'
+        params += list(through)
+    where = ''
+    if product_ids:
+        where = f'WHERE p.id IN ({", ".join(["%s"] * len(product_ids))})'
+        params += list(product_ids)
+    return f"""
+        WITH {bound}
+        adjusted AS (
+            SELECT m.product_id, MAX(m.id) AS id FROM {movement} m {bounded}
+            WHERE m.movement_type = 'adjustment' GROUP BY m.product_id
+        ),
+        replayed AS (
+            SELECT m.product_id,
+                   SUM(CASE m.movement_type WHEN 'in' THEN m.quantity
+                                            WHEN 'out' THEN -m.quantity
+                                            ELSE m.quantity END) AS stock,
+                   COUNT(*) AS movements
+            FROM {movement} m {bounded}
+            LEFT JOIN adjusted a ON a.product_id = m.product_id
+            LEFT JOIN {checkpoint} c ON c.product_id = m.product_id
+            WHERE m.id > COALESCE(c.movement_id, 0) AND (a.id IS NULL OR m.id >= a.id)
+            GROUP BY m.product_id
+        )
+        SELECT p.id, p.name,
+               CASE WHEN p.stock_shards > 0 THEN COALESCE(s.total, 0) ELSE p.stock_quantity END,
+               CASE WHEN a.id > COALESCE(c.movement_id, 0) THEN 0 ELSE COALESCE(c.quantity, 0) END
+                   + COALESCE(l.stock, 0),
+               COALESCE(l.movements, 0), p.stock_shards > 0, a.id IS NOT NULL OR c.id IS NOT NULL
+               {', b.last, COALESCE(c.movement_id, 0)' if through else ''}
+        FROM {product} p
+        {'JOIN bound b ON b.product_id = p.id' if through else ''}
+        LEFT JOIN adjusted a ON a.product_id = p.id
+        LEFT JOIN {checkpoint} c ON c.product_id = p.id
+        LEFT JOIN replayed l ON l.product_id = p.id
+        LEFT JOIN (
+            SELECT product_id, SUM(quantity) AS total FROM {shard} GROUP BY product_id
+        ) s ON s.product_id = p.id
+        {where}
+    """, params
+
+
+class Drift:
+    """Products whose stock differs from their ledger, as parallel arrays"""
+
+    def __init__(self, rows):
+        ids, names, stock, ledger, movements, sharded, anchored = zip(*rows) if rows else ((),) * 7
+        self.checked = len(ids)
+        stock = np.array(stock, dtype=np.int64)
+        ledger = np.array(ledger, dtype=np.int64)
+        drifted = stock != ledger
+        self.ids = np.array(ids, dtype=np.int64)[drifted]
+        self.names = np.array(names, dtype=object)[drifted]
+        self.stock = stock[drifted]
+        self.ledger = ledger[drifted]
+        self.drift = self.stock - self.ledger
+        self.movements = np.array(movements, dtype=np.int64)[drifted]
+        self.sharded = np.array(sharded, dtype=bool)[drifted]
+        self.anchored = np.array(anchored, dtype=bool)[drifted]
+
+    def only(self, mask):
+        """The drift of the products where mask is true"""
+        subset = Drift([])
+        subset.checked = self.checked
+        for name in ('ids', 'names', 'stock', 'ledger', 'drift', 'movements', 'sharded', 'anchored'):
+            setattr(subset, name, getattr(self, name)[mask])
+        return subset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self):
+        return zip(self.ids.tolist(), self.names.tolist(), self.stock.tolist(), self.ledger.tolist(),
+                   self.drift.tolist(), self.movements.tolist(), self.sharded.tolist(), self.anchored.tolist())
+
+
+def find_drift(product_ids=None):
+    with connection.cursor() as cursor:
+        cursor.execute(*ledger_sql(product_ids))
+        return Drift(cursor.fetchall())
+
+
+def write_report(drift, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as report:
+        writer = csv.writer(report)
+        writer.writerow(REPORT_HEADER)
+        writer.writerows(drift.rows())
+    return path
+
+
+def fix_drift(drift, trust, user=None):
+    """Bring stock and ledger back in line for the drifted, unsharded products.
+
+    trust='ledger' moves stock_quantity by the drift, and leaves out
+    products without an anchor, whose ledger is not a balance to trust;
+    trust='stock' records an adjustment movement of the current stock
+    (needs user), which also anchors the product. Products are locked and
+    their drift re-read in batches first, so sales made since the report
+    are not undone. Returns the number of products corrected.
+    """
+    fixable = ~drift.sharded
+    if trust == 'ledger':
+        fixable &= drift.anchored
+    ids = drift.ids[fixable].tolist()
+    fixed = 0
+    for start in range(0, len(ids), FIX_BATCH_SIZE):
+        with transaction.atomic():
+            batch = list(Product.objects.select_for_update().filter(pk__in=ids[start:start + FIX_BATCH_SIZE])
+                         .values_list('pk', flat=True))
+            if not batch:
+                continue
+            current = find_drift(batch)
+            if trust == 'ledger':
+                current = current.only(current.anchored)
+            if not len(current):
+                continue
+            if trust == 'ledger':
+                Product.objects.filter(pk__in=current.ids.tolist()).update(stock_quantity=Case(
+                    *[When(pk=product_id, then=F('stock_quantity') - drift_by)
+                      for product_id, drift_by in zip(current.ids.tolist(), current.drift.tolist())]
+                ))
+                refresh_low_stock(current.ids.tolist())
+            else:
+                StockMovement.objects.bulk_create([
+                    StockMovement(product_id=product_id, movement_type='adjustment', quantity=stock,
+                                  reference_type='reconcile', notes=f'Ledger reconciliation (drift {drift_by:+d})',
+                                  created_by=user)
+                    for product_id, stock, drift_by in zip(current.ids.tolist(), current.stock.tolist(),
+                                                           current.drift.tolist())
+                ])
+            fixed += len(current)
+    if fixed:
+        versions.bump(versions.DASHBOARD)
+        if trust == 'ledger':
+            versions.bump(versions.STOCK)
+    return fixed
+
+
+def open_checkpoints(products):
+    """Anchor newly created products' ledgers at the stock they were created with"""
+    StockCheckpoint.objects.bulk_create([
+        StockCheckpoint(product=product, quantity=product.stock_quantity) for product in products
+    ], ignore_conflicts=True)
+
+
+def checkpoint_month(start, end):
+    """Fold every anchored product's movements up to its last one created in [start, end) into its checkpoint.
+
+    Run before a month of movements is archived, so the replay after the
+    checkpoint never needs them. Unanchored products are left alone: their
+    partial sum is not a balance. Returns the number of checkpoints written.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(*ledger_sql(through=(start, end)))
+        rows = cursor.fetchall()
+    checkpoints = [
+        StockCheckpoint(product_id=product_id, quantity=ledger, movement_id=last)
+        for product_id, _, _, ledger, _, _, anchored, last, checkpointed in rows
+        if anchored and last > checkpointed
+    ]
+    StockCheckpoint.objects.bulk_create(
+        checkpoints, update_conflicts=True, unique_fields=['product'], update_fields=['quantity', 'movement_id', 'updated_at']
+    )
+    return len(checkpoints)
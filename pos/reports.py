@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, Table, TableStyle
+
+from . import versions
+from .exports import SALE_EXPORT_HEADER, sale_export_rows
+from .models import ReportJob
+from .sales_filters import sales_query
+
+SALES_PDF = 'sales_pdf'
+ROWS_PER_PAGE = 22
+PAGE_MARGIN = 36
+COLUMN_WIDTHS = [90, 110, 100, 100, 80, 60, 60, 60, 60]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def report_key(kind, params):
+    """Cache key for a report: its parameters plus the version of the data it covers.
+
+    New sales show up in the count and highest id of the range; edits and
+    deletes move the sales data version.
+    """
+    count, last = sales_query(params).state()
+    payload = {
+        'kind': kind,
+        'params': params,
+        'sales_version': versions.current(versions.SALES),
+        'count': count,
+        'last': last,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def report_path(job):
+    return Path(settings.REPORTS_DIR) / f'{job.cache_key}.pdf'
+
+
+def request_sales_pdf(user, params):
+    """Return a job for the sales PDF, reusing a finished or queued one for the same data"""
+    key = report_key(SALES_PDF, params)
+    for job in ReportJob.objects.filter(kind=SALES_PDF, cache_key=key).exclude(status='failed'):
+        if job.status != 'done' or report_path(job).exists():
+            return job
+
+    job = ReportJob.objects.create(kind=SALES_PDF, params=params, cache_key=key, created_by=user)
+    transaction.on_commit(lambda: submit(job.pk))
+    return job
+
+
+def job_status(job):
+    """The JSON body describing a job to the browser"""
+    return {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'error': job.error,
+        'status_url': reverse('report_job', args=[job.pk]),
+        'download_url': reverse('report_download', args=[job.pk]),
+    }
+
+
+def submit(job_id):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.REPORT_WORKERS, thread_name_prefix='reports')
+    _executor.submit(run_job_in_thread, job_id)
+
+
+def run_job_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()
+
+
+def run_job(job_id):
+    """Render a pending job; returns False if another worker already took it"""
+    if not ReportJob.objects.filter(pk=job_id, status='pending').update(status='running'):
+        return False
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        render_sales_pdf(sales_query(job.params).sales(), report_path(job))
+    except Exception as e:
+        job.status, job.error = 'failed', str(e)
+    else:
+        job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return True
+
+
+def table_style(totals_row):
+    style = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BOX', (0, 0), (-1, -1), 2, colors.black),
+    ]
+    if totals_row:
+        style += [
+            ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, -1), (-1, -1), 10),
+        ]
+    return TableStyle(style)
+
+
+def render_sales_pdf(sales, path):
+    """Write the sales report to path one page-sized table at a time.
+
+    Only one page of rows is held in memory; totals are summed on the way
+    through and added under the last page's rows.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix('.part')
+    page_width, page_height = landscape(letter)
+    pdf = canvas.Canvas(str(partial), pagesize=landscape(letter))
+    styles = getSampleStyleSheet()
+    totals = [Decimal('0')] * 4
+
+    rows = sale_export_rows(sales)
+    page = list(islice(rows, ROWS_PER_PAGE))
+    first = True
+    while True:
+        following = list(islice(rows, ROWS_PER_PAGE))
+        top = page_height - PAGE_MARGIN
+        if first:
+            title = Paragraph('Sales Report', styles['Heading1'])
+            _, title_height = title.wrapOn(pdf, page_width - 2 * PAGE_MARGIN, page_height)
+            title.drawOn(pdf, PAGE_MARGIN, top - title_height)
+            top -= title_height + 24
+
+        data = [SALE_EXPORT_HEADER]
+        for row in page:
+            totals = [total + amount for total, amount in zip(totals, row[5:])]
+            data.append(row[:5] + [f'{amount:.2f}' for amount in row[5:]])
+        last = not following
+        if last:
+            data.append(['TOTAL', '', '', '', ''] + [f'{total:.2f}' for total in totals])
+
+        table = Table(data, colWidths=COLUMN_WIDTHS)
+        table.setStyle(table_style(totals_row=last))
+        _, table_height = table.wrapOn(pdf, page_width - 2 * PAGE_MARGIN, top)
+        table.drawOn(pdf, PAGE_MARGIN, top - table_height)
+        pdf.showPage()
+
+        if last:
+            break
+        page, first = following, False
+
+    pdf.save()
+    os.replace(partial, path)
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Product, StockReservation
+from .stock_shards import available_stock
+
+
+class ReservationError(Exception):
+    """Raised when a cart asks for more than is available to sell"""
+
+    def __init__(self, message, available):
+        super().__init__(message)
+        self.available = available
+
+
+def reservation_expiry():
+    return timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_TTL_MINUTES)
+
+
+def reserved_quantities(product_ids, exclude_cart=''):
+    """Map product id to units held by active reservations, in one grouped query"""
+    reservations = StockReservation.objects.filter(product_id__in=list(product_ids), expires_at__gt=timezone.now())
+    if exclude_cart:
+        reservations = reservations.exclude(cart_id=exclude_cart)
+    return dict(
+        reservations.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
+
+
+def available_to_sell(products, exclude_cart=''):
+    """Map product id to stock minus what other carts are holding"""
+    products = list(products)
+    stock = available_stock(products)
+    reserved = reserved_quantities(stock, exclude_cart)
+    return {product_id: units - reserved.get(product_id, 0) for product_id, units in stock.items()}
+
+
+def reserve(cashier, cart_id, product_id, quantity):
+    """Hold quantity units of a product for a cart, replacing any earlier hold.
+
+    A quantity of 0 releases the hold. Every call also pushes back the expiry
+    of the cart's other holds, so an active cart keeps its stock. Raises
+    ReservationError if the hold grows past what other carts leave to sell;
+    keeping or shrinking a hold always succeeds, even when stock has since
+    fallen below what the carts hold between them.
+    """
+    with transaction.atomic():
+        # Holds are serialised on the product row, sharded or not: unlike sales they are not the hot path.
+        # A hold is released even when the product has been deactivated since.
+        active = {'is_active': True} if quantity else {}
+        product = Product.objects.select_for_update().get(pk=product_id, **active)
+
+        available = available_to_sell([product], exclude_cart=cart_id)[product.id]
+        held = StockReservation.objects.filter(
+            cart_id=cart_id, product=product, expires_at__gt=timezone.now()
+        ).values_list('quantity', flat=True).first() or 0
+        if quantity > held and quantity > available:
+            raise ReservationError(f'Only {max(available, 0)} {product.name} available', max(available, 0))
+
+        expires_at = reservation_expiry()
+        if quantity:
+            StockReservation.objects.update_or_create(
+                cart_id=cart_id, product=product,
+                defaults={'cashier': cashier, 'quantity': quantity, 'expires_at': expires_at},
+            )
+        else:
+            StockReservation.objects.filter(cart_id=cart_id, product=product).delete()
+        StockReservation.objects.filter(cart_id=cart_id, cashier=cashier).update(expires_at=expires_at)
+
+    return available, expires_at
+
+
+def release_cart(cart_id):
+    """Drop every hold a cart has, e.g. once it has been paid for"""
+    if cart_id:
+        StockReservation.objects.filter(cart_id=cart_id).delete()
+
+
+def release_expired():
+    """Sweep expired holds in one DELETE and return how many were removed"""
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
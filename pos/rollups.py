@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import versions
+from .models import Sale, SaleItem, SalesDailyRollup
+from .sales_filters import created_on
+
+AMOUNTS = ['gross_amount', 'discount_amount', 'tax_amount', 'net_amount']
+COUNTERS = ['sale_count', 'items_sold'] + AMOUNTS
+
+
+def sale_delta(sale, items_sold, sign=1):
+    """The rollup key a sale belongs to and what it adds there (sign=-1 takes it back out)"""
+    key = (timezone.localdate(sale.created_at), sale.cashier_id, sale.payment_method)
+    return key, {
+        'sale_count': sign,
+        'items_sold': sign * items_sold,
+        'gross_amount': sign * Decimal(sale.total_amount),
+        'discount_amount': sign * Decimal(sale.discount_amount),
+        'tax_amount': sign * Decimal(sale.tax_amount),
+        'net_amount': sign * Decimal(sale.final_amount),
+    }
+
+
+def apply(deltas):
+    """Add (key, values) deltas to the rollup rows, creating rows as needed.
+
+    Must run inside the transaction that changes the sales, so the rollup
+    commits or rolls back with them. Rows are touched in key order so
+    concurrent checkouts cannot deadlock on them.
+    """
+    merged = {}
+    for key, values in deltas:
+        totals = merged.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        for field, value in values.items():
+            totals[field] += value
+
+    for (date, cashier_id, payment_method), totals in sorted(merged.items()):
+        rows = SalesDailyRollup.objects.filter(date=date, cashier_id=cashier_id, payment_method=payment_method)
+        changes = {field: F(field) + value for field, value in totals.items()}
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                SalesDailyRollup.objects.create(
+                    date=date, cashier_id=cashier_id, payment_method=payment_method, **totals
+                )
+        except IntegrityError:
+            # Another checkout created the row first
+            rows.update(**changes)
+
+
+def record_sales(sales_with_units):
+    """Add newly recorded sales, given as (sale, units sold) pairs"""
+    apply(sale_delta(sale, units) for sale, units in sales_with_units)
+
+
+def items_sold(sale):
+    return sale.items.aggregate(units=Sum('quantity'))['units'] or 0
+
+
+def save_edited_sale(sale):
+    """Save changes to an existing sale and move its rollup contribution to match"""
+    with transaction.atomic():
+        before = Sale.objects.select_for_update().get(pk=sale.pk)
+        units = items_sold(sale)
+        sale.save()
+        apply([sale_delta(before, units, sign=-1), sale_delta(sale, units)])
+
+
+@transaction.atomic
+def rebuild(start=None, end=None):
+    """Recompute the rollup rows for dates in [start, end] from the sales themselves.
+
+    Returns the number of rollup rows written.
+    """
+    sales = Sale.objects.filter(created_on(start, end))
+    items = SaleItem.objects.filter(created_on(start, end))
+    rollups = SalesDailyRollup.objects.all()
+    if start:
+        rollups = rollups.filter(date__gte=start)
+    if end:
+        rollups = rollups.filter(date__lte=end)
+
+    units = {
+        (row['day'], row['sale__cashier_id'], row['sale__payment_method']): row['units']
+        for row in items.annotate(day=TruncDate('created_at'))
+        .values('day', 'sale__cashier_id', 'sale__payment_method').annotate(units=Sum('quantity'))
+    }
+    rows = [
+        SalesDailyRollup(
+            date=row['day'],
+            cashier_id=row['cashier_id'],
+            payment_method=row['payment_method'],
+            sale_count=row['sale_count'],
+            items_sold=units.get((row['day'], row['cashier_id'], row['payment_method']), 0),
+            gross_amount=row['gross_amount'],
+            discount_amount=row['discount_amount'],
+            tax_amount=row['tax_amount'],
+            net_amount=row['net_amount'],
+        )
+        for row in sales.annotate(day=TruncDate('created_at')).values('day', 'cashier_id', 'payment_method')
+        .annotate(
+            sale_count=Count('id'),
+            gross_amount=Sum('total_amount'),
+            discount_amount=Sum('discount_amount'),
+            tax_amount=Sum('tax_amount'),
+            net_amount=Sum('final_amount'),
+        ).order_by()
+    ]
+
+    rollups.delete()
+    SalesDailyRollup.objects.bulk_create(rows, batch_size=1000)
+    versions.bump(versions.DASHBOARD)
+    return len(rows)
+
+
+def summarize(rollups):
+    """Totals over a queryset of rollup rows"""
+    totals = rollups.aggregate(**{field: Sum(field) for field in COUNTERS})
+    return {field: value or 0 for field, value in totals.items()}
@@ -0,0 +1,103 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from . import versions
+from .models import Sale, SalesDailyRollup
+from .product_cache import LRUCache
+
+# Compiled filter sets, and their sale counts, kept per worker
+SALES_QUERY_CACHE_SIZE = 256
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def created_on(start=None, end=None, field='created_at'):
+    """Q for rows whose field falls on the local dates start..end (either may be None).
+
+    The dates become a half-open range between aware local midnights,
+    compared with the column itself, so an index on it can be used;
+    field__date lookups wrap the column in a time zone cast instead.
+    """
+    q = Q()
+    if start:
+        q &= Q(**{f'{field}__gte': local_midnight(start)})
+    if end:
+        q &= Q(**{f'{field}__lt': local_midnight(end + timedelta(days=1))})
+    return q
+
+
+def sales_filter_params(form):
+    """The SaleFilterForm filters of a request as JSON-friendly parameters"""
+    params = {}
+    if form.is_valid():
+        for field in ('start_date', 'end_date'):
+            if form.cleaned_data[field]:
+                params[field] = form.cleaned_data[field].isoformat()
+        if form.cleaned_data['cashier']:
+            params['cashier'] = form.cleaned_data['cashier'].pk
+        if form.cleaned_data['payment_method']:
+            params['payment_method'] = form.cleaned_data['payment_method']
+    return params
+
+
+class SalesQuery:
+    """The sales and daily rollup rows matching one set of sales_filter_params.
+
+    Dates become a created_at range and the rest equality filters, which
+    is what the (cashier, created_at) and (payment_method, created_at)
+    indexes serve.
+    """
+
+    def __init__(self, params):
+        self.params = dict(params)
+        self.start = date.fromisoformat(params['start_date']) if 'start_date' in params else None
+        self.end = date.fromisoformat(params['end_date']) if 'end_date' in params else None
+
+        self.sale_filter = created_on(self.start, self.end)
+        self.rollup_filter = Q()
+        if self.start:
+            self.rollup_filter &= Q(date__gte=self.start)
+        if self.end:
+            self.rollup_filter &= Q(date__lte=self.end)
+        for field, lookup in (('cashier', 'cashier_id'), ('payment_method', 'payment_method')):
+            if field in params:
+                self.sale_filter &= Q(**{lookup: params[field]})
+                self.rollup_filter &= Q(**{lookup: params[field]})
+        self._state = LRUCache(1)
+
+    def sales(self):
+        return Sale.objects.filter(self.sale_filter).order_by('-created_at')
+
+    def rollups(self):
+        return SalesDailyRollup.objects.filter(self.rollup_filter)
+
+    def state(self):
+        """(count, highest id) of the matching sales.
+
+        Kept until a sale is written (DASHBOARD) or edited, deleted or
+        archived (SALES).
+        """
+        key = (versions.current(versions.DASHBOARD), versions.current(versions.SALES))
+        state = self._state.get(key)
+        if state is None:
+            totals = self.sales().order_by().aggregate(count=Count('id'), last=Max('id'))
+            state = (totals['count'], totals['last'])
+            self._state.set(key, state)
+        return state
+
+
+_queries = LRUCache(SALES_QUERY_CACHE_SIZE)
+
+
+def sales_query(params):
+    """The compiled SalesQuery for params, shared by every request with the same filters"""
+    key = tuple(sorted(params.items()))
+    query = _queries.get(key)
+    if query is None:
+        query = SalesQuery(params)
+        _queries.set(key, query)
+    return query
@@ -0,0 +1,182 @@
+import bisect
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from . import versions
+from .models import Product
+
+# pg_trgm's default similarity threshold, which its % operator applies
+SIMILARITY_THRESHOLD = 0.3
+
+
+def trigrams(text):
+    """pg_trgm style trigrams: words lower-cased and padded with two spaces in front, one behind"""
+    grams = set()
+    for word in text.lower().split():
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def search_products(query, queryset=None, limit=None):
+    """Return products matching query, best match first.
+
+    A product matches on a name containing the query, a name similar to it
+    (typos included) or a barcode starting with it. Barcode matches rank
+    first, then names by similarity. Postgres answers from pg_trgm GIN
+    indexes; other backends use a per-worker in-memory trigram index.
+    """
+    query = query.strip()
+    if queryset is None:
+        queryset = Product.objects.all()
+    limit = limit or settings.PRODUCT_SEARCH_LIMIT
+    if not query:
+        return list(queryset[:limit])
+
+    if connection.vendor == 'postgresql':
+        return list(_trigram_search(query, queryset)[:limit])
+
+    # queryset may filter some matches out, so widen the search until limit is reached
+    wanted = limit
+    while True:
+        ranked = product_index.search(query, wanted)
+        products = queryset.in_bulk(ranked)
+        results = [products[product_id] for product_id in ranked if product_id in products]
+        if len(results) >= limit or len(ranked) < wanted:
+            return results[:limit]
+        wanted *= 4
+
+
+def _trigram_search(query, queryset):
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    # Each branch has its own index (0016): the % operator (trigram_similar) and barcode LIKE 'q%' use
+    # the gin_trgm_ops indexes on name and barcode, and icontains, which compiles to
+    # UPPER(name::text) LIKE UPPER(...), uses the one on that expression
+    return queryset.annotate(
+        barcode_match=Case(When(barcode__startswith=query, then=Value(1)), default=Value(0),
+                           output_field=IntegerField()),
+        similarity=TrigramSimilarity('name', query),
+    ).filter(
+        Q(name__icontains=query) | Q(barcode__startswith=query) | Q(name__trigram_similar=query)
+    ).order_by('-barcode_match', '-similarity', 'name')
+
+
+class IndexSnapshot:
+    """One build of the in-memory index; never changed once built, so readers need no lock"""
+
+    def __init__(self, ids, names, name_order, gram_counts, postings, barcodes):
+        self.ids = ids
+        self.names = names
+        self.name_order = name_order
+        self.gram_counts = gram_counts
+        self.postings = postings
+        self.barcodes = barcodes
+
+    def count(self, grams):
+        """Number of the given trigrams each indexed name has"""
+        postings = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not postings:
+            return np.zeros(len(self.ids), dtype=np.int32)
+        return np.bincount(np.concatenate(postings), minlength=len(self.ids))
+
+
+class ProductIndex:
+    """In-memory trigram index over product names and barcodes.
+
+    Built lazily per worker and rebuilt when the catalog version moves.
+    Postings hold array positions, so counting the trigrams a name shares
+    with the query is one bincount; similarity is scored like pg_trgm,
+    shared trigrams over the union. A rebuild swaps in a whole new
+    IndexSnapshot, and each search works from the one it started with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._snapshot = IndexSnapshot(np.zeros(0, dtype=np.int64), [], np.zeros(0, dtype=np.int64),
+                                       np.zeros(0, dtype=np.int32), {}, [])
+
+    def build(self):
+        ids = []
+        names = []
+        gram_counts = []
+        postings = {}
+        barcodes = []
+        rows = Product.objects.order_by('id').values_list('id', 'name', 'barcode')
+        for position, (product_id, name, barcode) in enumerate(rows.iterator()):
+            grams = trigrams(name)
+            ids.append(product_id)
+            names.append(name.lower())
+            gram_counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+            if barcode:
+                barcodes.append((barcode, product_id))
+        barcodes.sort()
+
+        name_order = np.empty(len(names), dtype=np.int64)
+        name_order[sorted(range(len(names)), key=names.__getitem__)] = np.arange(len(names))
+
+        return IndexSnapshot(
+            np.array(ids, dtype=np.int64), names, name_order, np.array(gram_counts, dtype=np.int32),
+            {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}, barcodes,
+        )
+
+    def refresh(self):
+        """Return the snapshot for the current catalog version, rebuilding it if the version moved"""
+        version = versions.current(versions.CATALOG)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._snapshot = self.build()
+                    self._version = version
+        return self._snapshot
+
+    def search(self, query, limit):
+        """Return up to limit matching product ids, best match first"""
+        index = self.refresh()
+        lowered = query.lower()
+
+        barcode_hits = []
+        position = bisect.bisect_left(index.barcodes, (query,))
+        while (len(barcode_hits) < limit and position < len(index.barcodes)
+               and index.barcodes[position][0].startswith(query)):
+            barcode_hits.append(index.barcodes[position][1])
+            position += 1
+        if len(barcode_hits) == limit:
+            return barcode_hits
+
+        query_grams = trigrams(query)
+        shared = index.count(query_grams)
+        scores = shared / (len(query_grams) + index.gram_counts - shared)
+
+        # A name containing the query contains every trigram inside the query's words
+        inner = {word[i:i + 3] for word in lowered.split() for i in range(len(word) - 2)}
+        if inner:
+            contains = index.count(inner) == len(inner)
+        else:
+            # Words this short share no trigram with the middle of a name; fall back to a scan
+            contains = np.array([lowered in name for name in index.names], dtype=bool)
+
+        candidates = np.flatnonzero((scores >= SIMILARITY_THRESHOLD) | contains)
+        candidates = candidates[np.lexsort((index.name_order[candidates], -scores[candidates]))]
+
+        results = barcode_hits
+        seen = set(barcode_hits)
+        for position in candidates:
+            if len(results) >= limit:
+                break
+            product_id = int(index.ids[position])
+            if product_id in seen:
+                continue
+            if scores[position] >= SIMILARITY_THRESHOLD or lowered in index.names[position]:
+                results.append(product_id)
+        return results
+
+
+product_index = ProductIndex()
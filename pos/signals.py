@@ -1,7 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from . import rollups, versions
+from .alerts import refresh_low_stock
+from .models import UserProfile, Category, Product, Sale, StockMovement
+from .reconcile import open_checkpoints
+
+# Saves that only touch these fields leave the catalog as the tills see it unchanged
+STOCK_FIELDS = {'stock_quantity', 'stock_shards', 'updated_at'}
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -17,4 +23,62 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     """Save UserProfile when User is saved"""
     if hasattr(instance, 'userprofile'):
-        instance.userprofile.save()
\ No newline at end of file
+        instance.userprofile.save()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_version(sender, instance, update_fields=None, **kwargs):
+    """Invalidate per-worker product caches when the catalog changes (category names are shown with products)"""
+    if update_fields and set(update_fields) <= STOCK_FIELDS:
+        versions.bump_on_commit(versions.STOCK)
+        return
+    versions.bump(versions.CATALOG)
+
+
+@receiver(post_delete, sender=Product)
+def bump_catalog_purges(sender, instance, **kwargs):
+    """Deleted products leave nothing for a catalog delta to report, so tills resync in full"""
+    versions.bump(versions.CATALOG_PURGES)
+
+
+@receiver(pre_delete, sender=Sale)
+def remove_sale_from_rollup(sender, instance, **kwargs):
+    """Take a deleted sale back out of its daily rollup row"""
+    rollups.apply([rollups.sale_delta(instance, rollups.items_sold(instance), sign=-1)])
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def bump_sales_version(sender, instance, created=False, **kwargs):
+    """Edited or deleted sales invalidate cached reports; new sales are detected by the reports themselves"""
+    if not created:
+        versions.bump(versions.SALES)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=StockMovement)
+@receiver(post_delete, sender=StockMovement)
+def bump_dashboard_version(sender, instance, **kwargs):
+    """Any sale, product, category or stock movement write can change the admin dashboard's figures"""
+    versions.bump_on_commit(versions.DASHBOARD)
+
+
+@receiver(post_save, sender=Product)
+def flag_low_stock(sender, instance, **kwargs):
+    """Stock edits and adjustments may cross the product's reorder level"""
+    refresh_low_stock([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def open_stock_ledger(sender, instance, created, raw=False, **kwargs):
+    """A product's opening stock writes no movement, so it anchors the ledger replay instead"""
+    if created and not raw:
+        open_checkpoints([instance])
@@ -0,0 +1,127 @@
+import random
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Product, StockShard
+
+
+def available_stock(products):
+    """Map product id to units available, summing shards for sharded products"""
+    products = list(products)
+    stock = {product.id: product.stock_quantity for product in products}
+    sharded = [product.id for product in products if product.stock_shards]
+    if sharded:
+        shard_totals = dict(
+            StockShard.objects.filter(product_id__in=sharded)
+            .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+        )
+        for product_id in sharded:
+            stock[product_id] = shard_totals.get(product_id) or 0
+    return stock
+
+
+def take_from_shards(product, quantity):
+    """Decrement a sharded product by quantity without touching its Product row.
+
+    The shards taken from get a new updated_at, which catalog deltas pick up.
+
+    A random shard is tried first so concurrent sales spread over different
+    rows. Every decrement is conditional on the shard covering it, so stock
+    can never go negative; if no single shard is big enough the shards are
+    locked and drained in turn. Returns False when the shards cannot cover
+    quantity between them.
+    """
+    shard = random.randrange(product.stock_shards)
+    if _take(product, shard, quantity):
+        return True
+
+    candidates = list(
+        StockShard.objects.filter(product=product, quantity__gte=quantity).values_list('shard', flat=True)
+    )
+    random.shuffle(candidates)
+    for shard in candidates:
+        if _take(product, shard, quantity):
+            return True
+
+    # Stock is spread too thin for any one shard; settle it under lock
+    shards = list(StockShard.objects.select_for_update().filter(product=product, quantity__gt=0))
+    if sum(shard.quantity for shard in shards) < quantity:
+        return False
+    remaining = quantity
+    now = timezone.now()
+    for shard in shards:
+        taken = min(shard.quantity, remaining)
+        shard.quantity -= taken
+        shard.updated_at = now
+        remaining -= taken
+        if not remaining:
+            break
+    StockShard.objects.bulk_update(shards, ['quantity', 'updated_at'])
+    return True
+
+
+def _take(product, shard, quantity):
+    return StockShard.objects.filter(product=product, shard=shard, quantity__gte=quantity).update(
+        quantity=F('quantity') - quantity, updated_at=timezone.now()
+    ) == 1
+
+
+def spread(product, shards):
+    """Split product.stock_quantity evenly over the given number of shards.
+
+    Called with the product row locked. Passing shards=0 turns sharding off.
+    """
+    existing = {shard.shard: shard for shard in StockShard.objects.filter(product=product)}
+    StockShard.objects.filter(product=product, shard__gte=shards).delete()
+    if shards:
+        share, extra = divmod(product.stock_quantity, shards)
+        changed = []
+        for index in range(shards):
+            shard = existing.get(index) or StockShard(product=product, shard=index)
+            shard.quantity = share + (1 if index < extra else 0)
+            changed.append(shard)
+        StockShard.objects.bulk_update([shard for shard in changed if shard.pk], ['quantity'])
+        StockShard.objects.bulk_create([shard for shard in changed if not shard.pk])
+    product.stock_shards = shards
+    product.save(update_fields=['stock_shards', 'stock_quantity', 'updated_at'])
+
+
+def fold(product):
+    """Sum a sharded product's shards back into product.stock_quantity.
+
+    Called with the product row locked; the shards are locked too so the
+    total cannot move until the caller's transaction ends.
+    """
+    if not product.stock_shards:
+        return product.stock_quantity
+    product.stock_quantity = sum(
+        StockShard.objects.select_for_update().filter(product=product).values_list('quantity', flat=True)
+    )
+    return product.stock_quantity
+
+
+def set_shards(product_id, shards):
+    """Enable, resize or (with shards=0) disable sharding for one product"""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        fold(product)
+        spread(product, shards)
+    return product
+
+
+def fold_all():
+    """Background step: refresh stock_quantity from the shards and rebalance them.
+
+    Returns the number of products folded.
+    """
+    folded = 0
+    for product_id in Product.objects.filter(stock_shards__gt=0).values_list('id', flat=True):
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(pk=product_id)
+            if product.stock_shards:
+                fold(product)
+                spread(product, product.stock_shards)
+                folded += 1
+    return folded
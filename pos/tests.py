@@ -1,3 +1,1179 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+import psycopg2
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from psycopg2 import extensions
+
+from . import analytics, sales_filters
+from .alerts import drain_alerts, refresh_low_stock
+from .autocomplete import ProductTrie
+from .checkout import CheckoutError, checkout, checkout_batch
+from .dashboard import dashboard_cache
+from .exports import SALE_EXPORT_HEADER, csv_chunks
+from .forecasting import reorder_levels, smooth, update_reorder_suggestions
+from .idempotency import purge_expired_keys, run_once
+from .invoicing import BlockInvoiceNumberAllocator, InvoiceNumberAllocator, format_invoice_number
+from .models import (Category, IdempotencyKey, LowStockAlert, Product, ReorderSuggestion, ReportJob, Sale,
+                     SaleItem, SalesDailyRollup, StockCheckpoint, StockMovement, StockReservation)
+from .partitions import PARTITION_KEY, archive_month, is_partitioned, month_start, partition_name
+from .performance import ProductPerformance, performance_cache
+from .pooled_postgresql.base import ConnectionPool
+from .product_cache import barcode_cache
+from .reconcile import find_drift, fix_drift
+from .reports import report_path, request_sales_pdf, run_job
+from .reservations import ReservationError, reserve
+from .rollups import rebuild, save_edited_sale, summarize
+from .search import ProductIndex, search_products
+from .stock_shards import available_stock, set_shards
+
+
+class QueryBudgetMixin:
+    """Assertions that cap the number of queries a page may run.
+
+    assertQueryBudget fails when a page runs more than its budget;
+    assertQueriesFlat also fails when the count moves as rows are added,
+    which is how a per-row query shows up before it blows any budget.
+    """
+
+    def count_queries(self, client, url):
+        client.get(url)  # warm per-process caches so they don't count against the page
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, f'{url} returned {response.status_code}')
+        return len(queries), queries
+
+    def assertQueryBudget(self, client, url, budget):
+        count, queries = self.count_queries(client, url)
+        if count > budget:
+            sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+            self.fail(f'{url} ran {count} queries, budget is {budget}:\n{sql}')
+        return count
+
+    def assertQueriesFlat(self, client, url, add_rows, budget):
+        before = self.assertQueryBudget(client, url, budget)
+        add_rows()
+        after = self.assertQueryBudget(client, url, budget)
+        self.assertEqual(before, after, f'{url} query count grew from {before} to {after} as rows were added')
+
+
+class ListingQueryTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass', first_name='Ada')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        self.cashier = User.objects.create_user('cashier', password='pass', first_name='Cal')
+        self.cashier.userprofile.role = 'cashier'
+        self.cashier.userprofile.save()
+        self.category = Category.objects.create(name='Drinks')
+        self.product = Product.objects.create(
+            name='Water', category=self.category, price=Decimal('1.00'), stock_quantity=2, min_stock_level=5,
+        )
+        self.sale = self.add_sales(1)[0]
+
+    def login(self, user):
+        self.client.force_login(user)
+        return self.client
+
+    def add_sales(self, count, items=3):
+        sales = []
+        for _ in range(count):
+            sale = Sale.objects.create(
+                cashier=self.cashier, total_amount=items, final_amount=items, payment_method='cash',
+            )
+            for _ in range(items):
+                product = Product.objects.create(name='Item', category=self.category, price=Decimal('1.00'))
+                SaleItem.objects.create(sale=sale, product=product, quantity=1, unit_price=product.price)
+            sales.append(sale)
+        return sales
+
+    def add_movements(self, count=5):
+        for _ in range(count):
+            product = Product.objects.create(
+                name='Stock', category=self.category, price=Decimal('1.00'), stock_quantity=0,
+            )
+            StockMovement.objects.create(product=product, movement_type='in', quantity=1, created_by=self.admin)
+
+    def add_users(self, count=5):
+        for i in range(count):
+            User.objects.create_user(f'user{i}')
+
+    def test_sales_report(self):
+        self.assertQueriesFlat(self.login(self.admin), '/sales-report/', lambda: self.add_sales(5), budget=10)
+
+    def test_my_sales(self):
+        self.assertQueriesFlat(self.login(self.cashier), '/my-sales/', lambda: self.add_sales(5), budget=8)
+
+    def test_dashboard(self):
+        self.assertQueriesFlat(self.login(self.admin), '/', lambda: self.add_sales(4), budget=12)
+
+    # Read the dashboard version on every request, so a sale's bump is seen straight away
+    @override_settings(DATA_VERSION_POLL_SECONDS=0)
+    def test_dashboard_unchanged(self):
+        cache.clear()
+        dashboard_cache.clear()
+        client = self.login(self.admin)
+        _, queries = self.count_queries(client, '/')
+        tables = [Product._meta.db_table, Sale._meta.db_table, SalesDailyRollup._meta.db_table]
+        for query in queries.captured_queries:
+            self.assertFalse(any(table in query['sql'] for table in tables), query['sql'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = self.add_sales(1)[0]
+        self.assertEqual(client.get('/').context['recent_sales'][0]['invoice_number'], sale.invoice_number)
+
+    def test_receipt(self):
+        client = self.login(self.cashier)
+        url = f'/receipt/{self.sale.pk}/'
+
+        def add_items():
+            for _ in range(5):
+                SaleItem.objects.create(sale=self.sale, product=self.product, quantity=1, unit_price=Decimal('1.00'))
+
+        self.assertQueriesFlat(client, url, add_items, budget=6)
+
+    def test_sale_detail(self):
+        def add_items():
+            for _ in range(5):
+                SaleItem.objects.create(sale=self.sale, product=self.product, quantity=1, unit_price=Decimal('1.00'))
+
+        self.assertQueriesFlat(self.login(self.admin), f'/sale/{self.sale.pk}/', add_items, budget=8)
+
+    def test_stock_management(self):
+        self.assertQueriesFlat(self.login(self.admin), '/stock-management/', self.add_movements, budget=12)
+
+    def test_product_list(self):
+        self.assertQueriesFlat(self.login(self.admin), '/products/', lambda: self.add_sales(2), budget=10)
+
+    def test_user_management(self):
+        self.assertQueriesFlat(self.login(self.admin), '/user-management/', self.add_users, budget=8)
+
+    def test_admin_sale_changelist(self):
+        superuser = User.objects.create_superuser('root', 'root@example.com', 'pass')
+        self.assertQueriesFlat(self.login(superuser), '/admin/pos/sale/', lambda: self.add_sales(5), budget=12)
+
+
+
+# Tables seeded large enough that reading one in full is a regression
+SCANNED_TABLES = [Sale._meta.db_table, SaleItem._meta.db_table, StockMovement._meta.db_table]
+# Smaller relations (such as empty month partitions) may still be scanned in full
+SEQ_SCAN_MIN_ROWS = 1000
+
+
+class ExplainMixin:
+    """Assertions on the query plans of the queries a page runs.
+
+    Every SELECT the page sends against SCANNED_TABLES is run again under
+    EXPLAIN; assertNoSeqScan fails when a plan reads one of those tables
+    (or a sizeable partition of one) in full rather than through an index,
+    and assertPruned when it reads month partitions outside the page's range.
+    """
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return [str(row[-1]) for row in cursor.fetchall()]
+
+    def table_rows(self, relation):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [relation])
+            row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def seq_scans(self, sql, plan):
+        """The scanned tables the plan reads in full"""
+        if connection.vendor == 'postgresql':
+            scans = []
+            for line in plan:
+                match = re.search(r'Seq Scan on (\w+)', line)
+                if not match:
+                    continue
+                relation = match.group(1)
+                table = re.sub(r'_(p\d{4}_\d{2}|default)$', '', relation)
+                if table in SCANNED_TABLES and self.table_rows(relation) >= SEQ_SCAN_MIN_ROWS:
+                    scans.append(relation)
+            return scans
+        # SQLite: "SCAN <table or alias>" with no index is a full table scan
+        aliases = {alias: table for table, alias in re.findall(r'"(\w+)" ([A-Z]\d+)\b', sql)}
+        scanned = [aliases.get(name, name) for line in plan for name in re.findall(r'^SCAN (\w+)$', line)]
+        return [table for table in scanned if table in SCANNED_TABLES]
+
+    def page_queries(self, client, url):
+        """The SELECTs against SCANNED_TABLES that the page runs"""
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, f'{url} returned {response.status_code}')
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and any(f'"{table}"' in query['sql'] for table in SCANNED_TABLES)
+        ]
+
+    def assertNoSeqScan(self, client, url, queries=None):
+        checked = 0
+        for sql in self.page_queries(client, url) if queries is None else queries:
+            plan = self.explain(sql)
+            scans = self.seq_scans(sql, plan)
+            if scans:
+                self.fail(f'{url} reads {", ".join(scans)} in full:\n{sql}\n' + '\n'.join(plan))
+            checked += 1
+        return checked
+
+    def assertPruned(self, url, queries, table, months):
+        """Fail when a plan reads a month partition of table other than those of months.
+
+        Where the table is not partitioned (anything but PostgreSQL) this
+        checks what pruning depends on instead: that every query of the
+        table bounds the table's own partition key.
+        """
+        if not is_partitioned(table):
+            for sql in queries:
+                if f'"{table}"' not in sql:
+                    continue
+                names = [f'"{table}"', *re.findall(rf'"{table}" (\w+)\b', sql)]
+                where = sql.partition(' WHERE ')[2]
+                if not any(f'{name}."{PARTITION_KEY}"' in where for name in names):
+                    self.fail(f'{url} does not bound {table}.{PARTITION_KEY}:\n{sql}')
+            return
+        allowed = {partition_name(table, month) for month in months}
+        for sql in queries:
+            if f'"{table}"' not in sql:
+                continue
+            plan = self.explain(sql)
+            read = {name for line in plan for name in re.findall(rf'\b{table}_(?:p\d{{4}}_\d{{2}}|default)\b', line)}
+            if read - allowed:
+                self.fail(f'{url} reads {", ".join(sorted(read - allowed))}:\n{sql}\n' + '\n'.join(plan))
+
+
+class QueryPlanTests(ExplainMixin, TestCase):
+    SALES = 10000
+    ITEMS_PER_SALE = 3
+    MOVEMENTS = 30000
+    PRODUCTS = 500
+    CASHIERS = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        cls.admin.userprofile.role = 'admin'
+        cls.admin.userprofile.save()
+        cashiers = [User.objects.create_user(f'cashier{i}') for i in range(cls.CASHIERS)]
+        cls.cashier = cashiers[0]
+        cls.cashier.userprofile.role = 'cashier'
+        cls.cashier.userprofile.save()
+
+        category = Category.objects.create(name='Bulk')
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', category=category, price=Decimal('1.00'), stock_quantity=100)
+            for i in range(cls.PRODUCTS)
+        ])
+        methods = [method for method, _ in Sale.PAYMENT_CHOICES]
+        sales = Sale.objects.bulk_create([
+            Sale(invoice_number=f'SEED-{i:06d}', cashier=cashiers[i % cls.CASHIERS], total_amount=3, final_amount=3,
+                 payment_method=methods[i % len(methods)])
+            for i in range(cls.SALES)
+        ], batch_size=2000)
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=products[(i * cls.ITEMS_PER_SALE + line) % cls.PRODUCTS], quantity=1,
+                     unit_price=Decimal('1.00'), total_price=Decimal('1.00'))
+            for i, sale in enumerate(sales) for line in range(cls.ITEMS_PER_SALE)
+        ], batch_size=2000)
+        StockMovement.objects.bulk_create([
+            StockMovement(product=products[i % cls.PRODUCTS], movement_type='out', quantity=1,
+                          reference_type='sale', created_by=cls.admin)
+            for i in range(cls.MOVEMENTS)
+        ], batch_size=2000)
+        cls.sale = sales[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        dashboard_cache.clear()
+        performance_cache.clear()
+
+    def login(self, user):
+        self.client.force_login(user)
+        return self.client
+
+    def test_dashboard(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), '/'))
+
+    def test_sales_report_by_cashier(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), f'/sales-report/?cashier={self.cashier.pk}'))
+
+    def test_sales_report_by_payment_method(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), '/sales-report/?payment_method=card'))
+
+    def test_sales_report(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), '/sales-report/'))
+
+    def test_sales_report_by_date(self):
+        today = timezone.localdate().isoformat()
+        url = f'/sales-report/?start_date={today}&end_date={today}'
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), url))
+
+    def test_sales_analytics(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), '/api/sales/analytics/'))
+
+    def test_export_sales_csv(self):
+        today = timezone.localdate().isoformat()
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), f'/export-sales-csv/?start_date={today}'))
+
+    def test_my_sales(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.cashier), '/my-sales/'))
+
+    def test_my_sales_by_date(self):
+        today = timezone.localdate().isoformat()
+        self.assertTrue(self.assertNoSeqScan(self.login(self.cashier), f'/my-sales/?from_date={today}&to_date={today}'))
+
+    def test_stock_management(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), '/stock-management/'))
+
+    def test_product_performance_prunes_sale_lines(self):
+        today = timezone.localdate()
+        url = f'/product-performance/?start_date={today.isoformat()}&end_date={today.isoformat()}'
+        queries = self.page_queries(self.login(self.admin), url)
+        self.assertTrue(self.assertNoSeqScan(None, url, queries))
+        self.assertPruned(url, queries, SaleItem._meta.db_table, [month_start(today)])
+
+    def test_sale_detail(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), f'/sale/{self.sale.pk}/'))
+
+    def test_admin_sale_changelist(self):
+        self.assertTrue(self.assertNoSeqScan(self.login(self.admin), '/admin/pos/sale/'))
+
+
+class StoreTestCase(TestCase):
+    """A cashier, an admin and two products: 'Tea' (5 in stock) and 'Rice' (100)"""
+
+    def setUp(self):
+        self.cashier = User.objects.create_user('cashier', password='pass')
+        self.cashier.userprofile.role = 'cashier'
+        self.cashier.userprofile.save()
+        self.admin = User.objects.create_user('admin', password='pass')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        self.category = Category.objects.create(name='Groceries')
+        self.tea = Product.objects.create(name='Tea', category=self.category, price=Decimal('2.50'), stock_quantity=5)
+        self.rice = Product.objects.create(name='Rice', category=self.category, price=Decimal('1.00'),
+                                           stock_quantity=100)
+
+    def stock(self, product):
+        return available_stock([Product.objects.get(pk=product.pk)])[product.pk]
+
+    def post_json(self, url, body, **headers):
+        self.client.force_login(self.cashier)
+        return self.client.post(url, json.dumps(body), content_type='application/json', **headers)
+
+
+class CheckoutTests(StoreTestCase):
+    def test_lines_for_one_product_are_merged(self):
+        sale = checkout(self.cashier, [(self.tea.pk, 2), (self.rice.pk, 1), (str(self.tea.pk), 1)])
+        self.assertEqual(sale.total_amount, Decimal('8.50'))
+        self.assertEqual(dict(sale.items.values_list('product_id', 'quantity')), {self.tea.pk: 3, self.rice.pk: 1})
+        self.assertEqual(StockMovement.objects.filter(reference_id=sale.pk).count(), 2)
+        self.assertEqual((self.stock(self.tea), self.stock(self.rice)), (2, 99))
+
+    def test_insufficient_stock_leaves_stock_untouched(self):
+        with self.assertRaises(CheckoutError):
+            checkout(self.cashier, [(self.rice.pk, 1), (self.tea.pk, 6)])
+        self.assertEqual((self.stock(self.tea), self.stock(self.rice)), (5, 100))
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_lines_carry_their_sale_created_at(self):
+        sale = checkout(self.cashier, [(self.tea.pk, 1)])
+        self.assertEqual(list(sale.items.values_list('created_at', flat=True)), [sale.created_at])
+
+    def test_replay_returns_the_first_response(self):
+        body = {'cart': [{'id': self.tea.pk, 'qty': 2}]}
+        first = self.post_json('/api/process-sale/', body, HTTP_IDEMPOTENCY_KEY='till-1-0001')
+        second = self.post_json('/api/process-sale/', body, HTTP_IDEMPOTENCY_KEY='till-1-0001')
+        self.assertEqual(first.status_code, 200, first.content)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(self.stock(self.tea), 3)
+
+    def test_batch_sells_in_queue_order(self):
+        payloads = [{'request_key': f'k{i}', 'cart': [{'id': self.tea.pk, 'qty': 2}]} for i in range(3)]
+        results = checkout_batch(self.cashier, payloads)
+        self.assertEqual([result['success'] for result in results], [True, True, False])
+        self.assertEqual([result['request_key'] for result in results], ['k0', 'k1', 'k2'])
+        self.assertIn('Insufficient stock', results[2]['error'])
+        self.assertEqual(self.stock(self.tea), 1)
+        sales = Sale.objects.order_by('invoice_number')
+        self.assertEqual([sale.pk for sale in sales], [results[0]['sale_id'], results[1]['sale_id']])
+
+    def test_batch_records_a_duplicate_key_once(self):
+        payloads = [
+            {'request_key': 'k0', 'cart': [{'id': self.rice.pk, 'qty': 1}]},
+            {'request_key': 'k1', 'cart': [{'id': self.rice.pk, 'qty': 1}]},
+            {'request_key': 'k0', 'cart': [{'id': self.rice.pk, 'qty': 1}]},
+        ]
+        results = checkout_batch(self.cashier, payloads)
+        self.assertEqual(results[2]['sale_id'], results[0]['sale_id'])
+        self.assertEqual(self.stock(self.rice), 98)
+        # The till resending the whole queue records nothing new
+        self.assertEqual(checkout_batch(self.cashier, payloads), results)
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_batch_reports_rejected_sales(self):
+        response = self.post_json('/api/process-sale/batch/', {'sales': [
+            {'request_key': 'k0', 'cart': [{'id': self.tea.pk, 'qty': 9}]},
+            {'request_key': 'k1', 'cart': [{'id': self.tea.pk, 'qty': 1}]},
+        ]})
+        data = response.json()
+        self.assertEqual((data['accepted'], data['rejected']), (1, 1))
+        self.assertFalse(data['results'][0]['success'])
+        self.assertEqual(self.stock(self.tea), 4)
+
+    @override_settings(OFFLINE_SALE_MAX_AGE_HOURS=72)
+    def test_batch_keeps_the_tills_sale_time(self):
+        now = timezone.now()
+        queued = [now - timedelta(days=1), now + timedelta(hours=1), now - timedelta(days=4)]
+        results = checkout_batch(self.cashier, [
+            {'request_key': f'k{i}', 'queued_at': moment.isoformat(), 'cart': [{'id': self.rice.pk, 'qty': 1}]}
+            for i, moment in enumerate(queued)
+        ])
+        sales = [Sale.objects.get(pk=result['sale_id']) for result in results]
+        self.assertEqual(sales[0].created_at, queued[0])
+        # Times ahead of the server or beyond the window are not trusted
+        for sale in sales[1:]:
+            self.assertLess(abs(sale.created_at - now), timedelta(minutes=1))
+        self.assertEqual(sales[0].items.get().created_at, queued[0])
+        yesterday = timezone.localdate(queued[0])
+        self.assertEqual(SalesDailyRollup.objects.get(date=yesterday).sale_count, 1)
+
+
+class RollupTests(StoreTestCase):
+    def rollup(self):
+        return {
+            (row.cashier_id, row.payment_method): (row.sale_count, row.items_sold, row.net_amount)
+            for row in SalesDailyRollup.objects.filter(date=timezone.localdate())
+        }
+
+    def test_checkout_adds_to_the_rollup(self):
+        first = checkout(self.cashier, [(self.tea.pk, 2), (self.rice.pk, 1)])
+        second = checkout(self.cashier, [(self.rice.pk, 3)], payment_method='card')
+        checkout_batch(self.cashier, [{'cart': [{'id': self.rice.pk, 'qty': 1}]}])
+        self.assertEqual(self.rollup(), {
+            (self.cashier.pk, 'cash'): (2, 4, first.final_amount + Sale.objects.latest('id').final_amount),
+            (self.cashier.pk, 'card'): (1, 3, second.final_amount),
+        })
+
+    def test_edited_sale_moves_between_rows(self):
+        sale = checkout(self.cashier, [(self.tea.pk, 2)])
+        sale.payment_method = 'card'
+        sale.discount_amount = Decimal('1.00')
+        sale.final_amount -= Decimal('1.00')
+        save_edited_sale(sale)
+        self.assertEqual(self.rollup(), {
+            (self.cashier.pk, 'cash'): (0, 0, Decimal('0')),
+            (self.cashier.pk, 'card'): (1, 2, sale.final_amount),
+        })
+
+    def test_deleted_sale_is_taken_out(self):
+        checkout(self.cashier, [(self.tea.pk, 1)])
+        checkout(self.cashier, [(self.rice.pk, 2)]).delete()
+        self.assertEqual(summarize(SalesDailyRollup.objects.all())['sale_count'], 1)
+        self.assertEqual(summarize(SalesDailyRollup.objects.all())['items_sold'], 1)
+
+    def test_rebuild_matches_the_sales(self):
+        for method in ('cash', 'card', 'cash'):
+            checkout(self.cashier, [(self.rice.pk, 2), (self.tea.pk, 1)], payment_method=method)
+        expected = self.rollup()
+        SalesDailyRollup.objects.update(sale_count=99, items_sold=0)
+        self.assertEqual(rebuild(), 2)
+        self.assertEqual(self.rollup(), expected)
+        self.assertEqual(expected[(self.cashier.pk, 'cash')][:2], (2, 6))
+
+
+class IdempotencyTests(StoreTestCase):
+    def test_handler_integrity_error_is_raised(self):
+        def clash():
+            Category.objects.create(name='Groceries')
+            return {'success': True}
+
+        with self.assertRaises(IntegrityError):
+            run_once(self.cashier, 'k1', clash)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_concurrent_key_is_replayed(self):
+        IdempotencyKey.objects.create(user=self.cashier, key='k1', response={'success': True, 'sale_id': 7})
+        # The first lookup misses: the other request had not committed its key yet
+        lookups = [IdempotencyKey.objects.none()]
+        real_filter = IdempotencyKey.objects.filter
+
+        def lookup(*args, **kwargs):
+            return lookups.pop() if lookups else real_filter(*args, **kwargs)
+
+        with mock.patch.object(IdempotencyKey.objects, 'filter', side_effect=lookup):
+            response = run_once(self.cashier, 'k1', lambda: {'success': True, 'sale_id': 8})
+        self.assertEqual(response, {'success': True, 'sale_id': 7})
+
+    def test_purge_expired_keys(self):
+        for key in ('old', 'new'):
+            IdempotencyKey.objects.create(user=self.cashier, key=key, response={})
+        IdempotencyKey.objects.filter(key='old').update(created_at=timezone.now() - timedelta(hours=25))
+        with override_settings(IDEMPOTENCY_KEY_TTL_HOURS=24):
+            self.assertEqual(purge_expired_keys(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+        self.assertEqual(purge_expired_keys(timedelta(0)), 1)
+
+
+class LowStockAlertTests(StoreTestCase):
+    def test_crossing_and_restock_queue_one_alert_each(self):
+        self.assertEqual(list(LowStockAlert.objects.values_list('product_id', 'kind')), [(self.tea.pk, 'low')])
+        checkout(self.cashier, [(self.rice.pk, 95)])
+        checkout(self.cashier, [(self.rice.pk, 1)])
+        alert = LowStockAlert.objects.get(product=self.rice)
+        self.assertEqual((alert.kind, alert.stock_quantity, alert.reorder_level), ('low', 5, 5))
+
+        self.rice.refresh_from_db()
+        self.rice.stock_quantity = 50
+        self.rice.save()
+        self.assertFalse(Product.objects.get(pk=self.rice.pk).is_low_stock)
+        self.assertEqual(LowStockAlert.objects.filter(product=self.rice, kind='restocked').count(), 1)
+
+    def test_concurrent_crossing_queues_one_alert(self):
+        Product.objects.filter(pk=self.rice.pk).update(stock_quantity=3)
+        update = QuerySet.update
+        raced = []
+
+        def other_writer_first(queryset, **kwargs):
+            if 'is_low_stock' in kwargs and not raced:
+                # A concurrent refresh saw the same crossing and flipped the flag first
+                raced.append(update(Product.objects.filter(pk=self.rice.pk), is_low_stock=True))
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', other_writer_first):
+            self.assertEqual(refresh_low_stock([self.rice.pk]), [])
+        self.assertEqual(raced, [1])
+        self.assertFalse(LowStockAlert.objects.filter(product=self.rice).exists())
+
+    def test_failed_notify_leaves_batch_queued(self):
+        Product.objects.filter(pk=self.rice.pk).update(stock_quantity=1)
+        refresh_low_stock()
+
+        def broken(alerts):
+            raise ConnectionError('mail server down')
+
+        with self.assertRaises(ConnectionError):
+            drain_alerts(broken, batch_size=1)
+        self.assertEqual(LowStockAlert.objects.filter(sent_at__isnull=True).count(), 2)
+
+        batches = []
+        self.assertEqual(drain_alerts(batches.append, batch_size=1), 2)
+        self.assertEqual([[alert.product_id for alert in batch] for batch in batches], [[self.tea.pk], [self.rice.pk]])
+        self.assertFalse(LowStockAlert.objects.filter(sent_at__isnull=True).exists())
+
+
+class InvoiceNumberTests(StoreTestCase):
+    def add_legacy_sales(self, count):
+        return [Sale.objects.create(invoice_number=f'INV-{i:08X}', cashier=self.cashier, total_amount=1,
+                                    final_amount=1, payment_method='cash') for i in range(count)]
+
+    def test_allocators_must_implement_allocate(self):
+        with self.assertRaises(TypeError):
+            InvoiceNumberAllocator()
+
+    def test_numbers_are_consecutive(self):
+        allocator = BlockInvoiceNumberAllocator()
+        first, second = allocator.allocate(2)
+        self.assertEqual(allocator.allocate()[0], format_invoice_number(int(second[4:]) + 1))
+        self.assertLess(first, second)
+
+    def test_rolled_back_numbers_are_reused(self):
+        allocator = BlockInvoiceNumberAllocator()
+        try:
+            with transaction.atomic():
+                number = allocator.allocate()[0]
+                raise CheckoutError('abandoned')
+        except CheckoutError:
+            pass
+        self.assertEqual(allocator.allocate(), [number])
+
+    def test_renumber_legacy_before_the_sequence_starts(self):
+        self.add_legacy_sales(3)
+        mapping = os.path.join(tempfile.mkdtemp(), 'invoices.csv')
+        call_command('renumber_invoices', mapping_file=mapping, batch_size=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(Sale.objects.order_by('id').values_list('invoice_number', flat=True)),
+                         [format_invoice_number(n) for n in (1, 2, 3)])
+        with open(mapping) as mapping_file:
+            self.assertEqual(len(mapping_file.readlines()), 3)
+        self.assertEqual(checkout(self.cashier, [(self.rice.pk, 1)]).invoice_number, format_invoice_number(4))
+
+    def test_renumber_refused_once_the_sequence_started(self):
+        checkout(self.cashier, [(self.rice.pk, 1)])
+        legacy = self.add_legacy_sales(1)[0]
+        with self.assertRaises(CommandError):
+            call_command('renumber_invoices', mapping_file=os.path.join(tempfile.mkdtemp(), 'invoices.csv'),
+                         stdout=open(os.devnull, 'w'))
+        self.assertTrue(Sale.objects.filter(invoice_number=legacy.invoice_number).exists())
+
+
+class ReservationTests(StoreTestCase):
+    def test_holds_limit_other_carts(self):
+        reserve(self.cashier, 'A', self.tea.pk, 4)
+        with self.assertRaises(ReservationError) as raised:
+            reserve(self.cashier, 'B', self.tea.pk, 2)
+        self.assertEqual(raised.exception.available, 1)
+        with self.assertRaises(CheckoutError):
+            checkout(self.cashier, [(self.tea.pk, 2)], cart_id='B')
+        checkout(self.cashier, [(self.tea.pk, 4)], cart_id='A')
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_holds_can_shrink_when_oversold(self):
+        reserve(self.cashier, 'A', self.tea.pk, 3)
+        reserve(self.cashier, 'B', self.tea.pk, 2)
+        Product.objects.filter(pk=self.tea.pk).update(stock_quantity=1)
+        reserve(self.cashier, 'A', self.tea.pk, 2)
+        reserve(self.cashier, 'A', self.tea.pk, 0)
+        with self.assertRaises(ReservationError):
+            reserve(self.cashier, 'B', self.tea.pk, 3)
+        self.assertEqual(list(StockReservation.objects.values_list('cart_id', 'quantity')), [('B', 2)])
+
+    def test_hold_released_after_deactivation(self):
+        reserve(self.cashier, 'A', self.tea.pk, 2)
+        Product.objects.filter(pk=self.tea.pk).update(is_active=False)
+        with self.assertRaises(Product.DoesNotExist):
+            reserve(self.cashier, 'A', self.tea.pk, 3)
+        reserve(self.cashier, 'A', self.tea.pk, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_holds_on_sharded_products(self):
+        set_shards(self.tea.pk, 2)
+        reserve(self.cashier, 'A', self.tea.pk, 4)
+        with self.assertRaises(ReservationError) as raised:
+            reserve(self.cashier, 'B', self.tea.pk, 2)
+        self.assertEqual(raised.exception.available, 1)
+
+
+class ReconcileTests(StoreTestCase):
+    def test_opening_stock_is_anchored(self):
+        checkout(self.cashier, [(self.rice.pk, 3)])
+        self.assertEqual(len(find_drift()), 0)
+
+    def test_fix_from_ledger_skips_unanchored_products(self):
+        StockMovement.objects.create(product=self.rice, movement_type='in', quantity=10, created_by=self.admin)
+        StockCheckpoint.objects.filter(product=self.tea).delete()
+        drift = find_drift()
+        self.assertEqual({row[0]: (row[4], row[7]) for row in drift.rows()},
+                         {self.tea.pk: (5, False), self.rice.pk: (-10, True)})
+        self.assertEqual(fix_drift(drift, 'ledger'), 1)
+        self.assertEqual((self.stock(self.tea), self.stock(self.rice)), (5, 110))
+
+    def test_fix_from_stock_records_adjustments(self):
+        StockCheckpoint.objects.all().delete()
+        self.assertEqual(fix_drift(find_drift(), 'stock', self.admin), 2)
+        self.assertEqual(len(find_drift()), 0)
+        self.assertEqual(self.stock(self.tea), 5)
+
+    def test_archived_movements_leave_a_checkpoint(self):
+        checkout(self.cashier, [(self.rice.pk, 3)])
+        month = month_start(timezone.localdate()) - timedelta(days=40)
+        moved = timezone.make_aware(datetime.combine(month, datetime.min.time())) + timedelta(days=2)
+        StockMovement.objects.update(created_at=moved)
+        archive_month(month_start(month), tempfile.mkdtemp(), 100)
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(StockCheckpoint.objects.get(product=self.rice).quantity, 97)
+        checkout(self.cashier, [(self.rice.pk, 2)])
+        self.assertEqual(len(find_drift()), 0)
+
+
+class ShardedStockTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        set_shards(self.rice.pk, 4)
+
+    def test_sale_refreshes_low_stock_flag(self):
+        checkout(self.cashier, [(self.rice.pk, 97)])
+        self.rice.refresh_from_db()
+        self.assertTrue(self.rice.is_low_stock)
+
+    def test_product_form_sets_shard_total(self):
+        checkout(self.cashier, [(self.rice.pk, 10)])
+        self.client.force_login(self.admin)
+        url = f'/products/{self.rice.pk}/edit/'
+        self.assertEqual(self.client.get(url).context['form'].initial['stock_quantity'], 90)
+        form = {'name': 'Rice', 'category': self.category.pk, 'price': '1.00', 'stock_quantity': 40,
+                'min_stock_level': 5, 'description': '', 'is_active': 'on'}
+        self.assertEqual(self.client.post(url, form).status_code, 302)
+        self.assertEqual(self.stock(self.rice), 40)
+        self.assertEqual(len(find_drift()), 0)
+
+
+@override_settings(DATA_VERSION_POLL_SECONDS=0)
+class CatalogSyncTests(StoreTestCase):
+    def test_sale_moves_etag(self):
+        self.client.force_login(self.cashier)
+        etag = self.client.get('/api/catalog/')['ETag']
+        self.assertEqual(self.client.get('/api/catalog/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.cashier, [(self.tea.pk, 1)])
+        self.assertEqual(self.client.get('/api/catalog/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sharded_sale_is_in_the_delta(self):
+        set_shards(self.rice.pk, 4)
+        self.client.force_login(self.cashier)
+        cursor = self.client.get('/api/catalog/').json()['cursor']
+        Product.objects.filter(pk=self.rice.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        checkout(self.cashier, [(self.rice.pk, 3)])
+        delta = self.client.get('/api/catalog/', {'since': cursor}).json()
+        self.assertFalse(delta['full'])
+        self.assertIn([self.rice.pk, 'Rice', None, '1.00', self.category.pk, 97], delta['products'])
+
+
+@override_settings(DATA_VERSION_POLL_SECONDS=0)
+class CacheInvalidationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        dashboard_cache.clear()
+        barcode_cache.clear()
+        self.tea.barcode = '4006381333931'
+        self.tea.save()
+
+    def scan(self):
+        self.client.force_login(self.cashier)
+        return self.client.get(f'/api/product/barcode/{self.tea.barcode}/').json()
+
+    def low_stock_panel(self):
+        self.client.force_login(self.admin)
+        return self.client.get('/').context['low_stock_items']
+
+    def test_product_save_refreshes_scans(self):
+        self.assertEqual(self.scan()['price'], '2.50')
+        self.tea.price = Decimal('3.00')
+        self.tea.save()
+        self.assertEqual(self.scan()['price'], '3.00')
+
+    def test_category_save_refreshes_dashboard(self):
+        self.assertEqual([item['category'] for item in self.low_stock_panel()], ['Groceries'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Pantry'
+            self.category.save()
+        self.assertEqual([item['category'] for item in self.low_stock_panel()], ['Pantry'])
+
+    def test_sharded_sale_refreshes_dashboard(self):
+        set_shards(self.rice.pk, 4)
+        self.assertEqual([item['name'] for item in self.low_stock_panel()], ['Tea'])
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.cashier, [(self.rice.pk, 97)])
+        panel = {item['name']: item['stock_quantity'] for item in self.low_stock_panel()}
+        self.assertEqual(panel, {'Rice': 3, 'Tea': 5})
+
+
+class SalesExportTests(StoreTestCase):
+    def add_sale(self, when, amount, **fields):
+        return Sale.objects.create(cashier=self.cashier, total_amount=amount, final_amount=amount,
+                                   payment_method='cash', created_at=timezone.make_aware(when), **fields)
+
+    def export(self, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get('/export-sales-csv/', params)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales_report.csv"')
+        return list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_csv_covers_whole_local_days(self):
+        self.cashier.first_name, self.cashier.last_name = 'Cal', 'Smith'
+        self.cashier.save()
+        self.add_sale(datetime(2026, 3, 1, 23, 59, 59), Decimal('1.00'))
+        first = self.add_sale(datetime(2026, 3, 2, 0, 0), Decimal('2.00'), customer_name='Ann')
+        last = self.add_sale(datetime(2026, 3, 3, 23, 59, 59), Decimal('3.50'), discount_amount=Decimal('0.50'))
+        self.add_sale(datetime(2026, 3, 4, 0, 0), Decimal('4.00'))
+
+        # The dates are local days; the Date column is written in UTC, as the export always has been
+        def utc(sale):
+            return sale.created_at.astimezone(dt_timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+        rows = self.export(start_date='2026-03-02', end_date='2026-03-03')
+        self.assertEqual(rows, [
+            SALE_EXPORT_HEADER,
+            [last.invoice_number, utc(last), 'Cal Smith', '', 'cash', '3.50', '0.50', '0.00', '3.50'],
+            [first.invoice_number, utc(first), 'Cal Smith', 'Ann', 'cash', '2.00', '0.00', '0.00', '2.00'],
+        ])
+        self.assertEqual(len(self.export()), 5)
+
+    def test_chunks_hold_whole_rows(self):
+        chunks = list(csv_chunks(['a', 'b'], ([i, i * 2] for i in range(5)), chunk_rows=2))
+        self.assertEqual(chunks, ['a,b\r\n0,0\r\n1,2\r\n', '2,4\r\n3,6\r\n', '4,8\r\n'])
+
+
+@override_settings(DATA_VERSION_POLL_SECONDS=0)
+class ReportJobTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        sales_filters._queries.clear()
+        reports_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(reports_dir.cleanup)
+        settings_override = override_settings(REPORTS_DIR=reports_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.cashier, [(self.tea.pk, 1)])
+
+    def request(self, **params):
+        return request_sales_pdf(self.admin, params)
+
+    def test_same_data_reuses_the_job(self):
+        job = self.request()
+        self.assertEqual(self.request().pk, job.pk)
+        self.assertNotEqual(self.request(payment_method='card').pk, job.pk)
+
+        self.assertTrue(run_job(job.pk))
+        self.assertFalse(run_job(job.pk))
+        self.assertEqual(ReportJob.objects.get(pk=job.pk).status, 'done')
+        self.assertEqual(self.request().pk, job.pk)
+
+        # A finished job whose file was cleared away is rendered again
+        os.remove(report_path(job))
+        self.assertNotEqual(self.request().pk, job.pk)
+
+    def test_new_sale_starts_a_new_job(self):
+        job = self.request()
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.cashier, [(self.rice.pk, 1)])
+        self.assertNotEqual(self.request().pk, job.pk)
+
+    def test_edited_sale_starts_a_new_job(self):
+        job = self.request()
+        sale = Sale.objects.get()
+        sale.customer_name = 'Ann'
+        sale.save()
+        self.assertNotEqual(self.request().pk, job.pk)
+
+
+class SalesSeriesTests(StoreTestCase):
+    def add_sale(self, when, amount):
+        Sale.objects.create(cashier=self.cashier, total_amount=amount, final_amount=amount, payment_method='cash',
+                            created_at=timezone.make_aware(when))
+
+    def series(self, start, end):
+        return analytics.sales_series(Sale.objects.all(), start, end, window=2)
+
+    def test_days_and_weeks_are_gap_filled(self):
+        # Sunday 1 March to Monday 9 March: parts of three Monday-based weeks
+        self.add_sale(datetime(2026, 2, 28, 23, 59), Decimal('9.00'))
+        self.add_sale(datetime(2026, 3, 1, 10, 0), Decimal('2.00'))
+        self.add_sale(datetime(2026, 3, 2, 9, 15), Decimal('3.00'))
+        self.add_sale(datetime(2026, 3, 4, 0, 0), Decimal('1.00'))
+        self.add_sale(datetime(2026, 3, 9, 23, 30), Decimal('4.00'))
+        self.add_sale(datetime(2026, 3, 10, 0, 0), Decimal('9.00'))
+
+        series = self.series(date(2026, 3, 1), date(2026, 3, 9))
+        daily = series['daily']
+        self.assertEqual(daily['labels'][0], '2026-03-01')
+        self.assertEqual(daily['labels'][-1], '2026-03-09')
+        self.assertEqual(daily['count'], [1, 1, 0, 1, 0, 0, 0, 0, 1])
+        self.assertEqual(daily['amount'], [2.0, 3.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 4.0])
+        self.assertEqual(daily['moving_average'], [2.0, 2.5, 1.5, 0.5, 0.5, 0.0, 0.0, 0.0, 2.0])
+        self.assertEqual(series['weekly'], {
+            'labels': ['2026-02-23', '2026-03-02', '2026-03-09'],
+            'count': [1, 2, 1],
+            'amount': [2.0, 4.0, 4.0],
+            'change_percent': [None, 100.0, 0.0],
+        })
+
+        hourly = series['hourly']
+        self.assertEqual(len(hourly['count']), 9 * 24)
+        self.assertEqual(hourly['count'][10], 1)
+        self.assertEqual(hourly['amount'][24 + 9], 3.0)
+        self.assertEqual(sum(hourly['count']), 4)
+
+    @override_settings(TIME_ZONE='Europe/London')
+    def test_days_across_clock_changes(self):
+        # Clocks go forward on 29 March and back on 25 October 2026
+        self.add_sale(datetime(2026, 3, 29, 0, 30), Decimal('1.00'))
+        self.add_sale(datetime(2026, 3, 29, 23, 30), Decimal('2.00'))
+        self.add_sale(datetime(2026, 3, 30, 0, 30), Decimal('3.00'))
+        spring = self.series(date(2026, 3, 28), date(2026, 3, 30))
+        self.assertEqual(len(spring['hourly']['count']), 24 + 23 + 24)
+        self.assertEqual(spring['daily']['amount'], [0.0, 3.0, 3.0])
+
+        self.add_sale(datetime(2026, 10, 25, 23, 30), Decimal('4.00'))
+        self.add_sale(datetime(2026, 10, 26, 0, 30), Decimal('5.00'))
+        autumn = self.series(date(2026, 10, 25), date(2026, 10, 26))
+        self.assertEqual(len(autumn['hourly']['count']), 25 + 24)
+        self.assertEqual(autumn['hourly']['count'][24], 1)
+        self.assertEqual(autumn['daily']['amount'], [4.0, 5.0])
+
+
+class ProductPerformanceTests(TestCase):
+    def report(self, revenues, days=10):
+        rows = [(product_id, f'Product {product_id}', 'Groceries', int(revenue), revenue)
+                for product_id, revenue in enumerate(revenues, start=1)]
+        return ProductPerformance(date(2026, 3, 1), date(2026, 3, days), rows)
+
+    def test_classes_start_at_the_share_limits(self):
+        # Running shares before each product: 0, 50, 80, 95, 99 and 100
+        report = self.report([30, 15, 50, 4, 1, 0])
+        self.assertEqual(report.abc.tolist(), ['A', 'B', 'A', 'C', 'C', 'C'])
+        self.assertEqual(report.rank.tolist(), [2, 3, 1, 4, 5, 6])
+        self.assertEqual(report.class_counts(), {'A': 2, 'B': 1, 'C': 3})
+
+        # Just under a limit, a product still starts in the class below it
+        self.assertEqual(self.report([79.9, 15, 5.1]).abc.tolist(), ['A', 'A', 'B'])
+
+    def test_rows_sort_and_filter_in_memory(self):
+        report = self.report([30, 15, 50, 4, 1, 0])
+        rows = report.rows()
+        self.assertEqual([row['id'] for row in rows], [3, 1, 2, 4, 5, 6])
+        self.assertEqual([row['cumulative_share'] for row in rows], [50.0, 80.0, 95.0, 99.0, 100.0, 100.0])
+        self.assertEqual(rows[0]['velocity'], 5.0)
+        self.assertEqual([row['id'] for row in report.rows(abc='C', sort='units', descending=False)], [6, 5, 4])
+        self.assertEqual([row['id'] for row in report.rows(search='product 1')], [1])
+
+    def test_no_sales_are_all_class_c(self):
+        self.assertEqual(self.report([0, 0]).abc.tolist(), ['C', 'C'])
+
+
+@override_settings(FORECAST_SMOOTHING=0.3, REORDER_LEAD_TIME_DAYS=3, REORDER_COVER_DAYS=14, REORDER_SERVICE_Z=1.65,
+                   FORECAST_HISTORY_DAYS=90)
+class ForecastTests(StoreTestCase):
+    def test_smooth(self):
+        level, deviation = smooth(np.array([[2.0] * 10, [0.0] * 9 + [10.0]]), 0.5)
+        np.testing.assert_allclose(level, [2.0, 5.0])
+        np.testing.assert_allclose(deviation, [0.0, np.sqrt(100 / 10)])
+
+        # The level starts from the first week's average (2) and moves half way to each day's demand
+        level, deviation = smooth(np.array([[1.0, 2.0, 3.0]]), 0.5)
+        np.testing.assert_allclose(level, [2.375])
+        np.testing.assert_allclose(deviation, [np.sqrt((1 + 0.25 + 1.5625) / 3)])
+
+    def test_reorder_levels(self):
+        reorder_point, quantity = reorder_levels(
+            np.array([4.0, 0.0, 2.5]), np.array([0.0, 0.0, 1.0]), np.array([100.0, 5.0, 0.0]),
+            lead_time=3, cover_days=14, z=1.65,
+        )
+        # 2.5 * 3 + 1.65 * 1 * sqrt(3) = 10.36 rounds up to 11, then 35 more days of cover
+        self.assertEqual(reorder_point.tolist(), [12, 0, 11])
+        self.assertEqual(quantity.tolist(), [0, 0, 46])
+
+    def test_update_writes_suggestions(self):
+        def noon(days_ago):
+            day = timezone.localdate() - timedelta(days=days_ago)
+            return timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=12)
+
+        # Today's sales are left out of the history
+        checkout(self.cashier, [(self.rice.pk, 1)])
+        for days_ago in range(1, 91):
+            sale = Sale.objects.create(cashier=self.cashier, total_amount=40, final_amount=40, payment_method='cash',
+                                       created_at=noon(days_ago))
+            SaleItem.objects.create(sale=sale, product=self.rice, quantity=40, unit_price=Decimal('1.00'))
+        # Wastage counts as demand; stock leaving through a sale is already counted from its line
+        for reference_type, quantity in (('waste', 6), ('sale', 50)):
+            StockMovement.objects.create(product=self.tea, movement_type='out', quantity=quantity,
+                                         reference_type=reference_type, created_by=self.admin)
+        StockMovement.objects.filter(product=self.tea).update(created_at=noon(1))
+        retired = Product.objects.create(name='Retired', category=self.category, price=Decimal('1.00'),
+                                         is_active=False)
+        ReorderSuggestion.objects.create(product=retired, daily_demand=1, demand_deviation=0, reorder_point=3,
+                                         reorder_quantity=10)
+
+        self.assertEqual(update_reorder_suggestions(workers=1), 2)
+        suggestions = {
+            row[0]: row[1:] for row in ReorderSuggestion.objects.values_list(
+                'product_id', 'daily_demand', 'demand_deviation', 'reorder_point', 'reorder_quantity')
+        }
+        # Rice: 40 a day, so 120 over the lead time and 560 more for cover, less the 99 in stock
+        self.assertEqual(suggestions[self.rice.pk], (40.0, 0.0, 120, 581))
+        # Tea: 6 wasted yesterday, smoothed to 0.3 * 6 after 89 quiet days
+        self.assertEqual(suggestions[self.tea.pk], (1.8, 0.632, 8, 29))
+        self.assertEqual(len(suggestions), 2)
+        # Rice is now under its forecast reorder point though above its fixed minimum
+        self.assertTrue(Product.objects.get(pk=self.rice.pk).is_low_stock)
+
+
+@override_settings(DATA_VERSION_POLL_SECONDS=0)
+class ProductSearchTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        # A fresh index per test: rolled back catalogs can repeat a version number
+        patcher = mock.patch('pos.search.product_index', ProductIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Product.objects.create(name='Green Tea', category=self.category, price=Decimal('3.00'), stock_quantity=5)
+        Product.objects.create(name='Teapot', category=self.category, price=Decimal('9.00'), stock_quantity=5)
+
+    def names(self, query, queryset=None, limit=None):
+        return [product.name for product in search_products(query, queryset, limit)]
+
+    def test_names_rank_by_similarity(self):
+        self.assertEqual(self.names('tea'), ['Tea', 'Green Tea', 'Teapot'])
+        self.assertEqual(self.names('tea', limit=2), ['Tea', 'Green Tea'])
+
+    def test_barcode_prefix_ranks_first(self):
+        Product.objects.create(name='Biscuits', barcode='400638', category=self.category, price=Decimal('1.20'))
+        Product.objects.create(name='Rice 400g', category=self.category, price=Decimal('0.80'))
+        self.assertEqual(self.names('400'), ['Biscuits', 'Rice 400g'])
+
+    def test_typos_match_similar_names(self):
+        self.assertEqual(self.names('green tee'), ['Green Tea'])
+
+    def test_inactive_products_are_excluded(self):
+        self.tea.is_active = False
+        self.tea.save()
+        active = Product.objects.filter(is_active=True)
+        self.assertEqual(self.names('tea', active), ['Green Tea', 'Teapot'])
+        # the best match is filtered out, so the search widens to fill the limit
+        self.assertEqual(self.names('tea', active, limit=1), ['Green Tea'])
+
+    @skipIf(connection.vendor == 'postgresql', 'Postgres searches the pg_trgm indexes')
+    def test_in_memory_index_follows_catalog_writes(self):
+        self.assertEqual(self.names('pot'), ['Teapot'])
+        Product.objects.create(name='Pot Noodle', category=self.category, price=Decimal('1.10'))
+        self.assertEqual(self.names('pot'), ['Pot Noodle', 'Teapot'])
+        Product.objects.filter(name='Teapot').delete()
+        self.assertEqual(self.names('pot'), ['Pot Noodle'])
+
+
+class FakeConnection:
+    """Enough of a psycopg2 connection for ConnectionPool"""
+
+    def __init__(self, alive=True, rollback_fails=False):
+        self.closed = 0
+        self.alive = alive
+        self.rollback_fails = rollback_fails
+        self.info = mock.Mock(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+        self.checks = 0
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.execute.side_effect = self.check
+        return cursor
+
+    def check(self, sql):
+        self.checks += 1
+        if not self.alive:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    def rollback(self):
+        if self.rollback_fails:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(TestCase):
+    def setUp(self):
+        self.made = []
+
+    def connect(self, **kwargs):
+        connection = FakeConnection(**kwargs)
+        self.made.append(connection)
+        return connection
+
+    def test_released_connection_is_reused(self):
+        pool = ConnectionPool(size=2, timeout=1, check_after=60)
+        first = pool.acquire(self.connect)
+        second = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        self.assertEqual(len(self.made), 2)
+        self.assertEqual(first.checks, 0)
+        pool.release(second)
+
+    def test_open_transaction_is_rolled_back(self):
+        pool = ConnectionPool(size=1, timeout=1, check_after=60)
+        connection = pool.acquire(self.connect)
+        connection.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+        pool.release(connection)
+        self.assertEqual(connection.info.transaction_status, extensions.TRANSACTION_STATUS_IDLE)
+        self.assertIs(pool.acquire(self.connect), connection)
+
+    def test_connection_that_cannot_roll_back_is_discarded(self):
+        pool = ConnectionPool(size=1, timeout=1, check_after=60)
+        connection = pool.acquire(lambda: self.connect(rollback_fails=True))
+        connection.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.acquire(self.connect), connection)
+
+    def test_idle_connection_is_checked_and_replaced_when_dead(self):
+        pool = ConnectionPool(size=1, timeout=1, check_after=30)
+        with mock.patch('pos.pooled_postgresql.base.time.monotonic', return_value=1000.0) as clock:
+            connection = pool.acquire(self.connect)
+            pool.release(connection)
+            clock.return_value = 1029.0
+            self.assertIs(pool.acquire(self.connect), connection)
+            self.assertEqual(connection.checks, 0)
+            pool.release(connection)
+
+            clock.return_value = 1060.0
+            self.assertIs(pool.acquire(self.connect), connection)
+            self.assertEqual(connection.checks, 1)
+            pool.release(connection)
+
+            connection.alive = False
+            clock.return_value = 1100.0
+            replacement = pool.acquire(self.connect)
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(len(self.made), 2)
+
+    def test_full_pool_times_out(self):
+        pool = ConnectionPool(size=1, timeout=0.05, check_after=60)
+        connection = pool.acquire(self.connect)
+        with self.assertRaises(OperationalError):
+            pool.acquire(self.connect)
+        pool.release(connection)
+        self.assertIs(pool.acquire(self.connect), connection)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(size=1, timeout=0.05, check_after=60)
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.acquire(mock.Mock(side_effect=psycopg2.OperationalError('could not connect')))
+        self.assertIsInstance(pool.acquire(self.connect), FakeConnection)
+
+
+class ProductTrieTests(TestCase):
+    def trie(self, memory_budget=10 ** 9):
+        return ProductTrie(top_k=3, memory_budget=memory_budget)
+
+    def test_remove_prunes_nodes(self):
+        trie = self.trie()
+        empty = (trie.nodes, trie.label_bytes)
+        for product_id, name in enumerate(['apple juice', 'apple pie', 'apricot']):
+            trie.add({'id': product_id, 'name': name, 'barcode': None})
+        for product_id in range(3):
+            trie.remove(product_id)
+        self.assertEqual((trie.nodes, trie.label_bytes), empty)
+        self.assertEqual(trie.root.edges, {})
+
+    def test_remove_merges_chains(self):
+        trie = self.trie()
+        trie.add({'id': 1, 'name': 'apple', 'barcode': None})
+        full = (trie.nodes, trie.label_bytes)
+        trie.add({'id': 2, 'name': 'apricot', 'barcode': None})
+        trie.remove(2)
+        self.assertEqual((trie.nodes, trie.label_bytes), full)
+        self.assertEqual([record['id'] for record in trie.suggest('app', 3)], [1])
+
+    def test_full_trie_keeps_edited_products(self):
+        trie = self.trie(memory_budget=2000)
+        self.assertTrue(trie.add({'id': 1, 'name': 'apple juice', 'barcode': None}))
+        self.assertFalse(trie.add({'id': 2, 'name': 'pie', 'barcode': None}))
+        self.assertTrue(trie.add({'id': 1, 'name': 'green apple juice', 'barcode': None}))
+        self.assertEqual([record['id'] for record in trie.suggest('green', 3)], [1])
@@ -23,6 +23,10 @@ urlpatterns = [
     path('sales-report/', views.sales_report_view, name='sales_report'),
     path('export-sales-csv/', views.export_sales_csv, name='export_sales_csv'),
     path('export-sales-pdf/', views.export_sales_pdf, name='export_sales_pdf'),
+    path('api/sales/analytics/', views.sales_analytics, name='sales_analytics'),
+    path('reports/<uuid:job_id>/', views.report_job_view, name='report_job'),
+    path('reports/<uuid:job_id>/download/', views.report_download_view, name='report_download'),
+    path('product-performance/', views.product_performance_view, name='product_performance'),
     path('sale/<int:sale_id>/', views.sale_detail_view, name='sale_detail'),
     path('sale/<int:sale_id>/edit/', views.sale_edit_view, name='sale_edit'),
     path('stock-management/', views.stock_management_view, name='stock_management'),
@@ -32,7 +36,12 @@ urlpatterns = [
     path('pos/', views.pos_interface_view, name='pos_interface'),
     path('complete-sale/', views.complete_sale, name='complete_sale'),
     path('api/product/<int:pk>/', views.get_product_details, name='get_product_details'),
+    path('api/catalog/', views.product_catalog, name='product_catalog'),
+    path('api/product/autocomplete/', views.product_autocomplete, name='product_autocomplete'),
+    path('api/product/barcode/<str:code>/', views.get_product_by_barcode, name='get_product_by_barcode'),
     path('api/process-sale/', views.process_sale, name='process_sale'),
+    path('api/process-sale/batch/', views.process_sale_batch, name='process_sale_batch'),
+    path('api/reservations/', views.reserve_stock, name='reserve_stock'),
     path('receipt/<int:sale_id>/', views.sale_receipt_view, name='sale_receipt'),
     path('my-sales/', views.my_sales_view, name='my_sales'),
 ]
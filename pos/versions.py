@@ -0,0 +1,67 @@
+import random
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import DataVersion
+
+CATALOG = 'catalog'
+CATALOG_PURGES = 'catalog_purges'
+# Stock levels of the catalog; moves on sales and stock-only saves, which leave CATALOG alone
+STOCK = 'stock'
+SALES = 'sales'
+# Anything the admin dashboard shows: sales (new ones included), products, stock movements
+DASHBOARD = 'dashboard'
+
+# Each counter is spread over this many DataVersion rows, so the bumps every
+# sale makes (STOCK, DASHBOARD) rarely wait on one another
+SHARDS = 16
+
+_seen = {}
+_lock = threading.Lock()
+
+
+def current(name):
+    """Return the version counter for name.
+
+    Each worker re-reads the counter at most every DATA_VERSION_POLL_SECONDS,
+    so version checks on hot paths are normally answered from memory.
+    """
+    now = time.monotonic()
+    with _lock:
+        seen = _seen.get(name)
+    if seen and now - seen[1] < settings.DATA_VERSION_POLL_SECONDS:
+        return seen[0]
+
+    version = DataVersion.objects.filter(name__in=shard_names(name)).aggregate(total=Sum('version'))['total'] or 0
+    with _lock:
+        _seen[name] = (version, now)
+    return version
+
+
+def shard_names(name):
+    """The DataVersion rows that add up to name's version (the bare name holds counts from before sharding)"""
+    return [name] + [f'{name}:{shard}' for shard in range(SHARDS)]
+
+
+def bump(name):
+    """Advance the version counter for name, invalidating caches keyed on it"""
+    row = f'{name}:{random.randrange(SHARDS)}'
+    if not DataVersion.objects.filter(name=row).update(version=F('version') + 1):
+        DataVersion.objects.get_or_create(name=row, defaults={'version': 1})
+    with _lock:
+        _seen.pop(name, None)
+
+
+def bump_on_commit(name):
+    """Bump name once the current transaction commits (straight away outside one).
+
+    Writes on hot paths use this so a DataVersion row is only locked by
+    its own short UPDATE after the commit, not for the rest of the
+    caller's transaction.
+    """
+    transaction.on_commit(partial(bump, name))
@@ -5,26 +5,36 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.http import JsonResponse
-from django.db.models import Q, Sum, Count, F
+from django.db import transaction
+from django.db.models import Q, Sum, Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.paginator import Paginator
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
-from django.http import HttpResponse
-import csv
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 
 from django.utils.dateparse import parse_date
-from django.views.decorators.http import require_POST
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import Paragraph
-from io import BytesIO
+from django.views.decorators.http import etag, require_POST
 import json
 
-from .models import Product, Category, Sale, SaleItem, StockMovement, UserProfile
-from .forms import CustomUserCreationForm, ProductForm, CategoryForm, StockAdjustmentForm, SaleFilterForm, SaleEditForm
+from . import analytics, rollups, stock_shards
+from .autocomplete import autocomplete
+from .catalog import catalog_changes, catalog_etag
+from .dashboard import dashboard_cache
+from .exports import SALE_EXPORT_HEADER, csv_chunks, sale_export_rows
+from .checkout import checkout, checkout_batch, parse_order, sale_summary, CheckoutError, MAX_BATCH_SALES
+from .idempotency import run_once, MAX_KEY_LENGTH
+from .pagination import KeysetPaginator
+from .performance import performance_cache
+from .product_cache import barcode_cache
+from .reports import job_status, report_path, request_sales_pdf
+from .sales_filters import created_on, sales_filter_params, sales_query
+from .reservations import reserve, ReservationError
+from .search import search_products
+from .models import Product, Category, ReportJob, Sale, SaleItem, StockMovement, UserProfile
+from .forms import (CustomUserCreationForm, ProductForm, CategoryForm, StockAdjustmentForm, SaleFilterForm, SaleEditForm,
+                    ProductPerformanceForm)
 
 
 def is_admin(user):
@@ -35,6 +45,25 @@ def is_cashier(user):
     return hasattr(user, 'userprofile') and user.userprofile.role == 'cashier'
 
 
+def page_query(request):
+    """The current query string without the page cursor, for building page links"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    return params.urlencode()
+
+
+def item_count():
+    """Lines per sale as a correlated subquery.
+
+    Unlike Count('items') it needs no GROUP BY over the sale, which
+    PostgreSQL refuses once the partitioned table's key is (id, created_at),
+    and a listing can be read in created_at index order up to the page size.
+    """
+    lines = SaleItem.objects.filter(sale=OuterRef('pk')).order_by().values('sale').annotate(count=Count('*'))
+    return Coalesce(Subquery(lines.values('count')), 0)
+
+
 def register_view(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
@@ -53,43 +82,13 @@ def dashboard_view(request):
     user_profile = request.user.userprofile
 
     if user_profile.role == 'admin':
-        # Admin Dashboard
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-
-        context = {
-            'total_products': Product.objects.filter(is_active=True).count(),
-            'low_stock_products': Product.objects.filter(is_active=True,
-                                                         stock_quantity__lte=F('min_stock_level')).count(),
-            'total_sales_today': Sale.objects.filter(created_at__date=today).aggregate(total=Sum('final_amount'))[
-                                     'total'] or 0,
-            'total_sales_week':
-                Sale.objects.filter(created_at__date__gte=week_ago).aggregate(total=Sum('final_amount'))['total'] or 0,
-            'recent_sales': Sale.objects.all()[:5],
-            'low_stock_items': Product.objects.filter(is_active=True, stock_quantity__lte=F('min_stock_level'))[
-                               :5],
-        }
-        return render(request, 'admin/dashboard.html', context)
+        # Admin Dashboard: figures are recomputed only after a sale, product or stock write
+        return render(request, 'admin/dashboard.html', dashboard_cache.get())
     else:
         # Cashier Dashboard - POS Interface
-        categories = Category.objects.filter(is_active=True)
-        products = Product.objects.filter(is_active=True, stock_quantity__gt=0)
-
-        # Handle search and filter
-        search_query = request.GET.get('search', '')
-        category_filter = request.GET.get('category', '')
-
-        if search_query:
-            products = products.filter(Q(name__icontains=search_query) | Q(barcode__icontains=search_query))
-
-        if category_filter:
-            products = products.filter(category_id=category_filter)
-
+        # Products are synced from the catalog API and rendered on the till
         context = {
-            'categories': categories,
-            'products': products,
-            'search_query': search_query,
-            'category_filter': category_filter,
+            'categories': Category.objects.filter(is_active=True),
         }
         return render(request, 'cashier/pos.html', context)
 
@@ -101,16 +100,16 @@ def product_list_view(request):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    products = Product.objects.all().order_by('-created_at')
+    products = Product.objects.select_related('category').order_by('-created_at')
     search_query = request.GET.get('search', '')
     category_filter = request.GET.get('category', '')
 
-    if search_query:
-        products = products.filter(Q(name__icontains=search_query) | Q(barcode__icontains=search_query))
-
     if category_filter:
         products = products.filter(category_id=category_filter)
 
+    if search_query:
+        products = search_products(search_query, products)
+
     paginator = Paginator(products, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -151,12 +150,26 @@ def product_edit_view(request, pk):
     product = get_object_or_404(Product, pk=pk)
 
     if request.method == 'POST':
-        form = ProductForm(request.POST, request.FILES, instance=product)
-        if form.is_valid():
-            form.save()
-            messages.success(request, 'Product updated successfully!')
-            return redirect('product_list')
+        with transaction.atomic():
+            # Sharded stock is folded first, so the form compares against (and saves) the real total
+            product = Product.objects.select_for_update().get(pk=product.pk)
+            stock_shards.fold(product)
+            form = ProductForm(request.POST, request.FILES, instance=product)
+            if form.is_valid():
+                product = form.save()
+                if 'stock_quantity' in form.changed_data:
+                    if product.stock_shards:
+                        stock_shards.spread(product, product.stock_shards)
+                    # Record the new count in the ledger, as the stock page does
+                    StockMovement.objects.create(
+                        product=product, movement_type='adjustment', quantity=product.stock_quantity,
+                        reference_type='product_edit', notes='Stock set on the product form',
+                        created_by=request.user,
+                    )
+                messages.success(request, 'Product updated successfully!')
+                return redirect('product_list')
     else:
+        product.stock_quantity = stock_shards.available_stock([product])[product.id]
         form = ProductForm(instance=product)
 
     return render(request, 'admin/product_form.html', {'form': form, 'title': 'Edit Product', 'product': product})
@@ -220,8 +233,8 @@ def sale_detail_view(request, sale_id):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    sale = get_object_or_404(Sale, id=sale_id)
-    sale_items = sale.items.all()
+    sale = get_object_or_404(Sale.objects.select_related('cashier'), id=sale_id)
+    sale_items = sale.items.select_related('product')
 
     context = {
         'sale': sale,
@@ -238,43 +251,84 @@ def sales_report_view(request):
         return redirect('dashboard')
 
     form = SaleFilterForm(request.GET)
-    sales = Sale.objects.all().order_by('-created_at')
-
-    if form.is_valid():
-        if form.cleaned_data['start_date']:
-            sales = sales.filter(created_at__date__gte=form.cleaned_data['start_date'])
-        if form.cleaned_data['end_date']:
-            sales = sales.filter(created_at__date__lte=form.cleaned_data['end_date'])
-        if form.cleaned_data['cashier']:
-            sales = sales.filter(cashier=form.cleaned_data['cashier'])
-        if form.cleaned_data['payment_method']:
-            sales = sales.filter(payment_method=form.cleaned_data['payment_method'])
-
-    # Summary statistics
-    total_sales = sales.aggregate(
-        total_amount=Sum('final_amount'),
-        total_count=Count('id')
-    )
+    params = sales_filter_params(form)
+    query = sales_query(params)
+    sales = query.sales().select_related('cashier').annotate(item_count=item_count())
+
+    # Summary statistics, from the daily rollup rather than the sales
+    summary = rollups.summarize(query.rollups())
+    total_sales = {
+        'total_amount': summary['net_amount'],
+        'total_count': summary['sale_count'],
+    }
 
-    paginator = Paginator(sales, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = KeysetPaginator(sales, 20).page(request.GET.get('cursor'))
+
+    # Daily trend over the filtered range (the last 30 days by default)
+    start, end = analytics.series_range(params)
+    chart_data = None
+    if start <= end and (end - start).days < analytics.MAX_RANGE_DAYS:
+        daily = analytics.sales_series(sales_query(params).sales(), start, end)['daily']
+        chart_data = {
+            'labels': json.dumps(daily['labels']),
+            'data': json.dumps(daily['amount']),
+            'average': json.dumps(daily['moving_average']),
+        }
 
     context = {
         'form': form,
         'page_obj': page_obj,
+        'page_query': page_query(request),
         'total_sales': total_sales,
+        'chart_data': chart_data,
     }
     return render(request, 'admin/sales_report.html', context)
 
 
+@login_required
+def product_performance_view(request):
+    if not is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+
+    form = ProductPerformanceForm(request.GET)
+    filters = form.cleaned_data if form.is_valid() else {}
+    params = {field: filters[field].isoformat() for field in ('start_date', 'end_date') if filters.get(field)}
+    start, end = analytics.series_range(params)
+    if end < start:
+        start, end = end, start
+
+    # Sorting and filtering work on the cached report, not the database
+    report = performance_cache.get(start, end)
+    rows = report.rows(
+        sort=filters.get('sort') or 'revenue',
+        descending=filters.get('order') != 'asc',
+        abc=filters.get('abc'),
+        category=filters['category'].name if filters.get('category') else None,
+        search=filters.get('search'),
+    )
+    paginator = Paginator(rows, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'form': form,
+        'page_obj': page_obj,
+        'page_query': page_query(request),
+        'start_date': start,
+        'end_date': end,
+        'total_revenue': report.total_revenue,
+        'class_counts': report.class_counts(),
+    }
+    return render(request, 'admin/product_performance.html', context)
+
+
 @login_required
 def sale_edit_view(request, sale_id):
     if not is_admin(request.user):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    sale = get_object_or_404(Sale, id=sale_id)
+    sale = get_object_or_404(Sale.objects.select_related('cashier'), id=sale_id)
 
     if request.method == 'POST':
         form = SaleEditForm(request.POST, instance=sale)
@@ -283,7 +337,7 @@ def sale_edit_view(request, sale_id):
 
             # Recalculate final amount
             sale.final_amount = sale.total_amount - sale.discount_amount + sale.tax_amount
-            sale.save()
+            rollups.save_edited_sale(sale)
 
             messages.success(request, 'Sale updated successfully!')
             return redirect('sale_detail', sale_id=sale.id)
@@ -293,7 +347,7 @@ def sale_edit_view(request, sale_id):
     context = {
         'form': form,
         'sale': sale,
-        'sale_items': sale.items.all(),
+        'sale_items': sale.items.select_related('product'),
     }
 
     return render(request, 'admin/sale_edit.html', context)
@@ -308,31 +362,36 @@ def stock_management_view(request):
     if request.method == 'POST':
         form = StockAdjustmentForm(request.POST)
         if form.is_valid():
-            stock_movement = form.save(commit=False)
-            stock_movement.created_by = request.user
-            stock_movement.save()
-
-            # Update product stock
-            product = stock_movement.product
-            if stock_movement.movement_type == 'in':
-                product.stock_quantity += stock_movement.quantity
-            elif stock_movement.movement_type == 'out':
-                product.stock_quantity -= stock_movement.quantity
-            else:  # adjustment
-                product.stock_quantity = stock_movement.quantity
+            with transaction.atomic():
+                stock_movement = form.save(commit=False)
+                stock_movement.created_by = request.user
+                stock_movement.save()
+
+                # Update product stock
+                product = Product.objects.select_for_update().get(pk=stock_movement.product_id)
+                stock_shards.fold(product)
+                if stock_movement.movement_type == 'in':
+                    product.stock_quantity += stock_movement.quantity
+                elif stock_movement.movement_type == 'out':
+                    product.stock_quantity -= stock_movement.quantity
+                else:  # adjustment
+                    product.stock_quantity = stock_movement.quantity
 
-            product.save()
+                product.save()
+                if product.stock_shards:
+                    stock_shards.spread(product, product.stock_shards)
             messages.success(request, 'Stock updated successfully!')
             return redirect('stock_management')
     else:
         form = StockAdjustmentForm()
 
     # Recent stock movements
-    movements = StockMovement.objects.all().order_by('-created_at')[:20]
+    movements = StockMovement.objects.select_related('product', 'created_by').order_by('-created_at')[:20]
+    # Under the fixed minimum or the forecast reorder point
     low_stock_products = Product.objects.filter(
+        is_low_stock=True,
         is_active=True,
-        stock_quantity__lte=F('min_stock_level')
-    )
+    ).select_related('category', 'reorder_suggestion')
 
     context = {
         'form': form,
@@ -348,7 +407,7 @@ def user_management_view(request):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    users = User.objects.filter(userprofile__isnull=False).order_by('-date_joined')
+    users = User.objects.filter(userprofile__isnull=False).select_related('userprofile').order_by('-date_joined')
     paginator = Paginator(users, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -385,97 +444,35 @@ def get_product_details(request, pk):
 
 
 @login_required
-def process_sale(request):
+def get_product_by_barcode(request, code):
     if not is_cashier(request.user):
         return JsonResponse({'error': 'Access denied'}, status=403)
 
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            items = data.get('items', [])
-            customer_name = data.get('customer_name', '')
-            customer_phone = data.get('customer_phone', '')
-            payment_method = data.get('payment_method', 'cash')
-            discount_amount = Decimal(str(data.get('discount_amount', 0)))
+    record = barcode_cache.lookup(code)
+    if record is None:
+        return JsonResponse({'error': 'Product not found'}, status=404)
+    return JsonResponse(record)
 
-            if not items:
-                return JsonResponse({'error': 'No items in cart'}, status=400)
 
-            # Calculate totals
-            total_amount = Decimal('0')
-            sale_items = []
-
-            for item in items:
-                product = Product.objects.get(id=item['product_id'], is_active=True)
-                quantity = int(item['quantity'])
-
-                if product.stock_quantity < quantity:
-                    return JsonResponse({'error': f'Insufficient stock for {product.name}'}, status=400)
-
-                unit_price = product.price
-                total_price = quantity * unit_price
-                total_amount += total_price
-
-                sale_items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'unit_price': unit_price,
-                    'total_price': total_price,
-                })
-
-            # Apply discount and calculate final amount
-            tax_amount = Decimal('0')  # You can implement tax calculation here
-            final_amount = total_amount - discount_amount + tax_amount
-
-            # Create sale
-            sale = Sale.objects.create(
-                cashier=request.user,
-                total_amount=total_amount,
-                discount_amount=discount_amount,
-                tax_amount=tax_amount,
-                final_amount=final_amount,
-                payment_method=payment_method,
-                customer_name=customer_name,
-                customer_phone=customer_phone,
-            )
+@login_required
+def product_autocomplete(request):
+    if not is_cashier(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
-            # Create sale items and update stock
-            for item_data in sale_items:
-                SaleItem.objects.create(
-                    sale=sale,
-                    product=item_data['product'],
-                    quantity=item_data['quantity'],
-                    unit_price=item_data['unit_price'],
-                    total_price=item_data['total_price'],
-                )
-
-                # Update stock
-                product = item_data['product']
-                product.stock_quantity -= item_data['quantity']
-                product.save()
+    try:
+        limit = int(request.GET.get('limit', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    return JsonResponse({'results': autocomplete.suggest(request.GET.get('q', ''), limit)})
 
-                # Create stock movement
-                StockMovement.objects.create(
-                    product=product,
-                    movement_type='out',
-                    quantity=item_data['quantity'],
-                    reference_type='sale',
-                    reference_id=sale.id,
-                    notes=f'Sale - Invoice #{sale.invoice_number}',
-                    created_by=request.user,
-                )
-
-            return JsonResponse({
-                'success': True,
-                'invoice_number': sale.invoice_number,
-                'final_amount': str(sale.final_amount),
-                'sale_id': sale.id,
-            })
 
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
+@login_required
+@etag(lambda request: catalog_etag())
+def product_catalog(request):
+    if not is_cashier(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
-    return JsonResponse({'error': 'Invalid request method'}, status=405)
+    return JsonResponse(catalog_changes(request.GET.get('since')))
 
 
 @login_required
@@ -496,7 +493,7 @@ def my_sales_view(request):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    sales = Sale.objects.filter(cashier=request.user).order_by('-created_at')
+    sales = Sale.objects.filter(cashier=request.user).annotate(item_count=item_count()).order_by('-created_at')
 
     # --- Search ---
     search_query = request.GET.get('search', '')
@@ -511,21 +508,15 @@ def my_sales_view(request):
     from_date = request.GET.get('from_date')
     to_date = request.GET.get('to_date')
 
-    if search_query:
-        sales = sales.filter(...)
-    if from_date:
-        sales = sales.filter(created_at__date__gte=parse_date(from_date))
-    if to_date:
-        sales = sales.filter(created_at__date__lte=parse_date(to_date))
+    sales = sales.filter(created_on(parse_date(from_date or ''), parse_date(to_date or '')))
 
 
     # --- Pagination ---
-    paginator = Paginator(sales, 10)  # 10 per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = KeysetPaginator(sales, 10).page(request.GET.get('cursor'))  # 10 per page
 
     return render(request, 'cashier/my_sales.html', {
         'page_obj': page_obj,
+        'page_query': page_query(request),
         'search_query': search_query,
         'from_date': from_date,
         'to_date': to_date,
@@ -539,146 +530,66 @@ def export_sales_csv(request):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    # Create the HttpResponse object with CSV header
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(['Invoice #', 'Date', 'Cashier', 'Customer', 'Payment Method',
-                     'Total Amount', 'Discount', 'Tax', 'Final Amount'])
-
-    # Get filtered sales based on the same filters as in sales_report_view
-    sales = Sale.objects.all().order_by('-created_at')
-    form = SaleFilterForm(request.GET)
-
-    if form.is_valid():
-        if form.cleaned_data['start_date']:
-            sales = sales.filter(created_at__date__gte=form.cleaned_data['start_date'])
-        if form.cleaned_data['end_date']:
-            sales = sales.filter(created_at__date__lte=form.cleaned_data['end_date'])
-        if form.cleaned_data['cashier']:
-            sales = sales.filter(cashier=form.cleaned_data['cashier'])
-        if form.cleaned_data['payment_method']:
-            sales = sales.filter(payment_method=form.cleaned_data['payment_method'])
-
-    for sale in sales:
-        writer.writerow([
-            sale.invoice_number,
-            sale.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            sale.cashier.get_full_name() or sale.cashier.username,
-            sale.customer_name,
-            sale.payment_method,
-            sale.total_amount,
-            sale.discount_amount,
-            sale.tax_amount,
-            sale.final_amount,
-        ])
+    # The same filters as in sales_report_view
+    sales = sales_query(sales_filter_params(SaleFilterForm(request.GET))).sales()
 
+    # Stream the file so rows go out as they are read instead of piling up in memory
+    response = StreamingHttpResponse(
+        csv_chunks(SALE_EXPORT_HEADER, sale_export_rows(sales)), content_type='text/csv'
+    )
+    response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
     return response
 
 
 @login_required
 def export_sales_pdf(request):
     if not is_admin(request.user):
-        messages.error(request, 'Access denied.')
-        return redirect('dashboard')
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
-    # Create a file-like buffer to receive PDF data
-    buffer = BytesIO()
+    # Rendered in the background; the same filters over unchanged data reuse the finished file
+    job = request_sales_pdf(request.user, sales_filter_params(SaleFilterForm(request.GET)))
+    return JsonResponse(job_status(job), status=202)
 
-    # Create the PDF object, using the buffer as its "file."
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(letter))
 
-    # Container for the 'Flowable' objects
-    elements = []
+@login_required
+def sales_analytics(request):
+    if not is_admin(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
-    styles = getSampleStyleSheet()
-    title_style = styles['Heading1']
+    form = SaleFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'error': form.errors}, status=400)
+    params = sales_filter_params(form)
+    start, end = analytics.series_range(params)
+    if end < start:
+        return JsonResponse({'error': 'start_date is after end_date'}, status=400)
+    if (end - start).days >= analytics.MAX_RANGE_DAYS:
+        return JsonResponse({'error': f'Ranges are limited to {analytics.MAX_RANGE_DAYS} days'}, status=400)
 
-    # Add title
-    elements.append(Paragraph("Sales Report", title_style))
-    elements.append(Paragraph("<br/><br/>", styles['Normal']))
+    return JsonResponse(analytics.sales_series(sales_query(params).sales(), start, end))
 
-    # Get filtered sales based on the same filters as in sales_report_view
-    sales = Sale.objects.all().order_by('-created_at')
-    form = SaleFilterForm(request.GET)
 
-    if form.is_valid():
-        if form.cleaned_data['start_date']:
-            sales = sales.filter(created_at__date__gte=form.cleaned_data['start_date'])
-        if form.cleaned_data['end_date']:
-            sales = sales.filter(created_at__date__lte=form.cleaned_data['end_date'])
-        if form.cleaned_data['cashier']:
-            sales = sales.filter(cashier=form.cleaned_data['cashier'])
-        if form.cleaned_data['payment_method']:
-            sales = sales.filter(payment_method=form.cleaned_data['payment_method'])
+@login_required
+def report_job_view(request, job_id):
+    if not is_admin(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
-    # Table data
-    data = [['Invoice #', 'Date', 'Cashier', 'Customer', 'Payment Method',
-             'Total Amount', 'Discount', 'Tax', 'Final Amount']]
+    job = get_object_or_404(ReportJob, pk=job_id)
+    return JsonResponse(job_status(job))
 
-    for sale in sales:
-        data.append([
-            sale.invoice_number,
-            sale.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            sale.cashier.get_full_name() or sale.cashier.username,
-            sale.customer_name,
-            sale.payment_method,
-            f"{sale.total_amount:.2f}",
-            f"{sale.discount_amount:.2f}",
-            f"{sale.tax_amount:.2f}",
-            f"{sale.final_amount:.2f}",
-        ])
-
-    # Calculate totals
-    totals = sales.aggregate(
-        total=Sum('total_amount'),
-        discount=Sum('discount_amount'),
-        tax=Sum('tax_amount'),
-        final=Sum('final_amount')
-    )
 
-    # Add totals row
-    data.append([
-        'TOTAL', '', '', '', '',
-        f"{totals['total'] or 0:.2f}",
-        f"{totals['discount'] or 0:.2f}",
-        f"{totals['tax'] or 0:.2f}",
-        f"{totals['final'] or 0:.2f}",
-    ])
-
-    # Create the table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BOX', (0, 0), (-1, -1), 2, colors.black),
-    ]))
-
-    elements.append(table)
-
-    # Build the PDF
-    doc.build(elements)
-
-    # Get the value of the BytesIO buffer and write it to the response
-    pdf = buffer.getvalue()
-    buffer.close()
-
-    # Create the HTTP response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="sales_report.pdf"'
-    response.write(pdf)
+@login_required
+def report_download_view(request, job_id):
+    if not is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
 
-    return response
+    job = get_object_or_404(ReportJob, pk=job_id, status='done')
+    path = report_path(job)
+    if not path.exists():
+        raise Http404('Report file is no longer available')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename='sales_report.pdf',
+                        content_type='application/pdf')
 
 
 @login_required
@@ -789,89 +700,24 @@ def process_sale(request):
         try:
             data = json.loads(request.body)
             items = data.get('cart', [])
-            customer_name = data.get('customer_name', '')
-            customer_phone = data.get('customer_phone', '')
-            payment_method = data.get('payment_method', 'cash')
-            discount_amount = Decimal(str(data.get('discount_amount', 0)))
 
             if not items:
                 return JsonResponse({'error': 'No items in cart'}, status=400)
 
-            # Calculate totals
-            total_amount = Decimal('0')
-            sale_items = []
-
-            for item in items:
-                # use correct keys from JS
-                product = Product.objects.get(id=item['id'], is_active=True)
-                quantity = int(item['qty'])
-
-                if product.stock_quantity < quantity:
-                    return JsonResponse({'error': f'Insufficient stock for {product.name}'}, status=400)
-
-                unit_price = product.price
-                total_price = quantity * unit_price
-                total_amount += total_price
-
-                sale_items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'unit_price': unit_price,
-                    'total_price': total_price,
-                })
-
-            # Apply discount and calculate final amount
-            tax_rate = Decimal('0.10')  # 10% tax (example)
-            tax_amount = (total_amount - discount_amount) * tax_rate
-            final_amount = total_amount - discount_amount + tax_amount
-
-            # Create sale
-            sale = Sale.objects.create(
-                cashier=request.user,
-                total_amount=total_amount,
-                discount_amount=discount_amount,
-                tax_amount=tax_amount,
-                final_amount=final_amount,
-                payment_method=payment_method,
-                customer_name=customer_name,
-                customer_phone=customer_phone,
-                notes=data.get('notes', ''),
-            )
+            idempotency_key = request.headers.get('Idempotency-Key', '')
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                return JsonResponse({'error': 'Idempotency-Key is too long'}, status=400)
 
-            # Create sale items and update stock
-            for item_data in sale_items:
-                SaleItem.objects.create(
-                    sale=sale,
-                    product=item_data['product'],
-                    quantity=item_data['quantity'],
-                    unit_price=item_data['unit_price'],
-                    total_price=item_data['total_price'],
-                )
-
-                # Update stock
-                product = item_data['product']
-                product.stock_quantity -= item_data['quantity']
-                product.save()
+            lines, fields = parse_order(data)
+
+            def record_sale():
+                return sale_summary(checkout(request.user, lines, **fields))
 
-                # Create stock movement
-                StockMovement.objects.create(
-                    product=product,
-                    movement_type='out',
-                    quantity=item_data['quantity'],
-                    reference_type='sale',
-                    reference_id=sale.id,
-                    notes=f'Sale - Invoice #{sale.invoice_number}',
-                    created_by=request.user,
-                )
-
-            return JsonResponse({
-                'success': True,
-                'invoice_number': sale.invoice_number,
-                'tax_amount': str(sale.tax_amount), 
-                'final_amount': str(sale.final_amount),
-                'sale_id': sale.id,
-            })
+            # A retried request with the same key gets the original response back
+            return JsonResponse(run_once(request.user, idempotency_key, record_sale))
 
+        except CheckoutError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
@@ -879,10 +725,80 @@ def process_sale(request):
 
 
 
+@login_required
+@require_POST
+def process_sale_batch(request):
+    """Ingest sales queued by a till while it was offline"""
+    if not is_cashier(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        sales = json.loads(request.body).get('sales', [])
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    if not isinstance(sales, list) or not all(isinstance(sale, dict) for sale in sales):
+        return JsonResponse({'error': 'sales must be a list of sale objects'}, status=400)
+    if len(sales) > MAX_BATCH_SALES:
+        return JsonResponse({'error': f'At most {MAX_BATCH_SALES} sales per request'}, status=400)
+    for sale in sales:
+        key = sale.get('request_key', '')
+        if not isinstance(key, str) or len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'error': f'request_key must be a string of at most {MAX_KEY_LENGTH} characters'},
+                                status=400)
+
+    try:
+        results = checkout_batch(request.user, sales)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+    return JsonResponse({
+        'results': results,
+        'accepted': sum(1 for result in results if result['success']),
+        'rejected': sum(1 for result in results if not result['success']),
+    })
+
+
+
+@login_required
+@require_POST
+def reserve_stock(request):
+    """Hold stock for an item while it sits in a till's cart"""
+    if not is_cashier(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        cart_id = str(data['cart_id'])
+        product_id = int(data['product_id'])
+        quantity = int(data['quantity'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'cart_id, product_id and quantity are required'}, status=400)
+
+    if not cart_id or len(cart_id) > 64 or quantity < 0:
+        return JsonResponse({'error': 'Invalid cart_id or quantity'}, status=400)
+
+    try:
+        available, expires_at = reserve(request.user, cart_id, product_id, quantity)
+    except Product.DoesNotExist:
+        return JsonResponse({'error': 'Product not found'}, status=404)
+    except ReservationError as e:
+        return JsonResponse({'error': str(e), 'available': e.available}, status=409)
+
+    return JsonResponse({
+        'success': True,
+        'product_id': product_id,
+        'reserved': quantity,
+        'available': available,
+        'expires_at': expires_at.isoformat(),
+    })
+
+
+
 @login_required
 def sale_receipt_view(request, sale_id):
-    sale = get_object_or_404(Sale, id=sale_id)
-    items = sale.items.all()
+    sale = get_object_or_404(Sale.objects.select_related('cashier'), id=sale_id)
+    items = list(sale.items.select_related('product'))
 
     # Compute totals
     subtotal = sum(item.unit_price * item.quantity for item in items)
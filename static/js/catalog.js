@@ -0,0 +1,109 @@
+// static/js/catalog.js
+// Keeps the product catalog on the till in IndexedDB. The first sync
+// downloads a snapshot; later syncs only fetch what changed since the
+// cursor the server handed back, and a matching ETag costs a 304.
+(function () {
+    const DB_NAME = "mini-store-pos-catalog";
+    const PRODUCTS = "products";
+    const META = "meta";
+    const SYNC_INTERVAL_MS = 60000;
+
+    let dbPromise = null;
+    let products = new Map();
+    let meta = {};
+    let syncing = false;
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, 1);
+                request.onupgradeneeded = () => {
+                    request.result.createObjectStore(PRODUCTS, { keyPath: "id" });
+                    request.result.createObjectStore(META);
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    function transact(mode, work) {
+        return openDb().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction([PRODUCTS, META], mode);
+            const result = work(tx.objectStore(PRODUCTS), tx.objectStore(META));
+            tx.oncomplete = () => resolve(result && result.result !== undefined ? result.result : result);
+            tx.onerror = () => reject(tx.error);
+        }));
+    }
+
+    function notify(full) {
+        document.dispatchEvent(new CustomEvent("catalog-changed", { detail: { full, size: products.size } }));
+    }
+
+    // Load whatever the till already has, so it can sell before the first sync
+    function load() {
+        return Promise.all([
+            transact("readonly", store => store.getAll()),
+            transact("readonly", (_, metaStore) => metaStore.get("sync")),
+        ]).then(([rows, saved]) => {
+            products = new Map(rows.map(p => [p.id, p]));
+            meta = saved || {};
+            notify(true);
+        });
+    }
+
+    function apply(data, etag) {
+        const rows = data.products.map(row => {
+            const product = {};
+            data.fields.forEach((field, i) => { product[field] = row[i]; });
+            return product;
+        });
+
+        if (data.full) products.clear();
+        rows.forEach(p => products.set(p.id, p));
+        data.removed.forEach(id => products.delete(id));
+        meta = { cursor: data.cursor, version: data.version, etag };
+
+        return transact("readwrite", (store, metaStore) => {
+            if (data.full) store.clear();
+            rows.forEach(p => store.put(p));
+            data.removed.forEach(id => store.delete(id));
+            metaStore.put(meta, "sync");
+        }).then(() => notify(data.full));
+    }
+
+    function sync(url) {
+        if (syncing || !navigator.onLine) return Promise.resolve();
+        syncing = true;
+
+        const headers = {};
+        if (meta.etag) headers["If-None-Match"] = meta.etag;
+        const target = meta.cursor ? `${url}?since=${encodeURIComponent(meta.cursor)}` : url;
+
+        return fetch(target, { headers })
+            .then(res => {
+                if (res.status === 304) return null;
+                if (!res.ok) throw new Error("Catalog sync failed with status " + res.status);
+                return res.json().then(data => apply(data, res.headers.get("ETag")));
+            })
+            .catch(err => console.error("Catalog sync error:", err))
+            .finally(() => { syncing = false; });
+    }
+
+    function start(url) {
+        window.addEventListener("online", () => sync(url));
+        setInterval(() => sync(url), SYNC_INTERVAL_MS);
+        return load().catch(err => console.error("Catalog load error:", err)).then(() => sync(url));
+    }
+
+    function all() {
+        return Array.from(products.values());
+    }
+
+    function get(id) {
+        return products.get(id);
+    }
+
+    window.Catalog = { load, sync, start, all, get };
+})();
@@ -0,0 +1,161 @@
+// static/js/offline_sales.js
+// Keeps completed carts in IndexedDB while the backend is unreachable and
+// syncs them in bulk to the batch endpoint once it answers again. Sales the
+// server rejects (e.g. not enough stock left) move to a failed store, since
+// the goods have already left the shop; they stay there until someone
+// retries or dismisses them.
+(function () {
+    const DB_NAME = "mini-store-pos";
+    const STORE = "queued_sales";
+    const FAILED_STORE = "failed_sales";
+    const SYNC_BATCH_SIZE = 200;
+    const SYNC_INTERVAL_MS = 30000;
+
+    let dbPromise = null;
+    let syncing = false;
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, 2);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    [STORE, FAILED_STORE].forEach(name => {
+                        if (!db.objectStoreNames.contains(name)) {
+                            db.createObjectStore(name, { keyPath: "request_key" });
+                        }
+                    });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    // Run work against the named stores in one transaction; resolves once it commits
+    function withStores(names, mode, work) {
+        return openDb().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction(names, mode);
+            const result = work(...names.map(name => tx.objectStore(name)));
+            tx.oncomplete = () => resolve(result && result.result !== undefined ? result.result : result);
+            tx.onerror = () => reject(tx.error);
+        }));
+    }
+
+    function withStore(mode, work, name = STORE) {
+        return withStores([name], mode, work);
+    }
+
+    function queue(sale) {
+        sale.queued_at = new Date().toISOString();
+        return withStore("readwrite", store => store.put(sale)).then(notify);
+    }
+
+    function pending() {
+        return withStore("readonly", store => store.getAll());
+    }
+
+    function count() {
+        return withStore("readonly", store => store.count());
+    }
+
+    function failed() {
+        return withStore("readonly", store => store.getAll(), FAILED_STORE);
+    }
+
+    // Take the server's answers off the queue: accepted sales are done, rejected ones are kept as failed
+    function settle(batch, results) {
+        const sales = new Map(batch.map(sale => [sale.request_key, sale]));
+        return withStores([STORE, FAILED_STORE], "readwrite", (queued, failedStore) => {
+            results.forEach(r => {
+                const sale = sales.get(r.request_key);
+                if (!sale) return;
+                if (!r.success) {
+                    failedStore.put(Object.assign({}, sale, { error: r.error, failed_at: new Date().toISOString() }));
+                }
+                queued.delete(r.request_key);
+            });
+        });
+    }
+
+    // Put failed sales back in the queue, e.g. once stock has been corrected
+    function retry(keys) {
+        return withStores([STORE, FAILED_STORE], "readwrite", (queued, failedStore) => {
+            keys.forEach(key => {
+                const request = failedStore.get(key);
+                request.onsuccess = () => {
+                    const sale = request.result;
+                    if (!sale) return;
+                    delete sale.error;
+                    delete sale.failed_at;
+                    queued.put(sale);
+                    failedStore.delete(key);
+                };
+            });
+        }).then(notify);
+    }
+
+    // Drop failed sales that have been resolved by hand
+    function dismiss(keys) {
+        return withStore("readwrite", store => keys.forEach(key => store.delete(key)), FAILED_STORE).then(notify);
+    }
+
+    function notify() {
+        return Promise.all([count(), withStore("readonly", store => store.count(), FAILED_STORE)])
+            .then(([pendingCount, failedCount]) => {
+                document.dispatchEvent(new CustomEvent("offline-sales-changed", {
+                    detail: { pending: pendingCount, failed: failedCount },
+                }));
+                return pendingCount;
+            });
+    }
+
+    // Send queued sales in batches; every sale the server answered for leaves the queue,
+    // the rejected ones for the failed store
+    function sync(url, csrfToken) {
+        if (syncing || !navigator.onLine) return Promise.resolve();
+        syncing = true;
+
+        return pending()
+            .then(sales => {
+                let chain = Promise.resolve();
+                for (let i = 0; i < sales.length; i += SYNC_BATCH_SIZE) {
+                    const batch = sales.slice(i, i + SYNC_BATCH_SIZE);
+                    chain = chain.then(() => fetch(url, {
+                        method: "POST",
+                        headers: {
+                            "Content-Type": "application/json",
+                            "X-CSRFToken": csrfToken,
+                        },
+                        body: JSON.stringify({ sales: batch }),
+                    }))
+                    .then(res => {
+                        if (!res.ok) throw new Error("Batch sync failed with status " + res.status);
+                        return res.json();
+                    })
+                    .then(data => {
+                        const rejected = data.results.filter(r => !r.success);
+                        rejected.forEach(r => console.warn("Queued sale rejected:", r.request_key, r.error));
+                        if (rejected.length) {
+                            alert(rejected.length + " offline sale(s) could not be recorded and were kept " +
+                                  "on this till for follow-up:\n" + rejected.map(r => r.error).join("\n"));
+                        }
+                        return settle(batch, data.results);
+                    });
+                }
+                return chain;
+            })
+            .catch(err => console.error("Offline sync error:", err))
+            .then(notify)
+            .finally(() => { syncing = false; });
+    }
+
+    function start(url, csrfToken) {
+        window.addEventListener("online", () => sync(url, csrfToken));
+        setInterval(() => sync(url, csrfToken), SYNC_INTERVAL_MS);
+        return sync(url, csrfToken);
+    }
+
+    window.OfflineSales = { queue, pending, count, failed, retry, dismiss, sync, start };
+})();